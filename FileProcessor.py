@@ -4,13 +4,14 @@
 # copyright Tom Goetz
 #
 
-import logging, sys, os, re, datetime
+import logging, sys, os, re, datetime, zipfile, gzip
 
 
 logger = logging.getLogger(__file__)
 
 
 class FileProcessor():
+    compressed_extension = '.gz'
 
     @classmethod
     def regex_matches_file(cls, file, file_regex):
@@ -23,6 +24,17 @@ class FileProcessor():
             return [input_file]
         return []
 
+    @classmethod
+    def open_file(cls, file_name, mode='rb'):
+        # files with the compressed extension are transparently gzip'ed
+        if file_name.endswith(cls.compressed_extension):
+            return gzip.open(file_name, mode)
+        return open(file_name, mode)
+
+    @classmethod
+    def file_exists(cls, file_name):
+        return os.path.isfile(file_name) or os.path.isfile(file_name + cls.compressed_extension)
+
     @classmethod
     def file_newer_than(cls, file, timestamp):
         return datetime.datetime.fromtimestamp(os.stat(file).st_ctime) > timestamp
@@ -39,3 +51,37 @@ class FileProcessor():
             elif cls.regex_matches_file(file, file_regex) and (not latest or cls.file_newer_than(file_with_path, timestamp)):
                 file_names.append(file_with_path)
         return file_names
+
+    #
+    # Files kept in a zip archive are named by the archive's path followed by the file's path in the archive.
+    #
+    @classmethod
+    def split_archive_path(cls, file_name):
+        match = re.search(r'^(.*\.zip)/(.+)$', file_name)
+        if match:
+            return (match.group(1), match.group(2))
+
+    @classmethod
+    def archive_to_files(cls, archive_name, file_regex, newer_than=None):
+        # with newer_than, only the files added to the archive after that time are returned
+        with zipfile.ZipFile(archive_name) as archive:
+            return [archive_name + "/" + info.filename for info in archive.infolist()
+                if cls.regex_matches_file(info.filename, file_regex) and (newer_than is None or datetime.datetime(*info.date_time) > newer_than)]
+
+    @classmethod
+    def archived_time(cls, file_name):
+        # returns when an archived file was added to its archive
+        (archive_name, member_name) = cls.split_archive_path(file_name)
+        with zipfile.ZipFile(archive_name) as archive:
+            return datetime.datetime(*archive.getinfo(member_name).date_time)
+
+    @classmethod
+    def extract_archived_file(cls, file_name, outdir):
+        # extracts an archived file to outdir with the same base name and returns the path of the extracted file
+        (archive_name, member_name) = cls.split_archive_path(file_name)
+        with zipfile.ZipFile(archive_name) as archive:
+            data = archive.read(member_name)
+        local_file_name = outdir + "/" + os.path.basename(member_name)
+        with open(local_file_name, 'wb') as file:
+            file.write(data)
+        return local_file_name
@@ -54,7 +54,7 @@ class FitFileProcessor():
 
     def write_file(self, fit_file):
         self.lap = 1
-        self.record = 1
+        self.records_writer = None
         self.serial_number = None
         self.manufacturer = None
         self.product = None
@@ -62,6 +62,9 @@ class FitFileProcessor():
             with self.garmin_mon_db.managed_session() as self.garmin_mon_db_session:
                 with self.garmin_act_db.managed_session() as self.garmin_act_db_session:
                     self.write_message_types(fit_file, fit_file.message_types())
+                    if self.records_writer is not None:
+                        self.records_writer.flush()
+                        GarminDB.ActivityBounds._update(self.garmin_act_db_session, self.records_writer.activity_id)
                     # Now write a file's worth of data to the DB
                     self.garmin_act_db_session.commit()
                 self.garmin_mon_db_session.commit()
@@ -308,8 +311,6 @@ class FitFileProcessor():
         message_dict = record_message.to_dict()
         logger.debug("record message: %s", repr(message_dict))
         record = {
-            'activity_id'                       : GarminDB.File.id_from_path(fit_file.filename),
-            'record'                            : self.record,
             'timestamp'                         : self.get_field_value(message_dict, 'timestamp'),
             'position_lat'                      : self.get_field_value(message_dict, 'position_lat'),
             'position_long'                     : self.get_field_value(message_dict, 'position_long'),
@@ -320,8 +321,10 @@ class FitFileProcessor():
             'speed'                             : self.get_field_value(message_dict, 'speed'),
             'temperature'                       : self.get_field_value(message_dict, 'temperature'),
         }
-        GarminDB.ActivityRecords._create_or_update_not_none(self.garmin_act_db_session, record)
-        self.record += 1
+        if self.records_writer is None:
+            self.records_writer = GarminDB.ActivityRecordsWriter(self.garmin_act_db_session, GarminDB.File.id_from_path(fit_file.filename),
+                self.garmin_act_db.compact_records)
+        self.records_writer.write(record)
 
     def write_dev_data_id_entry(self, fit_file, dev_data_id_message):
         logger.debug("dev_data_id message: %s", repr(dev_data_id_message.to_dict()))
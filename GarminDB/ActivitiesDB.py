@@ -4,6 +4,10 @@
 # copyright Tom Goetz
 #
 
+import zlib, struct, math
+
+from sqlalchemy import event
+
 from HealthDB import *
 from ExtraData import *
 
@@ -23,22 +27,37 @@ class ActivitiesDB(DB):
     def __init__(self, db_params_dict, debug=False):
         logger.info("ActivitiesDB: %s debug: %s ", repr(db_params_dict), str(debug))
         super(ActivitiesDB, self).__init__(db_params_dict, debug)
+        self.materialized_views = db_params_dict.get('materialized_views', False)
+        self.compact_records = db_params_dict.get('compact_records', False)
+        if db_params_dict['db_type'] == 'sqlite':
+            event.listen(self.engine, 'connect', ActivityTracks.register_sql_functions)
         ActivitiesDB.Base.metadata.create_all(self.engine)
         version = ActivitiesDB.DbVersion()
         version.version_check(self, self.db_version)
         #
         db_view_version = version.version_check_key(self, 'view_version', self.view_version)
-        if db_view_version != self.view_version:
-            RunActivities.delete_view(self)
-            WalkActivities.delete_view(self)
-            PaddleActivities.delete_view(self)
-            EllipticalActivities.delete_view(self)
+        # DBs created before materialized views were supported have plain views.
+        db_materialized_views = version.version_check_key(self, 'materialized_views', 0)
+        if db_view_version != self.view_version or db_materialized_views != int(self.materialized_views):
+            for sport_activities in self.sport_activities_tables():
+                sport_activities.delete_view(self, db_materialized_views)
             version.update_version(self, 'view_version', self.view_version)
-        RunActivities.create_view(self)
-        WalkActivities.create_view(self)
-        PaddleActivities.create_view(self)
-        CycleActivities.create_view(self)
-        EllipticalActivities.create_view(self)
+            version.update_version(self, 'materialized_views', int(self.materialized_views))
+        for sport_activities in self.sport_activities_tables():
+            sport_activities.create_view(self)
+        if self.compact_records and db_params_dict['db_type'] == 'sqlite':
+            ActivityTracks.create_records_view(self)
+        if db_params_dict['db_type'] == 'sqlite' and ActivityBounds.create_table(self):
+            # index the activities imported before the index existed
+            ActivityBounds.update_all(self)
+
+    @classmethod
+    def sport_activities_tables(cls):
+        return [RunActivities, WalkActivities, PaddleActivities, CycleActivities, EllipticalActivities]
+
+    def refresh_views(self):
+        for sport_activities in self.sport_activities_tables():
+            sport_activities.refresh_view(self)
 
 
 class ActivitiesLocationSegment(DBObject):
@@ -66,6 +85,45 @@ class ActivitiesLocationSegment(DBObject):
         self.stop_lat = stop_location.lat_deg
         self.stop_long = stop_location.long_deg
 
+    # rows of activity_bounds that index this table: laps or whole activities
+    bounds_laps = False
+
+    @classmethod
+    def _boxes_in(cls, session, min_lat, max_lat, min_long, max_long):
+        # Dict of (activity_id, lap) to the bounding boxes from the R*Tree index that overlap the box.
+        query_str = ('SELECT activity_id, lap, min_lat, max_lat, min_long, max_long FROM %s WHERE '
+            'min_lat <= :max_lat AND max_lat >= :min_lat AND min_long <= :max_long AND max_long >= :min_long AND lap %s 0' %
+            (ActivityBounds.table_name, '>' if cls.bounds_laps else '='))
+        params = {'min_lat' : min_lat, 'max_lat' : max_lat, 'min_long' : min_long, 'max_long' : max_long}
+        return {(row[0], row[1]) : tuple(row[2:]) for row in session.execute(query_str, params)}
+
+    @classmethod
+    def _get_for_keys(cls, session, keys):
+        activity_ids = sorted(set([activity_id for (activity_id, lap) in keys]))
+        rows = []
+        for index in xrange(0, len(activity_ids), 500):
+            rows += session.query(cls).filter(cls.activity_id.in_(activity_ids[index:index + 500])).all()
+        return [row for row in rows if (row.activity_id, getattr(row, 'lap', 0)) in keys]
+
+    @classmethod
+    def get_in_box(cls, db, min_lat, max_lat, min_long, max_long):
+        # Rows whose records' bounding box overlaps the box given in degrees.
+        with db.managed_session() as session:
+            return cls._get_for_keys(session, cls._boxes_in(session, min_lat, max_lat, min_long, max_long))
+
+    @classmethod
+    def get_near(cls, db, lat, long, radius_kms):
+        # Rows whose records' bounding box comes within radius_kms of the point. Boxes that cross the antimeridian
+        # aren't handled.
+        lat_delta = radius_kms / 111.32
+        long_delta = radius_kms / (111.32 * max(math.cos(math.radians(lat)), 0.00001))
+        location = Location(lat, long)
+        with db.managed_session() as session:
+            boxes = cls._boxes_in(session, lat - lat_delta, lat + lat_delta, long - long_delta, long + long_delta)
+            keys = [key for (key, (min_lat, max_lat, min_long, max_long)) in boxes.iteritems()
+                if location.distance_kms(Location(min(max(lat, min_lat), max_lat), min(max(long, min_long), max_long))) <= radius_kms]
+            return cls._get_for_keys(session, keys)
+
 
 class Activities(ActivitiesDB.Base, ActivitiesLocationSegment):
     __tablename__ = 'activities'
@@ -116,6 +174,11 @@ class Activities(ActivitiesDB.Base, ActivitiesLocationSegment):
     def get(cls, db, activity_id):
         return cls.find_one(db, {'activity_id' : activity_id})
 
+    @classmethod
+    def get_sports(cls, db, sports):
+        with db.managed_session() as session:
+            return dict(session.query(cls.activity_id, cls.sport).filter(cls.sport.in_(sports)).all())
+
     @classmethod
     def get_stats(cls, db, start_ts, end_ts):
         stats = {
@@ -162,6 +225,7 @@ class ActivityLaps(ActivitiesDB.Base, ActivitiesLocationSegment):
 
     time_col_name = 'start_time'
     match_col_names = ['activity_id', 'lap']
+    bounds_laps = True
 
     @hybrid_property
     def start_loc(self):
@@ -208,6 +272,370 @@ class ActivityRecords(ActivitiesDB.Base, DBObject):
         self.position_lat = location.lat_deg
         self.position_long = location.long_deg
 
+    @classmethod
+    def get_for_activities(cls, db, activity_ids, cols):
+        with db.managed_session() as session:
+            return session.query(cls.activity_id, cls.timestamp, *cols).filter(cls.activity_id.in_(activity_ids)).all()
+
+
+#
+# An activity's records stored in one row: each column is scaled to integers and delta encoded, and the columns are zlib
+# compressed together. Used instead of ActivityRecords rows when the DB is configured for compact records.
+#
+class ActivityTracks(ActivitiesDB.Base, DBObject):
+    __tablename__ = 'activity_tracks'
+
+    activity_id = Column(Integer, ForeignKey('activities.activity_id'), primary_key=True)
+    start_time = Column(DateTime)
+    records = Column(Integer, nullable=False)
+    track = Column(LargeBinary, nullable=False)
+
+    time_col_name = 'start_time'
+    match_col_names = ['activity_id']
+
+    track_format_version = 1
+    track_header = '<BI'
+    # the ActivityRecords columns in a track and the factor each is multiplied by before it's rounded to an integer,
+    # timestamps are stored as epoch seconds
+    track_cols = [
+        ('timestamp', 1),
+        ('position_lat', 10000000),
+        ('position_long', 10000000),
+        ('distance', 100000),
+        ('cadence', 1),
+        ('hr', 1),
+        ('alititude', 100),
+        ('speed', 1000),
+        ('temperature', 10),
+    ]
+    records_view_name = 'activity_track_records'
+
+    @classmethod
+    def encode(cls, records):
+        import numpy as np
+        count = len(records)
+        parts = [struct.pack(cls.track_header, cls.track_format_version, count)]
+        for (col_name, scale) in cls.track_cols:
+            if col_name == 'timestamp':
+                values = [cls._epoch_secs(record['timestamp']) if record.get('timestamp') is not None else None for record in records]
+            else:
+                values = [record.get(col_name) for record in records]
+            floats = np.array([value if value is not None else np.nan for value in values], dtype=np.float64)
+            present = ~np.isnan(floats)
+            # missing values repeat the previous value so they don't add to the deltas
+            ints = np.round(np.where(present, floats, 0.0) * scale).astype(np.int64)
+            ints = ints[np.maximum.accumulate(np.where(present, np.arange(count), 0))]
+            deltas = ints.copy()
+            deltas[1:] -= ints[:-1]
+            parts.append(np.packbits(present).tobytes())
+            parts.append(deltas.astype('<i8').tobytes())
+        return zlib.compress(''.join(parts))
+
+    @classmethod
+    def decode(cls, track):
+        # Returns a dict of column name to NumPy array: timestamps as datetime64[s] with NaT for missing values, the other
+        # columns as floats with NaN for missing values.
+        import numpy as np
+        data = zlib.decompress(track)
+        (version, count) = struct.unpack_from(cls.track_header, data)
+        if version != cls.track_format_version:
+            raise ValueError('Unsupported track format %d' % version)
+        offset = struct.calcsize(cls.track_header)
+        present_bytes = (count + 7) / 8
+        arrays = {}
+        for (col_name, scale) in cls.track_cols:
+            present = np.unpackbits(np.frombuffer(data, np.uint8, present_bytes, offset))[:count].astype(bool)
+            offset += present_bytes
+            ints = np.cumsum(np.frombuffer(data, '<i8', count, offset))
+            offset += count * 8
+            if col_name == 'timestamp':
+                values = ints.astype('datetime64[s]')
+                values[~present] = np.datetime64('NaT')
+            else:
+                values = ints / float(scale)
+                values[~present] = np.nan
+            arrays[col_name] = values
+        return arrays
+
+    @classmethod
+    def _write(cls, session, activity_id, records):
+        timestamps = [record['timestamp'] for record in records if record.get('timestamp') is not None]
+        track = {
+            'activity_id'   : activity_id,
+            'start_time'    : min(timestamps) if timestamps else None,
+            'records'       : len(records),
+            'track'         : cls.encode(records),
+        }
+        cls._create_or_update(session, track)
+
+    @classmethod
+    def get_arrays(cls, db, activity_id):
+        # The activity's track as a dict of column name to NumPy array, None if the activity doesn't have a track.
+        track = cls.find_one(db, {'activity_id' : activity_id})
+        if track is not None:
+            return cls.decode(track.track)
+
+    @classmethod
+    def get_for_activities(cls, db, activity_ids):
+        with db.managed_session() as session:
+            return session.query(cls).filter(cls.activity_id.in_(activity_ids)).all()
+
+    @classmethod
+    def track_value_function(cls):
+        # Returns a SQL function that returns one value from a track. Rows of a track are read in order, so the last
+        # decoded track is kept until a different track is asked for. It's keyed on the track's bytes so that a reimported
+        # track isn't mistaken for the one it replaced, and each connection gets its own since connections can be used from
+        # different threads.
+        decoded_track = {'track' : None, 'arrays' : None}
+        def track_value(activity_id, records, track, col_name, index):
+            import numpy as np
+            track = str(track)
+            if decoded_track['track'] != track:
+                decoded_track.update({'track' : track, 'arrays' : cls.decode(track)})
+            value = decoded_track['arrays'][col_name][index]
+            if col_name == 'timestamp':
+                if not np.isnat(value):
+                    return value.astype(datetime.datetime).strftime('%Y-%m-%d %H:%M:%S.000000')
+            elif not np.isnan(value):
+                return float(value)
+        return track_value
+
+    @classmethod
+    def register_sql_functions(cls, dbapi_connection, connection_record):
+        dbapi_connection.create_function('track_value', 5, cls.track_value_function())
+
+    @classmethod
+    def record_count(cls, db):
+        # the number of records stored in tracks
+        records = cls.get_col_sum(db, cls.records)
+        return records if records is not None else 0
+
+    @classmethod
+    def create_records_view(cls, db):
+        # A view with the same columns as ActivityRecords so tracks can be queried a row per record.
+        cols = ', '.join(["track_value(activity_id, records, track, '%s', track_index.n) AS %s" % (col_name, col_name) for (col_name, scale) in cls.track_cols])
+        query_str = ('WITH RECURSIVE track_index(n) AS (SELECT 0 UNION ALL SELECT n + 1 FROM track_index WHERE n + 1 < (SELECT max(records) FROM %s)) '
+            'SELECT activity_id, track_index.n + 1 AS record, %s FROM %s JOIN track_index ON track_index.n < records ORDER BY activity_id, record' %
+            (cls.__tablename__, cols, cls.__tablename__))
+        cls.create_view_if_doesnt_exist(db, cls.records_view_name, query_str)
+
+
+#
+# Writes an activity's records with multi row inserts a batch at a time, or as a compact track, replacing the records from
+# any earlier import of the activity. A compact track is written whole by flush() once all of the records are written.
+#
+class ActivityRecordsWriter(object):
+    batch_size = 1000
+
+    def __init__(self, session, activity_id, compact=False):
+        self.session = session
+        self.activity_id = activity_id
+        self.compact = compact
+        self.record = 1
+        self.records = []
+
+    def write(self, record):
+        record.update({'activity_id' : self.activity_id, 'record' : self.record})
+        self.records.append(record)
+        self.record += 1
+        if not self.compact and len(self.records) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if len(self.records) > 0:
+            if len(self.records) == self.record - 1:
+                # first batch: the activity has to exist before its records are inserted
+                Activities._find_or_create(self.session, {'activity_id' : self.activity_id})
+                self.session.flush()
+                ActivityRecords._delete_for_value(self.session, 'activity_id', self.activity_id)
+                ActivityTracks._delete_for_value(self.session, 'activity_id', self.activity_id)
+            if self.compact:
+                ActivityTracks._write(self.session, self.activity_id, self.records)
+            else:
+                ActivityRecords._insert(self.session, self.records)
+            self.records = []
+
+
+#
+# SQLite R*Tree index of the bounding boxes of the records of each activity (lap 0) and each of its laps. R*Tree tables
+# are virtual tables, so it's created and maintained with SQL instead of being a mapped class.
+#
+class ActivityBounds(object):
+    table_name = 'activity_bounds'
+
+    @classmethod
+    def supported(cls, session):
+        return session.bind.dialect.name == 'sqlite'
+
+    @classmethod
+    def create_table(cls, db):
+        # Returns True if the table didn't exist and was created.
+        with db.managed_session() as session:
+            exists = session.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = :name", {'name' : cls.table_name}).fetchone()
+            if exists is None:
+                session.execute('CREATE VIRTUAL TABLE %s USING rtree(id, min_lat, max_lat, min_long, max_long, +activity_id, +lap)' % cls.table_name)
+        return exists is None
+
+    @classmethod
+    def _box(cls, lats, longs):
+        if len(lats) > 0:
+            return (min(lats), max(lats), min(longs), max(longs))
+
+    @classmethod
+    def _track_boxes(cls, track, laps):
+        import numpy as np
+        arrays = ActivityTracks.decode(track)
+        (lats, longs, timestamps) = (arrays['position_lat'], arrays['position_long'], arrays['timestamp'])
+        positioned = ~(np.isnan(lats) | np.isnan(longs))
+        boxes = {0 : cls._box(lats[positioned], longs[positioned])}
+        for (lap, start_time, stop_time) in laps:
+            if start_time is not None and stop_time is not None:
+                in_lap = positioned & (timestamps >= np.datetime64(start_time)) & (timestamps <= np.datetime64(stop_time))
+                boxes[lap] = cls._box(lats[in_lap], longs[in_lap])
+        return boxes
+
+    @classmethod
+    def _records_boxes(cls, session, activity_id, laps):
+        box_cols = [func.min(ActivityRecords.position_lat), func.max(ActivityRecords.position_lat),
+            func.min(ActivityRecords.position_long), func.max(ActivityRecords.position_long)]
+        query = session.query(*box_cols).filter(ActivityRecords.activity_id == activity_id) \
+            .filter(ActivityRecords.position_lat != None).filter(ActivityRecords.position_long != None)
+        boxes = {0 : query.one()}
+        for (lap, start_time, stop_time) in laps:
+            if start_time is not None and stop_time is not None:
+                boxes[lap] = query.filter(ActivityRecords.timestamp >= start_time).filter(ActivityRecords.timestamp <= stop_time).one()
+        return boxes
+
+    @classmethod
+    def _update(cls, session, activity_id):
+        # Replaces the activity's boxes with ones calculated from its records or track. Activities without positions in
+        # their records are indexed by their start and stop locations.
+        if not cls.supported(session):
+            return
+        # R*Tree auxiliary columns have no type affinity, ids from file names have to be stored as integers to match
+        activity_id = int(activity_id)
+        session.flush()
+        session.execute('DELETE FROM %s WHERE activity_id = :activity_id' % cls.table_name, {'activity_id' : activity_id})
+        laps = session.query(ActivityLaps.lap, ActivityLaps.start_time, ActivityLaps.stop_time).filter(ActivityLaps.activity_id == activity_id).all()
+        track = session.query(ActivityTracks.track).filter(ActivityTracks.activity_id == activity_id).scalar()
+        if track is not None:
+            boxes = cls._track_boxes(track, laps)
+        else:
+            boxes = cls._records_boxes(session, activity_id, laps)
+        if boxes[0] is None or boxes[0][0] is None:
+            activity = session.query(Activities).filter(Activities.activity_id == activity_id).first()
+            if activity is not None:
+                points = [(lat, long) for (lat, long) in [(activity.start_lat, activity.start_long), (activity.stop_lat, activity.stop_long)]
+                    if lat is not None and long is not None]
+                boxes[0] = cls._box([lat for (lat, long) in points], [long for (lat, long) in points])
+        rows = [
+            {
+                'activity_id'   : activity_id,
+                'lap'           : lap,
+                'min_lat'       : float(box[0]),
+                'max_lat'       : float(box[1]),
+                'min_long'      : float(box[2]),
+                'max_long'      : float(box[3]),
+            } for (lap, box) in boxes.iteritems() if box is not None and box[0] is not None
+        ]
+        if len(rows) > 0:
+            session.execute('INSERT INTO %s (min_lat, max_lat, min_long, max_long, activity_id, lap) '
+                'VALUES (:min_lat, :max_lat, :min_long, :max_long, :activity_id, :lap)' % cls.table_name, rows)
+
+    @classmethod
+    def update(cls, db, activity_id):
+        with db.managed_session() as session:
+            cls._update(session, activity_id)
+
+    @classmethod
+    def update_all(cls, db):
+        with db.managed_session() as session:
+            for (activity_id,) in session.query(Activities.activity_id).all():
+                cls._update(session, activity_id)
+
+
+#
+# Time spent in each heart rate zone per activity and the zone lower bounds it was calculated with.
+#
+class ActivityHrZones(ActivitiesDB.Base, DBObject):
+    __tablename__ = 'activity_hr_zones'
+
+    zones = 5
+
+    activity_id = Column(Integer, ForeignKey('activities.activity_id'), primary_key=True)
+    hrz_1_hr = Column(Integer)
+    hrz_1_time = Column(Time, nullable=False, default=datetime.time.min)
+    hrz_2_hr = Column(Integer)
+    hrz_2_time = Column(Time, nullable=False, default=datetime.time.min)
+    hrz_3_hr = Column(Integer)
+    hrz_3_time = Column(Time, nullable=False, default=datetime.time.min)
+    hrz_4_hr = Column(Integer)
+    hrz_4_time = Column(Time, nullable=False, default=datetime.time.min)
+    hrz_5_hr = Column(Integer)
+    hrz_5_time = Column(Time, nullable=False, default=datetime.time.min)
+
+    match_col_names = ['activity_id']
+
+    def zone_hrs(self):
+        return [getattr(self, 'hrz_%d_hr' % zone) for zone in xrange(1, self.zones + 1)]
+
+    @classmethod
+    def get_all_zone_hrs(cls, db):
+        with db.managed_session() as session:
+            return {hr_zones.activity_id : hr_zones.zone_hrs() for hr_zones in session.query(cls).all()}
+
+
+
+#
+# The fastest time an activity covered each of the standard distances in.
+#
+class ActivityBestEfforts(ActivitiesDB.Base, DBObject):
+    __tablename__ = 'activity_best_efforts'
+
+    # effort name : meters
+    efforts = {
+        '400m'          : 400.0,
+        '1k'            : 1000.0,
+        'mile'          : 1609.344,
+        '5k'            : 5000.0,
+        '10k'           : 10000.0,
+        'half_marathon' : 21097.5,
+    }
+    sports = ['running', 'cycling']
+
+    activity_id = Column(Integer, ForeignKey('activities.activity_id'))
+    effort = Column(String)
+    sport = Column(String)
+    # when the effort started
+    start_time = Column(DateTime)
+    elapsed_time = Column(Time, nullable=False, default=datetime.time.min)
+
+    __table_args__ = (
+        PrimaryKeyConstraint("activity_id", "effort"),
+        Index('best_efforts_index', 'sport', 'effort', 'elapsed_time'),
+    )
+
+    time_col_name = 'start_time'
+    match_col_names = ['activity_id', 'effort']
+
+    @classmethod
+    def get_best(cls, db, sport, effort, start_ts=None, end_ts=None):
+        with db.managed_session() as session:
+            query = cls._query(session, cls, cls.elapsed_time, start_ts, end_ts)
+            return query.filter(cls.sport == sport).filter(cls.effort == effort).first()
+
+    @classmethod
+    def get_yearly_bests(cls, db, sport, effort):
+        yearly_bests = {}
+        for year in cls.get_years(db):
+            start_ts = datetime.datetime(year, 1, 1)
+            yearly_bests[year] = cls.get_best(db, sport, effort, start_ts, datetime.datetime(year + 1, 1, 1))
+        return yearly_bests
+
+    @classmethod
+    def get_activity_ids(cls, db):
+        return cls.get_col_distinct(db, cls.activity_id)
+
 
 class SportActivities(DBObject):
 
@@ -222,8 +650,24 @@ class SportActivities(DBObject):
         return relationship("Activities")
 
     @classmethod
-    def create_activity_view(cls, db, selectable):
-        cls.create_join_view(db, cls.get_default_view_name(), selectable, Activities, Activities.start_time.desc())
+    def create_view(cls, db):
+        if db.materialized_views:
+            cls.create_materialized_join_view(db, cls.get_default_view_name(), cls.view_selectable(), Activities, Activities.start_time.desc(),
+                'activity_id', [Activities.__tablename__, cls.__tablename__], ['start_time'])
+        else:
+            cls.create_join_view(db, cls.get_default_view_name(), cls.view_selectable(), Activities, Activities.start_time.desc())
+
+    @classmethod
+    def delete_view(cls, db, materialized_views=False):
+        if materialized_views:
+            cls._delete_materialized_view(db, cls.get_default_view_name(), [Activities.__tablename__, cls.__tablename__])
+        else:
+            super(SportActivities, cls).delete_view(db)
+
+    @classmethod
+    def refresh_view(cls, db):
+        if db.materialized_views:
+            cls.refresh_materialized_join_view(db, cls.get_default_view_name(), cls.view_selectable(), Activities, Activities.start_time.desc(), 'activity_id')
 
 
 class RunActivities(ActivitiesDB.Base, SportActivities):
@@ -250,51 +694,49 @@ class RunActivities(ActivitiesDB.Base, SportActivities):
     vo2_max = Column(Float)
 
     @classmethod
-    def create_view(cls, db):
+    def view_selectable(cls):
         # The query fails to genarate sql when using the func.round clause.
-        cls.create_activity_view(db,
-            [
-                Activities.activity_id.label('activity_id'),
-                Activities.name.label('name'),
-                Activities.description.label('description'),
-                Activities.type.label('type'),
-                Activities.course_id.label('course_id'),
-                Activities.start_time.label('start_time'),
-                Activities.stop_time.label('stop_time'),
-                Activities.elapsed_time.label('elapsed_time'),
-                # func.round(Activities.distance).label('distance'),
-                cls.round_col(Activities.__tablename__ + '.distance', 'distance'),
-                cls.steps.label('steps'),
-                cls.avg_pace .label('avg_pace'),
-                cls.avg_moving_pace.label('avg_moving_pace'),
-                cls.max_pace.label('max_pace'),
-                cls.avg_steps_per_min.label('avg_steps_per_min'),
-                cls.max_steps_per_min.label('max_steps_per_min'),
-                Activities.avg_hr.label('avg_hr'),
-                Activities.max_hr.label('max_hr'),
-                Activities.calories.label('calories'),
-                # func.round(Activities.avg_temperature).label('avg_temperature'),
-                # func.round(Activities.avg_speed).label('avg_speed'),
-                # func.round(Activities.max_speed).label('max_speed'),
-                # func.round(cls.avg_step_length).label('avg_step_length'),
-                # func.round(cls.avg_vertical_ratio).label('avg_vertical_ratio'),
-                # func.round(cls.avg_vertical_oscillation).label('avg_vertical_oscillation'),
-                cls.round_col(Activities.__tablename__ + '.avg_temperature', 'avg_temperature'),
-                cls.round_col(Activities.__tablename__ + '.avg_speed', 'avg_speed'),
-                cls.round_col(Activities.__tablename__ + '.max_speed', 'max_speed'),
-                cls.round_col(cls.__tablename__ + '.avg_step_length', 'avg_step_length'),
-                cls.round_col(cls.__tablename__ + '.avg_vertical_ratio', 'avg_vertical_ratio'),
-                cls.avg_gct_balance.label('avg_gct_balance'),
-                cls.round_col(cls.__tablename__ + '.avg_vertical_oscillation', 'avg_vertical_oscillation'),
-                cls.avg_ground_contact_time.label('avg_ground_contact_time'),
-                cls.avg_stance_time_percent.label('avg_stance_time_percent'),
-                cls.vo2_max.label('vo2_max'),
-                Activities.training_effect.label('training_effect'),
-                Activities.anaerobic_training_effect.label('anaerobic_training_effect'),
-                Location.google_maps_url('activities.start_lat', 'activities.start_long') + ' AS start_loc',
-                Location.google_maps_url('activities.stop_lat', 'activities.stop_long') + ' AS stop_loc',
-            ]
-        )
+        return [
+            Activities.activity_id.label('activity_id'),
+            Activities.name.label('name'),
+            Activities.description.label('description'),
+            Activities.type.label('type'),
+            Activities.course_id.label('course_id'),
+            Activities.start_time.label('start_time'),
+            Activities.stop_time.label('stop_time'),
+            Activities.elapsed_time.label('elapsed_time'),
+            # func.round(Activities.distance).label('distance'),
+            cls.round_col(Activities.__tablename__ + '.distance', 'distance'),
+            cls.steps.label('steps'),
+            cls.avg_pace .label('avg_pace'),
+            cls.avg_moving_pace.label('avg_moving_pace'),
+            cls.max_pace.label('max_pace'),
+            cls.avg_steps_per_min.label('avg_steps_per_min'),
+            cls.max_steps_per_min.label('max_steps_per_min'),
+            Activities.avg_hr.label('avg_hr'),
+            Activities.max_hr.label('max_hr'),
+            Activities.calories.label('calories'),
+            # func.round(Activities.avg_temperature).label('avg_temperature'),
+            # func.round(Activities.avg_speed).label('avg_speed'),
+            # func.round(Activities.max_speed).label('max_speed'),
+            # func.round(cls.avg_step_length).label('avg_step_length'),
+            # func.round(cls.avg_vertical_ratio).label('avg_vertical_ratio'),
+            # func.round(cls.avg_vertical_oscillation).label('avg_vertical_oscillation'),
+            cls.round_col(Activities.__tablename__ + '.avg_temperature', 'avg_temperature'),
+            cls.round_col(Activities.__tablename__ + '.avg_speed', 'avg_speed'),
+            cls.round_col(Activities.__tablename__ + '.max_speed', 'max_speed'),
+            cls.round_col(cls.__tablename__ + '.avg_step_length', 'avg_step_length'),
+            cls.round_col(cls.__tablename__ + '.avg_vertical_ratio', 'avg_vertical_ratio'),
+            cls.avg_gct_balance.label('avg_gct_balance'),
+            cls.round_col(cls.__tablename__ + '.avg_vertical_oscillation', 'avg_vertical_oscillation'),
+            cls.avg_ground_contact_time.label('avg_ground_contact_time'),
+            cls.avg_stance_time_percent.label('avg_stance_time_percent'),
+            cls.vo2_max.label('vo2_max'),
+            Activities.training_effect.label('training_effect'),
+            Activities.anaerobic_training_effect.label('anaerobic_training_effect'),
+            Location.google_maps_url('activities.start_lat', 'activities.start_long') + ' AS start_loc',
+            Location.google_maps_url('activities.stop_lat', 'activities.stop_long') + ' AS stop_loc',
+        ]
 
 
 class WalkActivities(ActivitiesDB.Base, SportActivities):
@@ -306,33 +748,31 @@ class WalkActivities(ActivitiesDB.Base, SportActivities):
     vo2_max = Column(Float)
 
     @classmethod
-    def create_view(cls, db):
-        cls.create_activity_view(db,
-            [
-                Activities.activity_id.label('activity_id'),
-                Activities.name.label('name'),
-                Activities.description.label('description'),
-                Activities.sub_sport.label('sport'),
-                Activities.start_time.label('start_time'),
-                Activities.stop_time.label('stop_time'),
-                Activities.elapsed_time.label('elapsed_time'),
-                cls.round_col(Activities.__tablename__ + '.distance', 'distance'),
-                cls.steps.label('steps'),
-                cls.avg_pace .label('avg_pace'),
-                cls.max_pace.label('max_pace'),
-                Activities.avg_hr.label('avg_hr'),
-                Activities.max_hr.label('max_hr'),
-                Activities.calories.label('calories'),
-                cls.round_col(Activities.__tablename__ + '.avg_temperature', 'avg_temperature'),
-                cls.round_col(Activities.__tablename__ + '.avg_speed', 'avg_speed'),
-                cls.round_col(Activities.__tablename__ + '.max_speed', 'max_speed'),
-                cls.vo2_max.label('vo2_max'),
-                Activities.training_effect.label('training_effect'),
-                Activities.anaerobic_training_effect.label('anaerobic_training_effect'),
-                Location.google_maps_url('activities.start_lat', 'activities.start_long') + ' AS start_loc',
-                Location.google_maps_url('activities.stop_lat', 'activities.stop_long') + ' AS stop_loc'
-            ]
-        )
+    def view_selectable(cls):
+        return [
+            Activities.activity_id.label('activity_id'),
+            Activities.name.label('name'),
+            Activities.description.label('description'),
+            Activities.sub_sport.label('sport'),
+            Activities.start_time.label('start_time'),
+            Activities.stop_time.label('stop_time'),
+            Activities.elapsed_time.label('elapsed_time'),
+            cls.round_col(Activities.__tablename__ + '.distance', 'distance'),
+            cls.steps.label('steps'),
+            cls.avg_pace .label('avg_pace'),
+            cls.max_pace.label('max_pace'),
+            Activities.avg_hr.label('avg_hr'),
+            Activities.max_hr.label('max_hr'),
+            Activities.calories.label('calories'),
+            cls.round_col(Activities.__tablename__ + '.avg_temperature', 'avg_temperature'),
+            cls.round_col(Activities.__tablename__ + '.avg_speed', 'avg_speed'),
+            cls.round_col(Activities.__tablename__ + '.max_speed', 'max_speed'),
+            cls.vo2_max.label('vo2_max'),
+            Activities.training_effect.label('training_effect'),
+            Activities.anaerobic_training_effect.label('anaerobic_training_effect'),
+            Location.google_maps_url('activities.start_lat', 'activities.start_long') + ' AS start_loc',
+            Location.google_maps_url('activities.stop_lat', 'activities.stop_long') + ' AS stop_loc'
+        ]
 
 
 class PaddleActivities(ActivitiesDB.Base, SportActivities):
@@ -342,33 +782,31 @@ class PaddleActivities(ActivitiesDB.Base, SportActivities):
     avg_stroke_distance = Column(Float)
 
     @classmethod
-    def create_view(cls, db):
-        cls.create_activity_view(db,
-            [
-                Activities.activity_id.label('activity_id'),
-                Activities.name.label('name'),
-                Activities.description.label('description'),
-                Activities.sub_sport.label('sport'),
-                Activities.start_time.label('start_time'),
-                Activities.stop_time.label('stop_time'),
-                Activities.elapsed_time.label('elapsed_time'),
-                cls.round_col(Activities.__tablename__ + '.distance', 'distance'),
-                cls.strokes.label('strokes'),
-                cls.round_col(cls.__tablename__ + '.avg_stroke_distance', 'avg_stroke_distance'),
-                Activities.avg_cadence.label('avg_cadence'),
-                Activities.max_cadence.label('max_cadence'),
-                Activities.avg_hr.label('avg_hr'),
-                Activities.max_hr.label('max_hr'),
-                Activities.calories.label('calories'),
-                cls.round_col(Activities.__tablename__ + '.avg_temperature', 'avg_temperature'),
-                cls.round_col(Activities.__tablename__ + '.avg_speed', 'avg_speed'),
-                cls.round_col(Activities.__tablename__ + '.max_speed', 'max_speed'),
-                Activities.training_effect.label('training_effect'),
-                Activities.anaerobic_training_effect.label('anaerobic_training_effect'),
-                Location.google_maps_url('activities.start_lat', 'activities.start_long') + ' AS start_loc',
-                Location.google_maps_url('activities.stop_lat', 'activities.stop_long') + ' AS stop_loc'
-            ]
-        )
+    def view_selectable(cls):
+        return [
+            Activities.activity_id.label('activity_id'),
+            Activities.name.label('name'),
+            Activities.description.label('description'),
+            Activities.sub_sport.label('sport'),
+            Activities.start_time.label('start_time'),
+            Activities.stop_time.label('stop_time'),
+            Activities.elapsed_time.label('elapsed_time'),
+            cls.round_col(Activities.__tablename__ + '.distance', 'distance'),
+            cls.strokes.label('strokes'),
+            cls.round_col(cls.__tablename__ + '.avg_stroke_distance', 'avg_stroke_distance'),
+            Activities.avg_cadence.label('avg_cadence'),
+            Activities.max_cadence.label('max_cadence'),
+            Activities.avg_hr.label('avg_hr'),
+            Activities.max_hr.label('max_hr'),
+            Activities.calories.label('calories'),
+            cls.round_col(Activities.__tablename__ + '.avg_temperature', 'avg_temperature'),
+            cls.round_col(Activities.__tablename__ + '.avg_speed', 'avg_speed'),
+            cls.round_col(Activities.__tablename__ + '.max_speed', 'max_speed'),
+            Activities.training_effect.label('training_effect'),
+            Activities.anaerobic_training_effect.label('anaerobic_training_effect'),
+            Location.google_maps_url('activities.start_lat', 'activities.start_long') + ' AS start_loc',
+            Location.google_maps_url('activities.stop_lat', 'activities.stop_long') + ' AS stop_loc'
+        ]
 
 
 class CycleActivities(ActivitiesDB.Base, SportActivities):
@@ -377,33 +815,31 @@ class CycleActivities(ActivitiesDB.Base, SportActivities):
     vo2_max = Column(Float)
 
     @classmethod
-    def create_view(cls, db):
-        cls.create_activity_view(db,
-            [
-                Activities.activity_id.label('activity_id'),
-                Activities.name.label('name'),
-                Activities.description.label('description'),
-                Activities.sub_sport.label('sport'),
-                Activities.start_time.label('start_time'),
-                Activities.stop_time.label('stop_time'),
-                Activities.elapsed_time.label('elapsed_time'),
-                cls.round_col(Activities.__tablename__ + '.distance', 'distance'),
-                cls.strokes.label('strokes'),
-                Activities.avg_hr.label('avg_hr'),
-                Activities.max_hr.label('max_hr'),
-                Activities.calories.label('calories'),
-                cls.round_col(Activities.__tablename__ + '.avg_temperature', 'avg_temperature'),
-                Activities.avg_cadence.label('avg_rpms'),
-                Activities.max_cadence.label('max_rpms'),
-                cls.round_col(Activities.__tablename__ + '.avg_speed', 'avg_speed'),
-                cls.round_col(Activities.__tablename__ + '.max_speed', 'max_speed'),
-                cls.vo2_max.label('vo2_max'),
-                Activities.training_effect.label('training_effect'),
-                Activities.anaerobic_training_effect.label('anaerobic_training_effect'),
-                Location.google_maps_url('activities.start_lat', 'activities.start_long') + ' AS start_loc',
-                Location.google_maps_url('activities.stop_lat', 'activities.stop_long') + ' AS stop_loc'
-            ]
-        )
+    def view_selectable(cls):
+        return [
+            Activities.activity_id.label('activity_id'),
+            Activities.name.label('name'),
+            Activities.description.label('description'),
+            Activities.sub_sport.label('sport'),
+            Activities.start_time.label('start_time'),
+            Activities.stop_time.label('stop_time'),
+            Activities.elapsed_time.label('elapsed_time'),
+            cls.round_col(Activities.__tablename__ + '.distance', 'distance'),
+            cls.strokes.label('strokes'),
+            Activities.avg_hr.label('avg_hr'),
+            Activities.max_hr.label('max_hr'),
+            Activities.calories.label('calories'),
+            cls.round_col(Activities.__tablename__ + '.avg_temperature', 'avg_temperature'),
+            Activities.avg_cadence.label('avg_rpms'),
+            Activities.max_cadence.label('max_rpms'),
+            cls.round_col(Activities.__tablename__ + '.avg_speed', 'avg_speed'),
+            cls.round_col(Activities.__tablename__ + '.max_speed', 'max_speed'),
+            cls.vo2_max.label('vo2_max'),
+            Activities.training_effect.label('training_effect'),
+            Activities.anaerobic_training_effect.label('anaerobic_training_effect'),
+            Location.google_maps_url('activities.start_lat', 'activities.start_long') + ' AS start_loc',
+            Location.google_maps_url('activities.stop_lat', 'activities.stop_long') + ' AS stop_loc'
+        ]
 
 
 class EllipticalActivities(ActivitiesDB.Base, SportActivities):
@@ -413,28 +849,26 @@ class EllipticalActivities(ActivitiesDB.Base, SportActivities):
     elliptical_distance = Column(Float)
 
     @classmethod
-    def create_view(cls, db):
-        cls.create_activity_view(db,
-            [
-                Activities.activity_id.label('activity_id'),
-                Activities.name.label('name'),
-                Activities.description.label('description'),
-                Activities.type.label('type'),
-                Activities.start_time.label('start_time'),
-                Activities.stop_time.label('stop_time'),
-                Activities.elapsed_time.label('elapsed_time'),
-                cls.steps.label('steps'),
-                cls.round_col(Activities.__tablename__ + '.distance', 'distance'),
-                Activities.avg_hr.label('avg_hr'),
-                Activities.max_hr.label('max_hr'),
-                Activities.calories.label('calories'),
-                cls.round_col(Activities.__tablename__ + '.avg_cadence', 'avg_rpms'),
-                cls.round_col(Activities.__tablename__ + '.max_cadence', 'max_rpms'),
-                cls.round_col(Activities.__tablename__ + '.avg_speed', 'avg_speed'),
-                Activities.training_effect.label('training_effect'),
-                Activities.anaerobic_training_effect.label('anaerobic_training_effect')
-            ]
-        )
+    def view_selectable(cls):
+        return [
+            Activities.activity_id.label('activity_id'),
+            Activities.name.label('name'),
+            Activities.description.label('description'),
+            Activities.type.label('type'),
+            Activities.start_time.label('start_time'),
+            Activities.stop_time.label('stop_time'),
+            Activities.elapsed_time.label('elapsed_time'),
+            cls.steps.label('steps'),
+            cls.round_col(Activities.__tablename__ + '.distance', 'distance'),
+            Activities.avg_hr.label('avg_hr'),
+            Activities.max_hr.label('max_hr'),
+            Activities.calories.label('calories'),
+            cls.round_col(Activities.__tablename__ + '.avg_cadence', 'avg_rpms'),
+            cls.round_col(Activities.__tablename__ + '.max_cadence', 'max_rpms'),
+            cls.round_col(Activities.__tablename__ + '.avg_speed', 'avg_speed'),
+            Activities.training_effect.label('training_effect'),
+            Activities.anaerobic_training_effect.label('anaerobic_training_effect')
+        ]
 
 
 class ActivitiesExtraData(ActivitiesDB.Base, ExtraData):
@@ -34,6 +34,7 @@ class GarminDB(DB):
             version.update_version(self, 'view_version', self.view_version)
         DeviceInfo.create_view(self)
         File.create_view(self)
+        Stress.create_rollup(self)
 
 
 class Attributes(GarminDB.Base, KeyValueObject):
@@ -180,6 +181,7 @@ class Stress(GarminDB.Base, DBObject):
     stress = Column(Integer, nullable=False)
 
     time_col_name = 'timestamp'
+    rollup_col_name = 'stress'
 
     @classmethod
     def get_stats(cls, db, start_ts, end_ts):
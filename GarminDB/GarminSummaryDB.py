@@ -13,7 +13,7 @@ logger = logging.getLogger(__name__)
 class GarminSummaryDB(DB):
     Base = declarative_base()
     db_name = 'garmin_summary'
-    db_version = 6
+    db_version = 8
     view_version = SummaryBase.view_version
 
     class DbVersion(Base, DbVersionObject):
@@ -65,6 +65,34 @@ class DaysSummary(GarminSummaryDB.Base, SummaryBase):
     time_col_name = 'day'
 
 
+#
+# Per day sketches of monitoring values. Weekly and monthly percentiles merge these instead of rescanning the raw values.
+#
+class DailySketch(GarminSummaryDB.Base, DBObject):
+    __tablename__ = 'daily_sketches'
+
+    day = Column(Date)
+    name = Column(String)
+    sketch = Column(String)
+
+    __table_args__ = (
+        PrimaryKeyConstraint("day", "name"),
+    )
+
+    time_col_name = 'day'
+    match_col_names = ['day', 'name']
+
+    @classmethod
+    def set_sketch(cls, db, day, name, sketch):
+        cls.create_or_update(db, {'day' : day, 'name' : name, 'sketch' : sketch.to_string()})
+
+    @classmethod
+    def get_merged(cls, db, name, start_day, end_day):
+        with db.managed_session() as session:
+            rows = cls._query(session, cls.sketch, None, start_day, end_day).filter(cls.name == name).all()
+        return QuantileSketch.merged([QuantileSketch.from_string(row.sketch) for row in rows])
+
+
 #
 # Monitoring heart rate values that fall within a intensity period.
 #
@@ -85,3 +113,29 @@ class IntensityHR(GarminSummaryDB.Base, DBObject):
             'inactive_hr_max' : cls.get_col_max_for_value(db, cls.heart_rate, cls.intensity, 0, start_ts, end_ts, True),
         }
         return stats
+
+
+#
+# Daily training impulse (TRIMP) and the rolling training load values derived from it.
+#
+class TrainingLoad(GarminSummaryDB.Base, DBObject):
+    __tablename__ = 'training_load'
+
+    day = Column(Date, primary_key=True)
+    # number of activities that contributed to the day's trimp
+    activities = Column(Integer, nullable=False, default=0)
+    # number of heart rate records of the day's activities
+    records = Column(Integer, nullable=False, default=0)
+    trimp = Column(Float, nullable=False, default=0.0)
+    # 7 and 42 day exponentially weighted trimp
+    acute_load = Column(Float)
+    chronic_load = Column(Float)
+    # mean / standard deviation of the last 7 days trimp
+    monotony = Column(Float)
+    # sum of the last 7 days trimp * monotony
+    strain = Column(Float)
+    # the heart rate profile the trimp was calculated with
+    resting_hr = Column(Float)
+    max_hr = Column(Float)
+
+    time_col_name = 'day'
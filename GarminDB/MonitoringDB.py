@@ -25,6 +25,7 @@ class MonitoringDB(DB):
         MonitoringDB.Base.metadata.create_all(self.engine)
         self.version = MonitoringDB.DbVersion()
         self.version.version_check(self, self.db_version)
+        MonitoringHeartRate.create_rollup(self)
 
 
 class MonitoringInfo(MonitoringDB.Base, DBObject):
@@ -58,6 +59,7 @@ class MonitoringHeartRate(MonitoringDB.Base, DBObject):
     heart_rate = Column(Integer, nullable=False)
 
     time_col_name = 'timestamp'
+    rollup_col_name = 'heart_rate'
 
     @classmethod
     def get_stats(cls, db, start_ts, end_ts):
@@ -179,22 +181,23 @@ class Monitoring(MonitoringDB.Base, DBObject):
 
     time_col_name = 'timestamp'
 
+    active_calories_activity_types = [FieldEnums.ActivityType.running, FieldEnums.ActivityType.cycling, FieldEnums.ActivityType.walking]
+
     @classmethod
-    def get_active_calories(cls, db, activity_type, start_ts, end_ts):
-        active_calories = cls.get_col_avg_of_max_per_day_for_value(db, cls.active_calories, cls.activity_type, activity_type, start_ts, end_ts)
-        if active_calories is not None:
-            return active_calories
-        return 0
+    def get_active_calories(cls, db, start_ts, end_ts):
+        # One grouped query returns the per day max for every activity type, average those per type and sum the types.
+        daily_maxes = {}
+        rows = cls.get_col_max_per_day_by_value(db, cls.active_calories, cls.activity_type, start_ts, end_ts, cls.active_calories_activity_types)
+        for (day, activity_type, max_active_calories) in rows:
+            if max_active_calories is not None:
+                daily_maxes.setdefault(activity_type, []).append(max_active_calories)
+        return sum([float(sum(maxes)) / len(maxes) for maxes in daily_maxes.values()])
 
     @classmethod
     def get_stats(cls, db, func, start_ts, end_ts):
         return {
             'steps'                 : func(db, cls.steps, start_ts, end_ts),
-            'calories_active_avg'   : (
-                cls.get_active_calories(db, FieldEnums.ActivityType.running, start_ts, end_ts) +
-                cls.get_active_calories(db, FieldEnums.ActivityType.cycling, start_ts, end_ts) +
-                cls.get_active_calories(db, FieldEnums.ActivityType.walking, start_ts, end_ts)
-            )
+            'calories_active_avg'   : cls.get_active_calories(db, start_ts, end_ts),
         }
 
     @classmethod
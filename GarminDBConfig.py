@@ -1,5 +1,7 @@
 db = {
-    'type'                  : 'sqlite'
+    'type'                  : 'sqlite',
+    'materialized_views'    : False,
+    'compact_records'       : False     # store each activity's records as one compressed track instead of a row per record
 }
 directories = {
     'relative_to_home'      : True,
@@ -18,6 +20,14 @@ directories = {
 config = {
     'metric'                : False
 }
+download = {
+    'concurrency'           : 1,        # number of downloads in flight at once
+    'rate'                  : 1.0       # maximum requests per second to Garmin Connect
+}
+storage = {
+    'monitoring_archives'   : False,    # keep downloaded monitoring FIT files in a zip archive per month instead of extracting them
+    'compress_json'         : False     # gzip downloaded JSON files
+}
 enabled_stats = {
     'monitoring'            : True,
     'sleep'                 : True,
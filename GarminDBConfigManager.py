@@ -24,6 +24,12 @@ def get_db_password():
 def get_db_host():
     return GarminDBConfig.db['host']
 
+def get_db_materialized_views():
+    return GarminDBConfig.db['materialized_views']
+
+def get_db_compact_records():
+    return GarminDBConfig.db['compact_records']
+
 def _create_dir_if_needed(dir):
     if not os.path.exists(dir):
         os.makedirs(dir)
@@ -97,7 +103,9 @@ def get_db_dir(test_db=False):
 def get_db_params(test_db=False):
     db_type = get_db_type()
     db_params_dict = {
-        'db_type' : db_type
+        'db_type'               : db_type,
+        'materialized_views'    : get_db_materialized_views(),
+        'compact_records'       : get_db_compact_records()
     }
     if db_type == 'sqlite':
         db_path = get_db_dir(test_db)
@@ -113,6 +121,18 @@ def get_db_params(test_db=False):
 def get_metric():
     return GarminDBConfig.config['metric']
 
+def get_download_concurrency():
+    return GarminDBConfig.download['concurrency']
+
+def get_download_rate():
+    return GarminDBConfig.download['rate']
+
+def get_monitoring_archives():
+    return GarminDBConfig.storage['monitoring_archives']
+
+def get_compress_json():
+    return GarminDBConfig.storage['compress_json']
+
 def is_stat_enabled(stat_name):
     return GarminDBConfig.enabled_stats[stat_name]
 
@@ -4,17 +4,19 @@
 # copyright Tom Goetz
 #
 
-import logging, datetime, csv
+import logging, datetime, csv, functools
 
 logger = logging.getLogger(__name__)
 
 
 class CsvImporter():
+    # rows handed to the write function at a time
+    batch_size = 1000
 
-    def __init__(self, filename, cols_map, write_entry_func):
+    def __init__(self, filename, cols_map, write_entries_func):
         self.filename = filename
         self.cols_map = cols_map
-        self.write_entry_func = write_entry_func
+        self.write_entries_func = write_entries_func
 
     @classmethod
     def map_identity(cls, english_units, value):
@@ -44,12 +46,11 @@ class CsvImporter():
     @classmethod
     def map_mdy_date(cls, english_units, date_string):
         try:
-            return datetime.datetime.strptime(date_string, "%m/%d/%y %H:%M")
+            if ' ' in date_string:
+                return datetime.datetime.strptime(date_string, "%m/%d/%y %H:%M")
+            return datetime.datetime.strptime(date_string, "%m/%d/%y")
         except Exception as e:
-            try:
-                return datetime.datetime.strptime(date_string, "%m/%d/%y")
-            except Exception as e:
-                return None
+            return None
 
     @classmethod
     def map_time(cls, english_units, time_string):
@@ -70,17 +71,49 @@ class CsvImporter():
             return float(kgs) * 2.20462
         return float(kgs)
 
-    def convert_cols(self, english_units, csv_col_dict):
-        return {
-            (self.cols_map[key][0] if key in self.cols_map else key) :
-            (self.cols_map[key][1](english_units, value) if key in self.cols_map else value) for key, value in csv_col_dict.items()
-        }
+    @classmethod
+    def cached(cls, convert):
+        cache = {}
+        def cached_convert(value):
+            try:
+                return cache[value]
+            except KeyError:
+                result = cache[value] = convert(value)
+                return result
+        return cached_convert
+
+    def compile_plan(self, english_units, header):
+        # The DB column name and converter for each CSV column, built once per file. Dates and times repeat across rows
+        # so their conversions are cached.
+        cached_maps = [self.map_ymd_date, self.map_mdy_date, self.map_time]
+        db_col_names = []
+        converters = []
+        for col_name in header:
+            (db_col_name, map_func) = self.cols_map.get(col_name, (col_name, self.map_identity))
+            convert = functools.partial(map_func, english_units)
+            if map_func in cached_maps:
+                convert = self.cached(convert)
+            db_col_names.append(db_col_name)
+            converters.append(convert)
+        return (db_col_names, converters)
 
     def process_file(self, english_units):
         logger.info("Reading file: " + self.filename)
         with open(self.filename) as csv_file:
-            read_csv = csv.DictReader(csv_file, delimiter=',')
+            read_csv = csv.reader(csv_file, delimiter=',')
+            header = next(read_csv, None)
+            if header is None:
+                return
+            (db_col_names, converters) = self.compile_plan(english_units, header)
+            db_entries = []
             for row in read_csv:
-                db_entry = self.convert_cols(english_units, row)
-                logger.debug("%s  -> %s" % (repr(row), repr(db_entry)))
-                self.write_entry_func(db_entry)
+                if not row:
+                    continue
+                db_entry = dict(zip(db_col_names, [convert(value) for (convert, value) in zip(converters, row)]))
+                logger.debug("%r -> %r", row, db_entry)
+                db_entries.append(db_entry)
+                if len(db_entries) >= self.batch_size:
+                    self.write_entries_func(db_entries)
+                    db_entries = []
+            if len(db_entries) > 0:
+                self.write_entries_func(db_entries)
@@ -4,7 +4,7 @@
 # copyright Tom Goetz
 #
 
-import os, logging, datetime, time
+import os, logging, datetime, time, calendar
 
 from contextlib import contextmanager
 
@@ -16,6 +16,7 @@ from sqlalchemy.orm.attributes import *
 from sqlalchemy.ext.hybrid import hybrid_property, hybrid_method
 
 from Utilities import *
+from QuantileSketch import QuantileSketch
 
 from Fit import Conversions
 
@@ -175,11 +176,151 @@ class DBObject(object):
         with db.managed_session() as session:
             cls._create_view_if_not_exists(session, view_name, query_str)
 
+    @classmethod
+    def _join_view_query_str(cls, session, selectable, join_table, order_by):
+        return str(Query(selectable, session=session).join(join_table).order_by(order_by))
+
     @classmethod
     def create_join_view(cls, db, view_name, selectable, join_table, order_by):
         with db.managed_session() as session:
-            query = Query(selectable, session=session).join(join_table).order_by(order_by)
-            cls._create_view_if_not_exists(session, view_name, str(query))
+            cls._create_view_if_not_exists(session, view_name, cls._join_view_query_str(session, selectable, join_table, order_by))
+
+    #
+    # Materialized views are tables populated from a view query. Triggers on the source tables record the keys of rows
+    # that are inserted, updated, or deleted and refresh_materialized_view recomputes only those rows.
+    #
+    @classmethod
+    def _materialized_view_dirty_table(cls, view_name):
+        return view_name + '_dirty'
+
+    @classmethod
+    def _materialized_view_trigger(cls, view_name, source_table, event):
+        return '%s_%s_%s' % (view_name, source_table, event.lower())
+
+    @classmethod
+    def _delete_materialized_view(cls, db, view_name, source_tables):
+        with db.managed_session() as session:
+            for source_table in source_tables:
+                for event in ['INSERT', 'UPDATE', 'DELETE']:
+                    session.execute('DROP TRIGGER IF EXISTS ' + cls._materialized_view_trigger(view_name, source_table, event))
+            session.execute('DROP TABLE IF EXISTS ' + cls._materialized_view_dirty_table(view_name))
+            session.execute('DROP TABLE IF EXISTS ' + view_name)
+
+    @classmethod
+    def _create_materialized_view_if_not_exists(cls, session, view_name, query_str, key_col_name, source_tables, index_col_names):
+        dirty_table = cls._materialized_view_dirty_table(view_name)
+        session.execute('CREATE TABLE IF NOT EXISTS %s AS %s' % (view_name, query_str))
+        session.execute('CREATE UNIQUE INDEX IF NOT EXISTS %s_%s ON %s (%s)' % (view_name, key_col_name, view_name, key_col_name))
+        for index_col_name in index_col_names:
+            session.execute('CREATE INDEX IF NOT EXISTS %s_%s ON %s (%s)' % (view_name, index_col_name, view_name, index_col_name))
+        session.execute('CREATE TABLE IF NOT EXISTS %s (%s INTEGER PRIMARY KEY)' % (dirty_table, key_col_name))
+        for source_table in source_tables:
+            for (event, row) in [('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')]:
+                session.execute(
+                    'CREATE TRIGGER IF NOT EXISTS %s AFTER %s ON %s BEGIN INSERT OR IGNORE INTO %s (%s) VALUES (%s.%s); END' %
+                    (cls._materialized_view_trigger(view_name, source_table, event), event, source_table, dirty_table, key_col_name, row, key_col_name)
+                )
+
+    @classmethod
+    def create_materialized_join_view(cls, db, view_name, selectable, join_table, order_by, key_col_name, source_tables, index_col_names=[]):
+        with db.managed_session() as session:
+            query_str = cls._join_view_query_str(session, selectable, join_table, order_by)
+            cls._create_materialized_view_if_not_exists(session, view_name, query_str, key_col_name, source_tables, index_col_names)
+
+    @classmethod
+    def _refresh_materialized_view(cls, session, view_name, query_str, key_col_name):
+        dirty_keys = 'SELECT %s FROM %s' % (key_col_name, cls._materialized_view_dirty_table(view_name))
+        session.execute('DELETE FROM %s WHERE %s IN (%s)' % (view_name, key_col_name, dirty_keys))
+        session.execute('INSERT INTO %s SELECT * FROM (%s) WHERE %s IN (%s)' % (view_name, query_str, key_col_name, dirty_keys))
+        session.execute('DELETE FROM ' + cls._materialized_view_dirty_table(view_name))
+
+    @classmethod
+    def refresh_materialized_join_view(cls, db, view_name, selectable, join_table, order_by, key_col_name):
+        with db.managed_session() as session:
+            query_str = cls._join_view_query_str(session, selectable, join_table, order_by)
+            cls._refresh_materialized_view(session, view_name, query_str, key_col_name)
+
+    #
+    # Rollups hold the min, max, avg, and count of a column over time buckets at several resolutions. Triggers on the
+    # source table record the days that change and refresh_rollup recomputes only those days.
+    #
+    rollup_col_name = None
+    # bucket sizes in seconds, finest first; each must divide a day evenly
+    rollup_resolutions = [300, 3600, 86400]
+
+    @classmethod
+    def _rollup_table(cls):
+        return '%s_%s_rollup' % (cls.__tablename__, cls.rollup_col_name)
+
+    @classmethod
+    def _rollup_epoch(cls, row=None):
+        time_col_name = cls.time_col_name if row is None else row + '.' + cls.time_col_name
+        return "CAST(strftime('%%s', %s) AS INTEGER)" % time_col_name
+
+    @classmethod
+    def _rollup_day(cls, row=None):
+        return '(%s / 86400 * 86400)' % cls._rollup_epoch(row)
+
+    @classmethod
+    def delete_rollup(cls, db):
+        rollup_table = cls._rollup_table()
+        with db.managed_session() as session:
+            for event in ['INSERT', 'UPDATE', 'DELETE']:
+                session.execute('DROP TRIGGER IF EXISTS ' + cls._materialized_view_trigger(rollup_table, cls.__tablename__, event))
+            session.execute('DROP TABLE IF EXISTS ' + cls._materialized_view_dirty_table(rollup_table))
+            session.execute('DROP TABLE IF EXISTS ' + rollup_table)
+
+    @classmethod
+    def create_rollup(cls, db):
+        rollup_table = cls._rollup_table()
+        dirty_table = cls._materialized_view_dirty_table(rollup_table)
+        with db.managed_session() as session:
+            session.execute('CREATE TABLE IF NOT EXISTS %s (resolution INTEGER, bucket INTEGER, min_value REAL, max_value REAL, avg_value REAL, count INTEGER, '
+                'PRIMARY KEY (resolution, bucket))' % rollup_table)
+            session.execute('CREATE TABLE IF NOT EXISTS %s (day INTEGER PRIMARY KEY)' % dirty_table)
+            for (event, row) in [('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')]:
+                session.execute(
+                    'CREATE TRIGGER IF NOT EXISTS %s AFTER %s ON %s BEGIN INSERT OR IGNORE INTO %s (day) VALUES (%s); END' %
+                    (cls._materialized_view_trigger(rollup_table, cls.__tablename__, event), event, cls.__tablename__, dirty_table, cls._rollup_day(row))
+                )
+            # a new rollup starts with every day of existing data dirty
+            if session.execute('SELECT count(*) FROM ' + rollup_table).scalar() == 0:
+                session.execute('INSERT OR IGNORE INTO %s (day) SELECT DISTINCT %s FROM %s' % (dirty_table, cls._rollup_day(), cls.__tablename__))
+
+    @classmethod
+    def refresh_rollup(cls, db):
+        rollup_table = cls._rollup_table()
+        dirty_table = cls._materialized_view_dirty_table(rollup_table)
+        dirty_days = 'SELECT day FROM ' + dirty_table
+        with db.managed_session() as session:
+            session.execute('DELETE FROM %s WHERE (bucket / 86400 * 86400) IN (%s)' % (rollup_table, dirty_days))
+            for resolution in cls.rollup_resolutions:
+                bucket = '(%s / %d * %d)' % (cls._rollup_epoch(), resolution, resolution)
+                session.execute(
+                    "INSERT INTO %s SELECT %d, %s AS bucket, min(%s), max(%s), avg(%s), count(%s) FROM %s "
+                    "WHERE %s >= (SELECT datetime(min(day), 'unixepoch') FROM %s) AND %s IN (%s) AND %s > 0 GROUP BY bucket" %
+                    (rollup_table, resolution, bucket, cls.rollup_col_name, cls.rollup_col_name, cls.rollup_col_name, cls.rollup_col_name, cls.__tablename__,
+                     cls.time_col_name, dirty_table, cls._rollup_day(), dirty_days, cls.rollup_col_name)
+                )
+            session.execute('DELETE FROM ' + dirty_table)
+
+    @classmethod
+    def get_rollup_resolution(cls, start_ts, end_ts, max_points):
+        # The finest resolution that returns no more than max_points buckets, else the coarsest.
+        period_secs = (end_ts - start_ts).total_seconds()
+        for resolution in cls.rollup_resolutions:
+            if period_secs / resolution <= max_points:
+                return resolution
+        return cls.rollup_resolutions[-1]
+
+    @classmethod
+    def get_rollup_for_period(cls, db, start_ts, end_ts, max_points):
+        resolution = cls.get_rollup_resolution(start_ts, end_ts, max_points)
+        params = {'resolution' : resolution, 'start' : calendar.timegm(start_ts.timetuple()), 'end' : calendar.timegm(end_ts.timetuple())}
+        with db.managed_session() as session:
+            rows = session.execute('SELECT bucket, min_value, max_value, avg_value, count FROM %s WHERE resolution = :resolution AND bucket >= :start '
+                'AND bucket < :end ORDER BY bucket' % cls._rollup_table(), params).fetchall()
+        return [(datetime.datetime.utcfromtimestamp(bucket), min_value, max_value, avg_value, count) for (bucket, min_value, max_value, avg_value, count) in rows]
 
     @classmethod
     def intersection(cls, values_dict):
@@ -259,6 +400,54 @@ class DBObject(object):
     def create_or_update_not_none(cls, db, values_dict):
         cls.create_or_update(db, values_dict, True)
 
+    @classmethod
+    def _insert(cls, session, values_dicts):
+        # One multi row insert. None of the rows should exist yet and all of the dicts should have the same keys.
+        if len(values_dicts) > 0:
+            session.execute(cls.__table__.insert(), values_dicts)
+
+    @classmethod
+    def _upsert(cls, session, values_dicts):
+        # Inserts or updates rows keyed on the table's primary key columns: queries for which of the keys already exist,
+        # then does one bulk insert and one bulk update. Later rows replace earlier rows with the same key.
+        key_cols = cls.__table__.primary_key.columns.values()
+        rows = {}
+        for values_dict in values_dicts:
+            key = tuple([values_dict.get(key_col.name) for key_col in key_cols])
+            if None in key:
+                logger.warning("%s::_upsert skipping row without %s: %r", cls.__name__, ', '.join([key_col.name for key_col in key_cols]), values_dict)
+            else:
+                rows[key] = values_dict
+        # existing keys are found by the first key column, the whole key is matched against the rows found
+        first_values = list(set([key[0] for key in rows.keys()]))
+        existing_keys = set()
+        # stay under SQLite's limit on query parameters
+        for start in xrange(0, len(first_values), 500):
+            query = session.query(*key_cols).filter(key_cols[0].in_(first_values[start:start + 500]))
+            existing_keys.update([tuple(row) for row in query])
+        session.bulk_insert_mappings(cls, [row for (key, row) in rows.iteritems() if key not in existing_keys])
+        session.bulk_update_mappings(cls, [row for (key, row) in rows.iteritems() if key in existing_keys])
+
+    @classmethod
+    def _delete_for_value(cls, session, col_name, value):
+        session.query(cls).filter(cls.get_col_by_name(col_name) == value).delete(synchronize_session=False)
+
+    @classmethod
+    def _delete_for_period(cls, session, start_ts, end_ts):
+        session.query(cls).filter(cls.during(start_ts, end_ts)).delete(synchronize_session=False)
+
+    @classmethod
+    def _replace_for_period(cls, session, start_ts, end_ts, values_dicts):
+        # Replaces all rows in the period with values_dicts using one delete and one multi row insert. All of the new
+        # rows' times should fall in the period.
+        cls._delete_for_period(session, start_ts, end_ts)
+        cls._insert(session, values_dicts)
+
+    @classmethod
+    def replace_for_period(cls, db, start_ts, end_ts, values_dicts):
+        with db.managed_session() as session:
+            cls._replace_for_period(session, start_ts, end_ts, values_dicts)
+
     @classmethod
     def secs_from_time(cls, col):
         return func.strftime('%s', col) - func.strftime('%s', '00:00')
@@ -313,7 +502,10 @@ class DBObject(object):
 
     @classmethod
     def _query(cls, session, selectable, order_by=None, start_ts=None, end_ts=None, ignore_le_zero_col=None):
-        query = session.query(selectable)
+        if isinstance(selectable, list):
+            query = session.query(*selectable)
+        else:
+            query = session.query(selectable)
         if order_by is not None:
             query = query.order_by(order_by)
         if start_ts is not None and end_ts is not None:
@@ -401,17 +593,110 @@ class DBObject(object):
         with db.managed_session() as session:
             return session.query(col).order_by(desc(cls.time_col)).limit(1).scalar()
 
+    #
+    # Time buckets are computed from the integer epoch seconds of the time column. A bucket is a number of seconds, one of
+    # the names in bucket_secs, or 'month'. Weeks start on Monday and months on the first of the month.
+    #
+    bucket_secs = {'minute' : 60, 'hour' : 3600, 'day' : 86400, 'week' : 604800}
+    # 1970-01-05 was the first Monday after the epoch
+    week_origin_secs = 345600
+
+    @classmethod
+    def _to_datetime(cls, ts):
+        if isinstance(ts, datetime.datetime):
+            return ts
+        return datetime.datetime.combine(ts, datetime.time.min)
+
+    @classmethod
+    def _epoch_secs(cls, ts):
+        return calendar.timegm(ts.timetuple())
+
+    @classmethod
+    def _first_bucket(cls, start_ts, bucket):
+        start_ts = cls._to_datetime(start_ts)
+        if bucket == 'month':
+            return datetime.datetime(start_ts.year, start_ts.month, 1)
+        secs = cls.bucket_secs.get(bucket, bucket)
+        origin = cls.week_origin_secs if bucket == 'week' else 0
+        start_secs = cls._epoch_secs(start_ts)
+        return datetime.datetime.utcfromtimestamp(start_secs - (start_secs - origin) % secs)
+
+    @classmethod
+    def get_bucket_starts(cls, start_ts, end_ts, bucket):
+        end_ts = cls._to_datetime(end_ts)
+        bucket_start = cls._first_bucket(start_ts, bucket)
+        bucket_starts = []
+        if bucket == 'month':
+            while bucket_start < end_ts:
+                bucket_starts.append(bucket_start)
+                bucket_start = datetime.datetime(bucket_start.year + bucket_start.month / 12, bucket_start.month % 12 + 1, 1)
+        else:
+            secs = cls.bucket_secs.get(bucket, bucket)
+            for bucket_secs in xrange(cls._epoch_secs(bucket_start), cls._epoch_secs(end_ts), secs):
+                bucket_starts.append(datetime.datetime.utcfromtimestamp(bucket_secs))
+        return bucket_starts
+
+    @classmethod
+    def _bucket_index(cls, first_bucket, bucket):
+        if bucket == 'month':
+            month = cast(func.strftime('%Y', cls.time_col), Integer) * 12 + cast(func.strftime('%m', cls.time_col), Integer)
+            return month - (first_bucket.year * 12 + first_bucket.month)
+        secs = cls.bucket_secs.get(bucket, bucket)
+        return (cast(func.strftime('%s', cls.time_col), Integer) - cls._epoch_secs(first_bucket)) / secs
+
+    @classmethod
+    def _bucketed_query(cls, session, col, agg, start_ts, end_ts, bucket, match_col=None, match_value=None, group_col=None):
+        bucket_index = cls._bucket_index(cls._first_bucket(start_ts, bucket), bucket).label('bucket')
+        if group_col is not None:
+            query = session.query(bucket_index, group_col, agg(col).label('value')).group_by(bucket_index, group_col)
+        else:
+            query = session.query(bucket_index, agg(col).label('value')).group_by(bucket_index)
+        query = query.filter(cls.during(start_ts, end_ts))
+        if match_col is not None and match_value is not None:
+            query = query.filter(match_col == match_value)
+        return query
+
+    @classmethod
+    def bucketed(cls, db, col, agg, start_ts, end_ts, bucket, match_col=None, match_value=None, fill=None):
+        # Returns a list of bucket start times and a list of the aggregate for each, fill for buckets without data.
+        bucket_starts = cls.get_bucket_starts(start_ts, end_ts, bucket)
+        values = [fill] * len(bucket_starts)
+        with db.managed_session() as session:
+            for (index, value) in cls._bucketed_query(session, col, agg, start_ts, end_ts, bucket, match_col, match_value).all():
+                if value is not None:
+                    values[index] = value
+        return (bucket_starts, values)
+
+    @classmethod
+    def get_col_daily_sketches(cls, db, col, start_ts, end_ts, ignore_le_zero=False):
+        # One grouped query counts each value per day and the counts become the day's sketch.
+        bucket_starts = cls.get_bucket_starts(start_ts, end_ts, 'day')
+        sketches = {}
+        with db.managed_session() as session:
+            query = cls._bucketed_query(session, col, func.count, start_ts, end_ts, 'day', group_col=col)
+            if ignore_le_zero:
+                query = query.filter(col > 0)
+            for (index, value, count) in query.all():
+                sketches.setdefault(bucket_starts[index].date(), QuantileSketch()).add(value, count)
+        return sketches
+
+    @classmethod
+    def get_col_sketch(cls, db, col, start_ts, end_ts, ignore_le_zero=False):
+        return QuantileSketch.merged(cls.get_col_daily_sketches(db, col, start_ts, end_ts, ignore_le_zero).values())
+
     @classmethod
     def get_col_func_of_max_per_day_for_value(cls, db, col, stat_func, start_ts, end_ts, match_col=None, match_value=None):
         with db.managed_session() as session:
-            max_daily_query = (
-                session.query(func.max(col).label('maxes'))
-                    .filter(cls.during(start_ts, end_ts))
-                    .group_by(func.strftime("%j", cls.time_col))
-            )
-            if match_col is not None and match_value is not None:
-                 max_daily_query.filter(match_col == match_value)
-            return session.query(stat_func(max_daily_query.subquery().columns.maxes)).scalar()
+            max_daily_query = cls._bucketed_query(session, col, func.max, start_ts, end_ts, 'day', match_col, match_value)
+            return session.query(stat_func(max_daily_query.subquery().columns.value)).scalar()
+
+    @classmethod
+    def get_col_max_per_day_by_value(cls, db, col, group_col, start_ts, end_ts, group_values=None):
+        with db.managed_session() as session:
+            query = cls._bucketed_query(session, col, func.max, start_ts, end_ts, 'day', group_col=group_col)
+            if group_values is not None:
+                query = query.filter(group_col.in_(group_values))
+            return query.all()
 
     @classmethod
     def get_col_sum_of_max_per_day_for_value(cls, db, col, match_col, match_value, start_ts, end_ts):
@@ -423,7 +708,7 @@ class DBObject(object):
 
     @classmethod
     def get_col_func_of_max_per_day(cls, db, col, stat_func, start_ts, end_ts):
-        return cls.get_col_func_of_max_per_day_for_value(db, col, func.sum, start_ts, end_ts)
+        return cls.get_col_func_of_max_per_day_for_value(db, col, stat_func, start_ts, end_ts)
 
     @classmethod
     def get_col_sum_of_max_per_day(cls, db, col, start_ts, end_ts):
@@ -458,6 +743,29 @@ class DBObject(object):
         with db.managed_session() as session:
             return session.query(cls).filter(cls.time_col >= start_ts).filter(cls.time_col < end_ts).count()
 
+    @classmethod
+    def get_col_func_per_day(cls, db, col, stat_func, start_ts=None, end_ts=None):
+        with db.managed_session() as session:
+            query = session.query(func.date(cls.time_col), stat_func(col)).group_by(func.date(cls.time_col))
+            if start_ts is not None:
+                query = query.filter(cls.after(start_ts))
+            if end_ts is not None:
+                query = query.filter(cls.before(end_ts))
+            return {datetime.datetime.strptime(day, '%Y-%m-%d').date() : value for (day, value) in query.all() if day is not None}
+
+    @classmethod
+    def get_row_count_per_day(cls, db, start_ts=None, end_ts=None):
+        return cls.get_col_func_per_day(db, cls.time_col, func.count, start_ts, end_ts)
+
+    @classmethod
+    def get_col_count_per_day(cls, db, col, start_ts=None, end_ts=None):
+        # the number of rows per day where col isn't null
+        return cls.get_col_func_per_day(db, col, func.count, start_ts, end_ts)
+
+    @classmethod
+    def get_col_sum_per_day(cls, db, col, start_ts=None, end_ts=None):
+        return cls.get_col_func_per_day(db, col, func.sum, start_ts, end_ts)
+
     @classmethod
     def row_count_for_day(cls, db, day_date):
         start_ts = datetime.datetime.combine(day_date, datetime.time.min)
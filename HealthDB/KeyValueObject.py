@@ -66,3 +66,10 @@ class KeyValueObject(DBObject):
         except Exception:
             return None
 
+    @classmethod
+    def get_datetime(cls, db, key):
+        try:
+            return datetime.datetime.strptime(cls.get(db, key), "%Y-%m-%d %H:%M:%S")
+        except Exception:
+            return None
+
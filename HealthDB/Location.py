@@ -4,10 +4,14 @@
 # copyright Tom Goetz
 #
 
+import math
+
 from Fit import Conversions
 
 
 class Location(object):
+    earth_radius_kms = 6371.0
+
     def __init__(self, lat_deg, long_deg):
         self.lat_deg = lat_deg
         self.long_deg = long_deg
@@ -23,3 +27,9 @@ class Location(object):
     def to_google_maps_url(self):
         return self.google_maps_url(self.lat_deg, self.long_deg)
 
+    def distance_kms(self, other):
+        # great circle distance by the haversine formula
+        lat1 = math.radians(self.lat_deg)
+        lat2 = math.radians(other.lat_deg)
+        a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(math.radians(other.long_deg - self.long_deg) / 2) ** 2
+        return 2 * self.earth_radius_kms * math.asin(math.sqrt(a))
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+
+#
+# copyright Tom Goetz
+#
+
+import math
+
+
+#
+# A mergeable sketch of a value distribution for percentile queries. Values are counted in buckets of width resolution,
+# so for integer valued monitoring data (heart rate, stress) with the default resolution the percentiles are exact and
+# the sketch size is bounded by the range of values rather than the number of samples.
+#
+class QuantileSketch():
+    percentiles = [5, 50, 95]
+
+    def __init__(self, counts=None, resolution=1):
+        self.resolution = resolution
+        self.counts = counts if counts is not None else {}
+
+    def add(self, value, count=1):
+        if value is not None:
+            bucket = int(round(value / float(self.resolution)))
+            self.counts[bucket] = self.counts.get(bucket, 0) + count
+
+    def merge(self, other):
+        for bucket, count in other.counts.iteritems():
+            self.counts[bucket] = self.counts.get(bucket, 0) + count
+        return self
+
+    @classmethod
+    def merged(cls, sketches, resolution=1):
+        sketch = cls(resolution=resolution)
+        for other in sketches:
+            sketch.merge(other)
+        return sketch
+
+    def count(self):
+        return sum(self.counts.values())
+
+    def quantile(self, quantile):
+        # nearest rank
+        total = self.count()
+        if total == 0:
+            return None
+        rank = max(int(math.ceil(quantile * total)), 1)
+        seen = 0
+        for bucket in sorted(self.counts.keys()):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                return bucket * self.resolution
+
+    def percentile_stats(self, name):
+        return {'%s_p%d' % (name, percentile) : self.quantile(percentile / 100.0) for percentile in self.percentiles}
+
+    def to_string(self):
+        return ','.join(['%d:%d' % (bucket, self.counts[bucket]) for bucket in sorted(self.counts.keys())])
+
+    @classmethod
+    def from_string(cls, sketch_str, resolution=1):
+        sketch = cls(resolution=resolution)
+        if sketch_str:
+            for bucket_count in sketch_str.split(','):
+                (bucket, count) = bucket_count.split(':')
+                sketch.counts[int(bucket)] = int(count)
+        return sketch
@@ -13,6 +13,9 @@ class SummaryBase(DBObject):
     hr_avg = Column(Float)
     hr_min = Column(Float)
     hr_max = Column(Float)
+    hr_p5 = Column(Float)
+    hr_p50 = Column(Float)
+    hr_p95 = Column(Float)
     rhr_avg = Column(Float)
     rhr_min = Column(Float)
     rhr_max = Column(Float)
@@ -34,6 +37,9 @@ class SummaryBase(DBObject):
     rem_sleep_min = Column(Time, nullable=False, default=datetime.time.min)
     rem_sleep_max = Column(Time, nullable=False, default=datetime.time.min)
     stress_avg = Column(Integer)
+    stress_p5 = Column(Float)
+    stress_p50 = Column(Float)
+    stress_p95 = Column(Float)
     calories_avg = Column(Integer)
     calories_bmr_avg = Column(Integer)
     calories_active_avg = Column(Integer)
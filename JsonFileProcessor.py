@@ -4,21 +4,50 @@
 # copyright Tom Goetz
 #
 
-import json, logging, traceback
+import json, logging, traceback, datetime, threading, Queue
 import dateutil.parser
 import progressbar
 
 import FileProcessor
 
+# optional faster JSON decoder
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
 
 logger = logging.getLogger(__file__)
 
 
+def parse_datetime(date_str):
+    # Fast path for the fixed formats Garmin uses, 'YYYY-MM-DD' and 'YYYY-MM-DDTHH:MM:SS[.fraction]', dateutil for
+    # everything else.
+    try:
+        if len(date_str) >= 10 and date_str[4] == '-' and date_str[7] == '-':
+            year, month, day = int(date_str[0:4]), int(date_str[5:7]), int(date_str[8:10])
+            if len(date_str) == 10:
+                return datetime.datetime(year, month, day)
+            if len(date_str) >= 19 and date_str[10] in 'T ' and date_str[13] == ':' and date_str[16] == ':':
+                fraction = date_str[19:]
+                if fraction == '' or (fraction[0] == '.' and fraction[1:].isdigit()):
+                    microsecond = int((fraction[1:] + '000000')[:6]) if fraction else 0
+                    return datetime.datetime(year, month, day, int(date_str[11:13]), int(date_str[14:16]), int(date_str[17:19]), microsecond)
+    except ValueError:
+        pass
+    return dateutil.parser.parse(date_str)
+
+
 class JsonFileProcessor(object):
+    # files parsed ahead of the DB updates
+    parse_ahead = 32
+    # files whose DB updates are committed together
+    commit_files = 32
 
     def __init__(self, input_file, input_dir, file_regex, latest, debug, recursive=False):
         self.debug = debug
         logger.info("Debug: %s" % str(debug))
+        self.file_names = []
         if input_file:
             self.file_names = FileProcessor.FileProcessor.match_file(input_file, file_regex)
             logger.info("Found %d json files for %s in %s", self.file_count(), file_regex, input_file)
@@ -29,14 +58,35 @@ class JsonFileProcessor(object):
     def file_count(self):
         return len(self.file_names)
 
+    def convert(self, json_data, keys, conversion_func):
+        if not isinstance(json_data, dict):
+            return
+        key = keys[0]
+        if key.endswith('[]'):
+            entries = json_data.get(key[:-2], None)
+            if isinstance(entries, list):
+                for entry in entries:
+                    self.convert(entry, keys[1:], conversion_func)
+        elif len(keys) > 1:
+            self.convert(json_data.get(key, None), keys[1:], conversion_func)
+        else:
+            value = json_data.get(key, None)
+            if value is not None:
+                json_data[key] = conversion_func(value)
+
+    def load_json(self, file):
+        if ujson is not None:
+            return ujson.loads(file.read(), precise_float=True)
+        return json.load(file)
+
     def parse_file(self, filename):
-        def parser(entry):
-            for (conversion_key, conversion_func) in self.conversions.iteritems():
-                entry_value = entry.get(conversion_key, None)
-                if entry_value is not None:
-                    entry[conversion_key] = conversion_func(entry_value)
-            return entry
-        return json.load(open(filename), object_hook=parser)
+        # Conversions are keyed by the path of the value to convert: dict keys separated by '.' with '[]' after a key
+        # whose value is a list to convert each element of the list. Only those paths are visited.
+        with FileProcessor.FileProcessor.open_file(filename) as file:
+            json_data = self.load_json(file)
+        for (conversion_path, conversion_func) in self.conversions.iteritems():
+            self.convert(json_data, conversion_path.split('.'), conversion_func)
+        return json_data
 
     def get_field(self, json, fieldname, format_func=str):
         try:
@@ -67,19 +117,72 @@ class JsonFileProcessor(object):
     def commit(self):
         pass
 
+    def rollback(self):
+        pass
+
+    def process_json_file(self, file_name, json_data):
+        updates = self.process_json(json_data)
+        if updates > 0:
+            logger.info("DB updated with %d entries from %s", updates, file_name)
+        else:
+            logger.info("No data saved for %s", file_name)
+
+    def parse_files(self, parsed_queue):
+        for file_name in self.file_names:
+            try:
+                parsed_queue.put((file_name, self.parse_file(file_name), None))
+            except Exception as e:
+                parsed_queue.put((file_name, None, traceback.format_exc()))
+        parsed_queue.put((None, None, None))
+
+    def parsed_files(self):
+        # files are parsed on a separate thread while the previous files' updates are written to the DB
+        parsed_queue = Queue.Queue(self.parse_ahead)
+        parser = threading.Thread(target=self.parse_files, args=(parsed_queue,), name='json_parser')
+        parser.daemon = True
+        parser.start()
+        while True:
+            (file_name, json_data, error) = parsed_queue.get()
+            if file_name is None:
+                break
+            yield (file_name, json_data, error)
+
+    def reapply(self, batch):
+        # Reapplies a batch's files after a rollback and returns the files that were reapplied. A file that fails is dropped,
+        # which rolls back the files reapplied before it, so they're reapplied again.
+        for (index, (file_name, json_data)) in enumerate(batch):
+            try:
+                self.process_json_file(file_name, json_data)
+            except Exception as e:
+                logger.error("Failed to import %s: %s", file_name, traceback.format_exc())
+                self.failed_files.append(file_name)
+                self.rollback()
+                return self.reapply(batch[:index] + batch[index + 1:])
+        return batch
+
     def process_files(self):
         logger.info("Processing %d json files", self.file_count())
-        for file_name in progressbar.progressbar(self.file_names):
+        # files that failed to parse or import
+        self.failed_files = []
+        batch = []
+        for (file_name, json_data, error) in progressbar.progressbar(self.parsed_files(), max_value=self.file_count()):
+            if error is not None:
+                logger.error("Failed to parse %s: %s", file_name, error)
+                self.failed_files.append(file_name)
+                continue
             try:
-                json_data = self.parse_file(file_name)
-                updates = self.process_json(json_data)
-                if updates > 0:
-                    logger.info("DB updated with %d entries from %s", updates, file_name)
-                else:
-                    logger.info("No data saved for %s", file_name)
+                self.process_json_file(file_name, json_data)
+                batch.append((file_name, json_data))
             except Exception as e:
-                logger.error("Failed to parse %s: %s", file_name, traceback.format_exc())
-            self.commit()
+                logger.error("Failed to import %s: %s", file_name, traceback.format_exc())
+                self.failed_files.append(file_name)
+                # drop the failed file's partial updates and reapply the rest of its batch
+                self.rollback()
+                batch = self.reapply(batch)
+            if len(batch) >= self.commit_files:
+                self.commit()
+                batch = []
+        self.commit()
         logger.info("DB updated with %d entries.", self.file_count())
 
     def process(self):
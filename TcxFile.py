@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+
+#
+# copyright Tom Goetz
+#
+
+import logging, datetime
+import xml.etree.cElementTree as ElementTree
+
+import FileProcessor
+from JsonFileProcessor import parse_datetime
+
+
+logger = logging.getLogger(__file__)
+
+
+def parse_time(time_str):
+    # TCX times are UTC, the timezone is dropped
+    if time_str.endswith('Z'):
+        time_str = time_str[:-1]
+    return parse_datetime(time_str).replace(tzinfo=None)
+
+def local_name(tag):
+    # drop the '{namespace}' prefix ElementTree puts on tags
+    return tag[tag.find('}') + 1:]
+
+
+#
+# Streams the laps and trackpoints of a TCX file. Each element is dropped from the tree as soon as it has been read so
+# memory use doesn't grow with the length of the activity. Activity wide values are accumulated while reading and are
+# complete once messages() is exhausted.
+#
+class TcxFile(object):
+    # element paths, relative to the Lap, Trackpoint, or Creator element, mapped to the key and type of their values
+    lap_fields = {
+        'TotalTimeSeconds'              : ('moving_time', float),
+        'DistanceMeters'                : ('distance', float),
+        'MaximumSpeed'                  : ('max_speed', float),
+        'Calories'                      : ('calories', int),
+        'AverageHeartRateBpm/Value'     : ('avg_hr', int),
+        'MaximumHeartRateBpm/Value'     : ('max_hr', int),
+        'Cadence'                       : ('avg_cadence', int),
+        'Extensions/LX/AvgSpeed'        : ('avg_speed', float),
+        'Extensions/LX/AvgRunCadence'   : ('avg_cadence', int),
+        'Extensions/LX/MaxRunCadence'   : ('max_cadence', int),
+        'Extensions/LX/MaxBikeCadence'  : ('max_cadence', int),
+    }
+    trackpoint_fields = {
+        'Time'                          : ('timestamp', parse_time),
+        'Position/LatitudeDegrees'      : ('position_lat', float),
+        'Position/LongitudeDegrees'     : ('position_long', float),
+        'AltitudeMeters'                : ('altitude', float),
+        'DistanceMeters'                : ('distance', float),
+        'HeartRateBpm/Value'            : ('hr', int),
+        'Cadence'                       : ('cadence', int),
+        'Extensions/TPX/Speed'          : ('speed', float),
+        'Extensions/TPX/RunCadence'     : ('cadence', int),
+    }
+    creator_fields = {
+        'Name'                          : ('creator', str),
+        'Version/VersionMajor'          : ('creator_version', int),
+    }
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.sport = None
+        self.creator = None
+        self.creator_version = None
+        self.started_at = None
+        self.completed_at = None
+        self.laps = 0
+        self.distance = None
+        self.calories = None
+        self.hr_avg = None
+        self.hr_max = None
+        self.cadence_avg = None
+        self.cadence_max = None
+        self.start_latitude = None
+        self.start_longitude = None
+        self.end_latitude = None
+        self.end_longitude = None
+        self.hr_sum = 0
+        self.hr_count = 0
+        self.cadence_sum = 0
+        self.cadence_count = 0
+
+    def add(self, name, value):
+        if value is not None:
+            current = getattr(self, name)
+            setattr(self, name, value if current is None else current + value)
+
+    def largest(self, current, value):
+        if current is None or (value is not None and value > current):
+            return value
+        return current
+
+    def start_lap(self, element):
+        start_time = element.get('StartTime')
+        return {'start_time' : parse_time(start_time) if start_time is not None else None}
+
+    def end_trackpoint(self, lap, trackpoint):
+        timestamp = trackpoint.get('timestamp')
+        if timestamp is not None:
+            if self.started_at is None:
+                self.started_at = timestamp
+            self.completed_at = timestamp
+            lap['stop_time'] = timestamp
+        if trackpoint.get('position_lat') is not None and trackpoint.get('position_long') is not None:
+            if 'start_lat' not in lap:
+                lap['start_lat'] = trackpoint['position_lat']
+                lap['start_long'] = trackpoint['position_long']
+            lap['stop_lat'] = trackpoint['position_lat']
+            lap['stop_long'] = trackpoint['position_long']
+            if self.start_latitude is None:
+                self.start_latitude = trackpoint['position_lat']
+                self.start_longitude = trackpoint['position_long']
+            self.end_latitude = trackpoint['position_lat']
+            self.end_longitude = trackpoint['position_long']
+        hr = trackpoint.get('hr')
+        if hr is not None:
+            self.hr_sum += hr
+            self.hr_count += 1
+            self.hr_max = self.largest(self.hr_max, hr)
+        cadence = trackpoint.get('cadence')
+        if cadence is not None:
+            self.cadence_sum += cadence
+            self.cadence_count += 1
+            self.cadence_max = self.largest(self.cadence_max, cadence)
+            lap['trackpoint_max_cadence'] = self.largest(lap.get('trackpoint_max_cadence'), cadence)
+
+    def end_lap(self, lap):
+        self.laps += 1
+        trackpoint_max_cadence = lap.pop('trackpoint_max_cadence', None)
+        if lap.get('max_cadence') is None:
+            lap['max_cadence'] = trackpoint_max_cadence
+        if lap.get('start_time') is not None:
+            if self.started_at is None or lap['start_time'] < self.started_at:
+                self.started_at = lap['start_time']
+            if lap.get('stop_time') is None and lap.get('moving_time') is not None:
+                lap['stop_time'] = lap['start_time'] + datetime.timedelta(seconds=lap['moving_time'])
+            if lap.get('stop_time') is not None:
+                lap['elapsed_time'] = (lap['stop_time'] - lap['start_time']).total_seconds()
+        self.completed_at = self.largest(self.completed_at, lap.get('stop_time'))
+        self.add('distance', lap.get('distance'))
+        self.add('calories', lap.get('calories'))
+
+    def end_activity(self):
+        if self.hr_count > 0:
+            self.hr_avg = float(self.hr_sum) / self.hr_count
+        if self.cadence_count > 0:
+            self.cadence_avg = float(self.cadence_sum) / self.cadence_count
+
+    def messages(self):
+        # Yields ('record', values) for each trackpoint and ('lap', values) for each lap, after the lap's records.
+        path = []
+        elements = []
+        # the (fields, values, path depth) of the Lap, Trackpoint, or Creator being read
+        contexts = []
+        lap = None
+        creator = {}
+        with FileProcessor.FileProcessor.open_file(self.filename) as file:
+            for (event, element) in ElementTree.iterparse(file, ('start', 'end')):
+                tag = local_name(element.tag)
+                if event == 'start':
+                    path.append(tag)
+                    elements.append(element)
+                    if tag == 'Activity':
+                        self.sport = element.get('Sport')
+                    elif tag == 'Lap':
+                        lap = self.start_lap(element)
+                        contexts.append((self.lap_fields, lap, len(path)))
+                    elif tag == 'Trackpoint':
+                        contexts.append((self.trackpoint_fields, {}, len(path)))
+                    elif tag == 'Creator' and lap is None:
+                        # the Activity's Creator, not a Lap's
+                        contexts.append((self.creator_fields, creator, len(path)))
+                    continue
+                if contexts:
+                    (fields, values, depth) = contexts[-1]
+                    if len(path) == depth:
+                        contexts.pop()
+                        if tag == 'Trackpoint':
+                            self.end_trackpoint(lap if lap is not None else {}, values)
+                            yield ('record', values)
+                        elif tag == 'Lap':
+                            self.end_lap(values)
+                            yield ('lap', values)
+                            lap = None
+                    elif element.text is not None:
+                        field = fields.get('/'.join(path[depth:]))
+                        if field is not None:
+                            (key, convert) = field
+                            try:
+                                values[key] = convert(element.text.strip())
+                            except ValueError:
+                                logger.warning("%s: bad %s value %s", self.filename, key, repr(element.text))
+                path.pop()
+                elements.pop()
+                if elements:
+                    # read elements are always the first child of their parent
+                    elements[-1].remove(element)
+        self.creator = creator.get('creator')
+        self.creator_version = creator.get('creator_version')
+        self.end_activity()
@@ -0,0 +1,357 @@
+#!/usr/bin/env python
+
+#
+# copyright Tom Goetz
+#
+
+import sys, logging, datetime
+import numpy as np
+
+import Fit
+import GarminDB
+
+
+logger = logging.getLogger(__file__)
+logger.addHandler(logging.StreamHandler(stream=sys.stdout))
+
+
+def time_to_secs(time):
+    if time is not None:
+        return (time.hour * 60 + time.minute) * 60 + time.second
+    return 0
+
+def dts_to_epoch_secs(dts):
+    return np.array(dts, dtype='datetime64[s]').astype(np.int64)
+
+
+class HeartRateProfile():
+    # Values are whole bpm so that small changes in the data they're derived from don't force recalculations.
+    # Used when the attributes and the data don't give a value.
+    default_resting_hr = 60
+    default_max_hr = 185
+
+    def __init__(self, garmin_db, garmin_act_db):
+        self.resting_hr = self._get_value(GarminDB.Attributes.get(garmin_db, 'resting_hr'),
+            GarminDB.RestingHeartRate.get_col_avg(garmin_db, GarminDB.RestingHeartRate.resting_heart_rate, None, None, True),
+            self.default_resting_hr)
+        self.max_hr = self._get_value(GarminDB.Attributes.get(garmin_db, 'max_hr'),
+            GarminDB.Activities.get_col_max(garmin_act_db, GarminDB.Activities.max_hr),
+            self.default_max_hr)
+        gender = GarminDB.Attributes.get(garmin_db, 'Gender')
+        self.female = gender is not None and 'female' in gender.lower()
+        logger.info("HR profile: resting %d max %d female %s", self.resting_hr, self.max_hr, str(self.female))
+
+    def _get_value(self, attribute, data_value, default):
+        for value in [attribute, data_value]:
+            if value is not None:
+                try:
+                    return float(round(float(value)))
+                except ValueError:
+                    pass
+        return default
+
+    def hr_for_reserve_fraction(self, fraction):
+        return self.resting_hr + fraction * (self.max_hr - self.resting_hr)
+
+    def hr_reserve_fraction(self, hr):
+        return np.clip((hr - self.resting_hr) / float(self.max_hr - self.resting_hr), 0.0, 1.0)
+
+    def trimp(self, minutes, hr):
+        # Banister's training impulse with the gender specific weighting.
+        hrr = self.hr_reserve_fraction(hr)
+        if self.female:
+            return minutes * hrr * 0.86 * np.exp(1.67 * hrr)
+        return minutes * hrr * 0.64 * np.exp(1.92 * hrr)
+
+
+class ActivityRecordsArrays():
+    # Records further apart than this are assumed to be a pause and are only credited with this much time.
+    max_record_gap_secs = 60
+    # Keep the number of bound parameters in a query below SQLite's limit.
+    max_activities_per_query = 500
+
+    def __init__(self, rows, col_count, tracks=[]):
+        # tracks are (activity id, epoch secs, column arrays) from compact activity tracks
+        rows = [row for row in rows if row[1] is not None]
+        activity_ids = [np.array([row[0] for row in rows], dtype=np.int64)]
+        secs = [dts_to_epoch_secs([row[1] for row in rows])]
+        cols = [[np.array([row[index] for row in rows], dtype=np.float64)] for index in xrange(2, col_count + 2)]
+        for (activity_id, track_secs, track_cols) in tracks:
+            activity_ids.append(np.full(len(track_secs), activity_id, dtype=np.int64))
+            secs.append(track_secs)
+            for (col, track_col) in zip(cols, track_cols):
+                col.append(track_col)
+        activity_ids = np.concatenate(activity_ids)
+        secs = np.concatenate(secs)
+        order = np.lexsort((secs, activity_ids))
+        self.activity_ids = activity_ids[order]
+        self.secs = secs[order]
+        self.cols = [np.concatenate(col)[order] for col in cols]
+        (self.unique_activity_ids, self.activity_index) = np.unique(self.activity_ids, return_inverse=True)
+
+    @classmethod
+    def track_arrays(cls, tracks, cols):
+        track_arrays = []
+        for track in tracks:
+            arrays = GarminDB.ActivityTracks.decode(track.track)
+            timestamps = arrays['timestamp']
+            valid = ~np.isnat(timestamps)
+            track_arrays.append((track.activity_id, timestamps[valid].astype(np.int64), [arrays[col.name][valid] for col in cols]))
+        return track_arrays
+
+    @classmethod
+    def for_period(cls, garmin_act_db, start_ts, end_ts=None, cols=[]):
+        records_table = GarminDB.ActivityRecords
+        tracks = GarminDB.ActivityTracks.get_for_period(garmin_act_db, GarminDB.ActivityTracks, start_ts, end_ts)
+        return cls(records_table.get_for_period(garmin_act_db, [records_table.activity_id, records_table.timestamp] + cols, start_ts, end_ts), len(cols),
+            cls.track_arrays(tracks, cols))
+
+    @classmethod
+    def for_activities(cls, garmin_act_db, activity_ids, cols=[]):
+        rows = []
+        tracks = []
+        for index in xrange(0, len(activity_ids), cls.max_activities_per_query):
+            rows += GarminDB.ActivityRecords.get_for_activities(garmin_act_db, activity_ids[index:index + cls.max_activities_per_query], cols)
+            tracks += GarminDB.ActivityTracks.get_for_activities(garmin_act_db, activity_ids[index:index + cls.max_activities_per_query])
+        return cls(rows, len(cols), cls.track_arrays(tracks, cols))
+
+    def record_secs(self):
+        # The time each record represents: the time since the previous record of the same activity.
+        durations = np.zeros(len(self.secs))
+        if len(self.secs) > 1:
+            same_activity = self.activity_ids[1:] == self.activity_ids[:-1]
+            durations[1:] = np.where(same_activity, np.clip(np.diff(self.secs), 0, self.max_record_gap_secs), 0)
+        return durations
+
+    def sum_per_activity(self, values):
+        return dict(zip(self.unique_activity_ids, np.bincount(self.activity_index, weights=values, minlength=len(self.unique_activity_ids))))
+
+
+class TrainingLoad():
+    acute_days = 7
+    chronic_days = 42
+    monotony_days = 7
+
+    def __init__(self, db_params_dict, debug):
+        self.garmin_db = GarminDB.GarminDB(db_params_dict, debug)
+        self.garmin_act_db = GarminDB.ActivitiesDB(db_params_dict, debug)
+        self.garmin_sum_db = GarminDB.GarminSummaryDB(db_params_dict, debug)
+        self.hr_profile = HeartRateProfile(self.garmin_db, self.garmin_act_db)
+
+    def day_counts(self, start_ts=None):
+        # Returns a dict of day to (activities, heart rate records). Records imported after an activity's summary change
+        # the day's counts even though its activities don't.
+        activity_counts = GarminDB.Activities.get_row_count_per_day(self.garmin_act_db, start_ts)
+        record_counts = GarminDB.ActivityRecords.get_col_count_per_day(self.garmin_act_db, GarminDB.ActivityRecords.hr, start_ts)
+        for (day, records) in GarminDB.ActivityTracks.get_col_sum_per_day(self.garmin_act_db, GarminDB.ActivityTracks.records, start_ts).iteritems():
+            record_counts[day] = record_counts.get(day, 0) + records
+        return {day : (activity_counts.get(day, 0), record_counts.get(day, 0)) for day in set(activity_counts.keys()) | set(record_counts.keys())}
+
+    def first_changed_day(self):
+        # The first day whose counts differ from the counts the stored load was computed with. None if all days have to be
+        # calculated because the stored load was computed with a different heart rate profile.
+        stored_rows = GarminDB.TrainingLoad.get_for_period(self.garmin_sum_db, GarminDB.TrainingLoad, None, None)
+        if any([row.resting_hr != self.hr_profile.resting_hr or row.max_hr != self.hr_profile.max_hr for row in stored_rows]):
+            logger.info("HR profile changed, recalculating all training load")
+            return None
+        day_counts = self.day_counts()
+        stored_counts = {row.day : (row.activities, row.records) for row in stored_rows}
+        changed_days = [day for day in set(day_counts.keys()) | set(stored_counts.keys()) if day_counts.get(day, (0, 0)) != stored_counts.get(day, (0, 0))]
+        if len(changed_days) > 0:
+            return min(changed_days)
+        latest_day = GarminDB.TrainingLoad.latest_time(self.garmin_sum_db)
+        if latest_day is not None:
+            return latest_day + datetime.timedelta(1)
+
+    def activities_trimp(self, start_ts):
+        records = ActivityRecordsArrays.for_period(self.garmin_act_db, start_ts, None, [GarminDB.ActivityRecords.hr])
+        hr = records.cols[0]
+        minutes = np.where(np.isnan(hr), 0.0, records.record_secs() / 60.0)
+        records_trimp = records.sum_per_activity(self.hr_profile.trimp(minutes, np.nan_to_num(hr)))
+        activities = GarminDB.Activities.get_for_period(self.garmin_act_db, GarminDB.Activities, start_ts, None)
+        activities_trimp = []
+        for activity in activities:
+            trimp = records_trimp.get(activity.activity_id, 0.0)
+            if trimp == 0.0 and activity.avg_hr is not None:
+                trimp = self.hr_profile.trimp(time_to_secs(activity.elapsed_time) / 60.0, activity.avg_hr)
+            activities_trimp.append((activity.start_time.date(), trimp))
+        return activities_trimp
+
+    @classmethod
+    def ewma(cls, loads, days, seed):
+        # Exponentially weighted moving average as a convolution with a decaying kernel plus the decayed seed value.
+        decay = np.exp(-1.0 / days)
+        powers = decay ** np.arange(len(loads))
+        return np.convolve(loads, (1 - decay) * powers)[:len(loads)] + seed * powers * decay
+
+    @classmethod
+    def monotony_and_strain(cls, loads, previous_loads):
+        window = np.ones(cls.monotony_days)
+        all_loads = np.concatenate((previous_loads, loads))
+        week_sums = np.convolve(all_loads, window, 'valid')[-len(loads):]
+        week_sq_sums = np.convolve(all_loads ** 2, window, 'valid')[-len(loads):]
+        means = week_sums / cls.monotony_days
+        stds = np.sqrt(np.maximum(week_sq_sums / cls.monotony_days - means ** 2, 0.0))
+        monotony = np.where(stds > 0, means / np.where(stds > 0, stds, 1.0), np.nan)
+        return (monotony, week_sums * monotony)
+
+    def calculate(self, overwrite=False):
+        start_day = None if overwrite else self.first_changed_day()
+        if start_day is None:
+            first_activity = GarminDB.Activities.get_col_min(self.garmin_act_db, GarminDB.Activities.start_time)
+            if first_activity is None:
+                return
+            start_day = first_activity.date()
+        end_day = datetime.date.today()
+        if start_day > end_day:
+            return
+        logger.info("Calculating training load from %s", str(start_day))
+        day_count = (end_day - start_day).days + 1
+        start_ts = datetime.datetime.combine(start_day, datetime.time.min)
+        activities_trimp = self.activities_trimp(start_ts)
+        day_indexes = np.array([(day - start_day).days for (day, trimp) in activities_trimp], dtype=np.int64)
+        trimp_values = np.array([trimp for (day, trimp) in activities_trimp], dtype=np.float64)
+        loads = np.bincount(day_indexes, weights=trimp_values, minlength=day_count)[:day_count]
+        activity_counts = np.bincount(day_indexes, minlength=day_count)[:day_count]
+        day_counts = self.day_counts(start_ts)
+        # seed the rolling values from the stored days before the recalculated period
+        previous_rows = GarminDB.TrainingLoad.get_for_period(self.garmin_sum_db, GarminDB.TrainingLoad,
+            start_day - datetime.timedelta(self.monotony_days - 1), start_day)
+        previous_loads = np.zeros(self.monotony_days - 1)
+        for row in previous_rows:
+            previous_loads[(row.day - start_day).days + self.monotony_days - 1] = row.trimp
+        previous_row = previous_rows[-1] if len(previous_rows) > 0 and previous_rows[-1].day == start_day - datetime.timedelta(1) else None
+        acute_load = self.ewma(loads, self.acute_days, previous_row.acute_load if previous_row else 0.0)
+        chronic_load = self.ewma(loads, self.chronic_days, previous_row.chronic_load if previous_row else 0.0)
+        (monotony, strain) = self.monotony_and_strain(loads, previous_loads)
+        with self.garmin_sum_db.managed_session() as session:
+            for index in xrange(day_count):
+                day_load = {
+                    'day'           : start_day + datetime.timedelta(index),
+                    'activities'    : int(activity_counts[index]),
+                    'records'       : day_counts.get(start_day + datetime.timedelta(index), (0, 0))[1],
+                    'trimp'         : float(loads[index]),
+                    'acute_load'    : float(acute_load[index]),
+                    'chronic_load'  : float(chronic_load[index]),
+                    'monotony'      : float(monotony[index]) if not np.isnan(monotony[index]) else None,
+                    'strain'        : float(strain[index]) if not np.isnan(strain[index]) else None,
+                    'resting_hr'    : self.hr_profile.resting_hr,
+                    'max_hr'        : self.hr_profile.max_hr,
+                }
+                GarminDB.TrainingLoad._create_or_update(session, day_load)
+        logger.info("Training load updated for %d days", day_count)
+
+
+class HeartRateZones():
+    # The lower bound of each zone as a fraction of heart rate reserve.
+    zone_hrr_fractions = [0.5, 0.6, 0.7, 0.8, 0.9]
+    activities_per_batch = 200
+
+    def __init__(self, db_params_dict, debug):
+        self.garmin_db = GarminDB.GarminDB(db_params_dict, debug)
+        self.garmin_act_db = GarminDB.ActivitiesDB(db_params_dict, debug)
+        hr_profile = HeartRateProfile(self.garmin_db, self.garmin_act_db)
+        self.zone_hrs = [int(round(hr_profile.hr_for_reserve_fraction(fraction))) for fraction in self.zone_hrr_fractions]
+        logger.info("HR zones: %s", repr(self.zone_hrs))
+
+    @classmethod
+    def time_in_zones(cls, records, zone_hrs):
+        # Returns a dict of activity id to an array of seconds spent in each zone. Time below zone 1 is dropped.
+        hr = records.cols[0]
+        secs = np.where(np.isnan(hr), 0.0, records.record_secs())
+        zones = np.digitize(np.nan_to_num(hr), zone_hrs)
+        zone_count = len(zone_hrs) + 1
+        activity_count = len(records.unique_activity_ids)
+        zone_secs = np.bincount(records.activity_index * zone_count + zones, weights=secs, minlength=activity_count * zone_count)
+        return dict(zip(records.unique_activity_ids, zone_secs.reshape(activity_count, zone_count)[:, 1:]))
+
+    def activities_to_update(self, overwrite):
+        activity_ids = set(GarminDB.ActivityRecords.get_col_distinct(self.garmin_act_db, GarminDB.ActivityRecords.activity_id))
+        activity_ids.update(GarminDB.ActivityTracks.get_col_distinct(self.garmin_act_db, GarminDB.ActivityTracks.activity_id))
+        if not overwrite:
+            # skip activities already calculated with the current zones
+            for activity_id, zone_hrs in GarminDB.ActivityHrZones.get_all_zone_hrs(self.garmin_act_db).iteritems():
+                if zone_hrs == self.zone_hrs:
+                    activity_ids.discard(activity_id)
+        return sorted(activity_ids)
+
+    def calculate(self, overwrite=False):
+        activity_ids = self.activities_to_update(overwrite)
+        logger.info("Calculating HR zones for %d activities", len(activity_ids))
+        for index in xrange(0, len(activity_ids), self.activities_per_batch):
+            records = ActivityRecordsArrays.for_activities(self.garmin_act_db, activity_ids[index:index + self.activities_per_batch], [GarminDB.ActivityRecords.hr])
+            time_in_zones = self.time_in_zones(records, self.zone_hrs)
+            with self.garmin_act_db.managed_session() as session:
+                for activity_id, zone_secs in time_in_zones.iteritems():
+                    hr_zones = {'activity_id' : int(activity_id)}
+                    for zone, secs in enumerate(zone_secs, 1):
+                        hr_zones['hrz_%d_hr' % zone] = self.zone_hrs[zone - 1]
+                        hr_zones['hrz_%d_time' % zone] = Fit.Conversions.secs_to_dt_time(int(round(secs)))
+                    GarminDB.ActivityHrZones._create_or_update(session, hr_zones)
+
+
+class BestEfforts():
+    activities_per_batch = 200
+
+    def __init__(self, db_params_dict, debug):
+        self.garmin_db = GarminDB.GarminDB(db_params_dict, debug)
+        self.garmin_act_db = GarminDB.ActivitiesDB(db_params_dict, debug)
+        # record distances are in kms or miles depending on the measurement system
+        if GarminDB.Attributes.measurements_type_metric(self.garmin_db):
+            self.meters_per_unit = 1000.0
+        else:
+            self.meters_per_unit = 1609.344
+
+    @classmethod
+    def efforts(cls, records, effort_meters):
+        # Returns a dict of activity id to (start secs, elapsed secs) of the fastest stretch covering effort_meters.
+        # Each activity's cumulative distance is offset past the previous one's so one searchsorted handles all of them.
+        distance = records.cols[0]
+        valid = ~np.isnan(distance)
+        activity_index = records.activity_index[valid]
+        secs = records.secs[valid]
+        distance = distance[valid]
+        activity_count = len(records.unique_activity_ids)
+        max_distance = np.zeros(activity_count)
+        np.maximum.at(max_distance, activity_index, distance)
+        offsets = np.concatenate(([0.0], np.cumsum(max_distance + effort_meters + 1.0)))[:-1]
+        cum_distance = np.maximum.accumulate(distance + offsets[activity_index])
+        start = np.searchsorted(cum_distance, cum_distance - effort_meters, side='right') - 1
+        in_activity = start >= 0
+        in_activity[in_activity] = activity_index[start[in_activity]] == activity_index[in_activity]
+        if not np.any(in_activity):
+            return {}
+        end = np.nonzero(in_activity)[0]
+        start = start[end]
+        elapsed = secs[end] - secs[start]
+        # the first entry per activity after sorting by activity then elapsed time is the fastest
+        order = np.lexsort((elapsed, activity_index[end]))
+        sorted_activities = activity_index[end][order]
+        fastest = order[np.concatenate(([True], sorted_activities[1:] != sorted_activities[:-1]))]
+        return {records.unique_activity_ids[activity_index[end[index]]] : (secs[start[index]], elapsed[index]) for index in fastest}
+
+    def activities_to_update(self, overwrite):
+        activity_sports = GarminDB.Activities.get_sports(self.garmin_act_db, GarminDB.ActivityBestEfforts.sports)
+        if not overwrite:
+            for activity_id in GarminDB.ActivityBestEfforts.get_activity_ids(self.garmin_act_db):
+                activity_sports.pop(activity_id, None)
+        return activity_sports
+
+    def calculate(self, overwrite=False):
+        activity_sports = self.activities_to_update(overwrite)
+        activity_ids = sorted(activity_sports.keys())
+        logger.info("Calculating best efforts for %d activities", len(activity_ids))
+        for index in xrange(0, len(activity_ids), self.activities_per_batch):
+            records = ActivityRecordsArrays.for_activities(self.garmin_act_db, activity_ids[index:index + self.activities_per_batch], [GarminDB.ActivityRecords.distance])
+            records.cols[0] *= self.meters_per_unit
+            with self.garmin_act_db.managed_session() as session:
+                for effort, effort_meters in GarminDB.ActivityBestEfforts.efforts.iteritems():
+                    for activity_id, (start_secs, elapsed_secs) in self.efforts(records, effort_meters).iteritems():
+                        best_effort = {
+                            'activity_id'   : int(activity_id),
+                            'effort'        : effort,
+                            'sport'         : activity_sports[activity_id],
+                            'start_time'    : datetime.datetime.utcfromtimestamp(int(start_secs)),
+                            'elapsed_time'  : Fit.Conversions.secs_to_dt_time(int(elapsed_secs)),
+                        }
+                        GarminDB.ActivityBestEfforts._create_or_update(session, best_effort)
@@ -21,12 +21,42 @@ logger.addHandler(logging.StreamHandler(stream=sys.stdout))
 
 class Analyze():
     def __init__(self, db_params_dict, debug):
-        self.garmin_db = GarminDB.GarminDB(db_params_dict, debug)
-        self.garmin_mon_db = GarminDB.MonitoringDB(db_params_dict, debug)
-        self.garmin_sum_db = GarminDB.GarminSummaryDB(db_params_dict, debug)
-        self.sum_db = HealthDB.SummaryDB(db_params_dict, debug)
-        self.garmin_act_db = GarminDB.ActivitiesDB(db_params_dict, debug)
-        self.english_units = (GarminDB.Attributes.measurements_type_metric(self.garmin_db) == False)
+        self.db_params_dict = db_params_dict
+        self.debug = debug
+        self.dbs = {}
+        self._english_units = None
+
+    # DBs are opened the first time they're used so a stage only opens the DBs it needs.
+    def get_db(self, db_class):
+        if db_class not in self.dbs:
+            self.dbs[db_class] = db_class(self.db_params_dict, self.debug)
+        return self.dbs[db_class]
+
+    @property
+    def garmin_db(self):
+        return self.get_db(GarminDB.GarminDB)
+
+    @property
+    def garmin_mon_db(self):
+        return self.get_db(GarminDB.MonitoringDB)
+
+    @property
+    def garmin_sum_db(self):
+        return self.get_db(GarminDB.GarminSummaryDB)
+
+    @property
+    def sum_db(self):
+        return self.get_db(HealthDB.SummaryDB)
+
+    @property
+    def garmin_act_db(self):
+        return self.get_db(GarminDB.ActivitiesDB)
+
+    @property
+    def english_units(self):
+        if self._english_units is None:
+            self._english_units = (GarminDB.Attributes.measurements_type_metric(self.garmin_db) == False)
+        return self._english_units
 
     def set_sleep_period(self, sleep_period_start, sleep_period_stop):
         GarminDB.Attributes.set_if_unset(self.garmin_db, 'sleep_time', sleep_period_start)
@@ -66,7 +96,8 @@ class Analyze():
         laps = GarminDB.ActivityLaps.row_count(self.garmin_act_db)
         logger.info("Activities lap records: %d", laps)
         self.save_summary_stat('Activity_laps', laps)
-        records = GarminDB.ActivityRecords.row_count(self.garmin_act_db)
+        # activities imported with compact records keep them in tracks instead of rows
+        records = GarminDB.ActivityRecords.row_count(self.garmin_act_db) + GarminDB.ActivityTracks.record_count(self.garmin_act_db)
         logger.info("Activity records: %d", records)
         self.save_summary_stat('Activity_records', records)
         years = GarminDB.Activities.get_years(self.garmin_act_db)
@@ -201,6 +232,26 @@ class Analyze():
             return stat1
         return stat1 + stat2
 
+    def percentile_cols(self):
+        return [
+            ('hr', GarminDB.MonitoringHeartRate, self.garmin_mon_db, GarminDB.MonitoringHeartRate.heart_rate),
+            ('stress', GarminDB.Stress, self.garmin_db, GarminDB.Stress.stress),
+        ]
+
+    def calculate_day_percentiles(self, day_date):
+        stats = {}
+        for (name, table, db, col) in self.percentile_cols():
+            sketch = table.get_col_sketch(db, col, day_date, day_date + datetime.timedelta(1), True)
+            GarminDB.DailySketch.set_sketch(self.garmin_sum_db, day_date, name, sketch)
+            stats.update(sketch.percentile_stats(name))
+        return stats
+
+    def merge_percentiles(self, start_day_date, end_day_date):
+        stats = {}
+        for (name, table, db, col) in self.percentile_cols():
+            stats.update(GarminDB.DailySketch.get_merged(self.garmin_sum_db, name, start_day_date, end_day_date).percentile_stats(name))
+        return stats
+
     def calculate_day_stats(self, day_date):
         self.populate_hr_intensity(day_date)
         stats = GarminDB.MonitoringHeartRate.get_daily_stats(self.garmin_mon_db, day_date)
@@ -215,6 +266,7 @@ class Analyze():
         stats.update(GarminDB.Stress.get_daily_stats(self.garmin_db, day_date))
         stats.update(GarminDB.MonitoringInfo.get_daily_stats(self.garmin_mon_db, day_date))
         stats.update(GarminDB.Activities.get_daily_stats(self.garmin_act_db, day_date))
+        stats.update(self.calculate_day_percentiles(day_date))
         stats['calories_avg'] = self.combine_stats(stats, 'calories_bmr_avg', 'calories_active_avg')
         # calculate hr for inactive periods
         GarminDB.Monitoring.get_daily_stats(self.garmin_mon_db, day_date)
@@ -235,6 +287,7 @@ class Analyze():
         stats.update(GarminDB.Stress.get_weekly_stats(self.garmin_db, day_date))
         stats.update(GarminDB.MonitoringInfo.get_weekly_stats(self.garmin_mon_db, day_date))
         stats.update(GarminDB.Activities.get_weekly_stats(self.garmin_act_db, day_date))
+        stats.update(self.merge_percentiles(day_date, day_date + datetime.timedelta(7)))
         stats['calories_avg'] = self.combine_stats(stats, 'calories_bmr_avg', 'calories_active_avg')
         GarminDB.WeeksSummary.create_or_update_not_none(self.garmin_sum_db, stats)
         HealthDB.WeeksSummary.create_or_update_not_none(self.sum_db, stats)
@@ -252,6 +305,7 @@ class Analyze():
         stats.update(GarminDB.Stress.get_monthly_stats(self.garmin_db, start_day_date, end_day_date))
         stats.update(GarminDB.MonitoringInfo.get_monthly_stats(self.garmin_mon_db, start_day_date, end_day_date))
         stats.update(GarminDB.Activities.get_monthly_stats(self.garmin_act_db, start_day_date, end_day_date))
+        stats.update(self.merge_percentiles(start_day_date, end_day_date + datetime.timedelta(1)))
         stats['calories_avg'] = self.combine_stats(stats, 'calories_bmr_avg', 'calories_active_avg')
         GarminDB.MonthsSummary.create_or_update_not_none(self.garmin_sum_db, stats)
         HealthDB.MonthsSummary.create_or_update_not_none(self.sum_db, stats)
@@ -4,7 +4,8 @@
 # copyright Tom Goetz
 #
 
-import os, sys, getopt, re, logging, datetime, time, tempfile, zipfile, json, subprocess, platform
+import os, sys, getopt, re, logging, datetime, time, tempfile, zipfile, json, subprocess, platform, threading, Queue
+from multiprocessing.pool import ThreadPool
 import dateutil.parser
 import requests
 import progressbar
@@ -18,6 +19,7 @@ except ImportError:
 
 import GarminDBConfigManager
 import GarminDB
+from FileProcessor import FileProcessor
 from Fit import Conversions
 
 
@@ -26,6 +28,89 @@ logger.addHandler(logging.StreamHandler(stream=sys.stdout))
 root_logger = logging.getLogger()
 
 
+#
+# A token bucket shared by all requests. The rate is halved when the server pushes back with a 429 or 5xx response and
+# climbs back toward the configured rate as requests succeed.
+#
+class RateLimiter():
+    # how far the rate can be cut below the configured rate
+    min_rate_fraction = 1.0 / 16
+
+    def __init__(self, rate, burst=1):
+        self.max_rate = float(rate)
+        self.rate = self.max_rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.last_refill = time.time()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.time()
+        self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def backoff(self):
+        with self.lock:
+            self._refill()
+            self.rate = max(self.rate / 2, self.max_rate * self.min_rate_fraction)
+            self.tokens = min(self.tokens, 0)
+        logger.info("Download rate reduced to %f requests per second", self.rate)
+
+    def recover(self):
+        with self.lock:
+            if self.rate < self.max_rate:
+                self._refill()
+                self.rate = min(self.rate + self.max_rate * self.min_rate_fraction, self.max_rate)
+
+
+#
+# Writes files on a background thread so that download threads go back to the network instead of waiting on the disk.
+# The listener is called with each filename once its file has been written.
+#
+class FileWriter():
+
+    def __init__(self, listener=None):
+        self.listener = listener
+        self.queue = Queue.Queue()
+        self.thread = threading.Thread(target=self.write_files, name='file_writer')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def write(self, filename, data):
+        self.queue.put((filename, data))
+
+    def write_files(self):
+        while True:
+            (filename, data) = self.queue.get()
+            try:
+                with FileProcessor.open_file(filename, 'wb') as file:
+                    file.write(data)
+                if self.listener is not None:
+                    self.listener(filename)
+            except Exception as e:
+                logger.error("Failed to write %s: %s", filename, str(e))
+            finally:
+                self.queue.task_done()
+
+    def flush(self):
+        # wait until all queued files have been written
+        self.queue.join()
+
+
+class DownloadCancelled(Exception):
+    pass
+
+
 class Download():
 
     garmin_connect_base_url = "https://connect.garmin.com"
@@ -79,27 +164,99 @@ class Download():
         'Accept'        : 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8'
     }
 
+    # attempts at a request that the server answers with 429 or 5xx
+    max_tries = 4
+
+    # days downloaded per request for stats whose endpoints take a date range
+    range_days = 28
+
+    # requests in flight per endpoint for endpoints that should see less than the download concurrency
+    endpoint_concurrency = {
+        garmin_connect_download_url : 2,
+    }
+
     def __init__(self):
         self.temp_dir = tempfile.mkdtemp()
         logger.debug("__init__: temp_dir= " + self.temp_dir)
+        self.concurrency = GarminDBConfigManager.get_download_concurrency()
+        self.rate_limiter = RateLimiter(GarminDBConfigManager.get_download_rate())
+        self.compress_json = GarminDBConfigManager.get_compress_json()
         self.session = requests.session()
+        # keep a connection per concurrent download in the session's pool
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=self.concurrency)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.endpoint_semaphores = {url : threading.BoundedSemaphore(limit) for url, limit in self.endpoint_concurrency.iteritems()}
+        self.cancelled = threading.Event()
+        # called with the name of every file downloaded or unzipped
+        self.file_listener = None
+        self.file_writer = FileWriter(self.file_saved)
+
+    def file_saved(self, filename):
+        if self.file_listener is not None:
+            self.file_listener(filename)
 
     def get_activity_details_url(self, activity_id):
         return self.garmin_connect_modern_proxy_url + '/activity-service/activity/%s' % str(activity_id)
 
+    def cancel(self):
+        # requests not yet sent fail with DownloadCancelled, requests in flight complete
+        self.cancelled.set()
+
+    def flush(self):
+        self.file_writer.flush()
+
+    def endpoint_semaphore(self, url):
+        endpoints = [endpoint for endpoint in self.endpoint_semaphores if url.startswith(endpoint)]
+        if len(endpoints) > 0:
+            return self.endpoint_semaphores[max(endpoints, key=len)]
+
+    def send(self, method, url, headers, params, data):
+        if self.cancelled.is_set():
+            raise DownloadCancelled(url)
+        self.rate_limiter.acquire()
+        semaphore = self.endpoint_semaphore(url)
+        if semaphore is None:
+            return method(url, headers=headers, params=params, data=data)
+        with semaphore:
+            return method(url, headers=headers, params=params, data=data)
+
+    def request(self, method, url, headers, params, data=None):
+        for attempt in xrange(self.max_tries):
+            response = self.send(method, url, headers, params, data)
+            logger.debug("%s: %s (%d)", method.__name__, response.url, response.status_code)
+            if response.status_code != 429 and response.status_code < 500:
+                self.rate_limiter.recover()
+                break
+            logger.warning("%s: %s throttled (%d)", method.__name__, response.url, response.status_code)
+            self.rate_limiter.backoff()
+        return response
+
     def get(self, url, aaditional_headers={}, params={}):
         total_headers = self.default_headers.copy()
         total_headers.update(aaditional_headers)
-        response = self.session.get(url, headers=total_headers, params=params)
-        logger.debug("get: %s (%d)", response.url, response.status_code)
-        return response
+        return self.request(self.session.get, url, total_headers, params)
 
     def post(self, url, aaditional_headers, params, data):
         total_headers = self.default_headers.copy()
         total_headers.update(aaditional_headers)
-        response = self.session.post(url, headers=total_headers, params=params, data=data)
-        logger.debug("post: %s (%d)", response.url, response.status_code)
-        return response
+        return self.request(self.session.post, url, total_headers, params, data)
+
+    def run_concurrently(self, function, items):
+        # Calls function on each item with up to concurrency calls in flight. The rate limiter paces the requests.
+        # A cancel only stops the call it happened in.
+        self.cancelled.clear()
+        pool = ThreadPool(self.concurrency)
+        try:
+            return list(progressbar.progressbar(pool.imap(function, items), max_value=len(items)))
+        except BaseException:
+            # stop the remaining items instead of waiting for them to download
+            self.cancel()
+            raise
+        finally:
+            pool.close()
+            pool.join()
+            self.flush()
 
     def get_json(self, page_html, key):
         found = re.search(key + r" = JSON.parse\(\"(.*)\"\);", page_html, re.M)
@@ -192,6 +349,7 @@ class Download():
         self.user_prefs = self.get_json(response.text, 'VIEWER_USERPREFERENCES')
         if profile_dir:
             self.save_json_file(profile_dir + "/profile.json", self.user_prefs)
+            self.flush()
         self.display_name = self.user_prefs['displayName']
         self.english_units = (self.user_prefs['measurementSystem'] == 'statute_us')
         self.social_profile = self.get_json(response.text, 'VIEWER_SOCIAL_PROFILE')
@@ -208,13 +366,14 @@ class Download():
         return object.__str__()
 
     def save_json_file(self, json_full_filname, json_data):
-        with open(json_full_filname, 'w') as file:
-            root_logger.info("save_json_file: %s", json_full_filname)
-            file.write(json.dumps(json_data, default=self.convert_to_json))
+        if self.compress_json:
+            json_full_filname += FileProcessor.compressed_extension
+        root_logger.info("save_json_file: %s", json_full_filname)
+        self.file_writer.write(json_full_filname, json.dumps(json_data, default=self.convert_to_json))
 
     def download_json_file(self, job_name, url, params, json_filename, overwite):
         json_full_filname = json_filename + '.json'
-        if not os.path.isfile(json_full_filname) or overwite:
+        if not FileProcessor.file_exists(json_full_filname) or overwite:
             response = self.get(url, params=params)
             if response.status_code == 200:
                 self.save_json_file(json_full_filname, response.json())
@@ -223,22 +382,102 @@ class Download():
                 return False
         return True
 
+    def unzip_file(self, zip_filename, outdir):
+        files_zip = zipfile.ZipFile(zip_filename, 'r')
+        files_zip.extractall(outdir)
+        for filename in files_zip.namelist():
+            self.file_saved(outdir + "/" + filename)
+        files_zip.close()
+
+    def monitoring_archive_filename(self, outdir, date):
+        return outdir + '/monitoring_' + date.strftime('%Y-%m') + '.zip'
+
+    def archive_file(self, zip_filename, archive_filename):
+        # adds the files in a downloaded zip to a larger archive instead of extracting them
+        files_zip = zipfile.ZipFile(zip_filename, 'r')
+        archive = zipfile.ZipFile(archive_filename, 'a', zipfile.ZIP_DEFLATED)
+        archived_files = set(archive.namelist())
+        filenames = [filename for filename in files_zip.namelist() if filename not in archived_files]
+        for filename in filenames:
+            archive.writestr(filename, files_zip.read(filename))
+        archive.close()
+        files_zip.close()
+        for filename in filenames:
+            self.file_saved(archive_filename + "/" + filename)
+
+    def archive_monitoring_files(self, outdir):
+        logger.info("archive_monitoring_files: " + outdir)
+        for filename in os.listdir(self.temp_dir):
+            match = re.search(r'(\d{4}-\d{2}-\d{2})\.zip', filename)
+            if match:
+                date = datetime.datetime.strptime(match.group(1), '%Y-%m-%d').date()
+                self.archive_file(self.temp_dir + "/" + filename, self.monitoring_archive_filename(outdir, date))
+                os.remove(self.temp_dir + "/" + filename)
+
     def unzip_files(self, outdir):
         logger.info("unzip_files: " + outdir)
         for filename in os.listdir(self.temp_dir):
             match = re.search('.*\.zip', filename)
             if match:
-                files_zip = zipfile.ZipFile(self.temp_dir + "/" + filename, 'r')
-                files_zip.extractall(outdir)
-                files_zip.close()
+                self.unzip_file(self.temp_dir + "/" + filename, outdir)
+                os.remove(self.temp_dir + "/" + filename)
+
+    def download_json_range(self, job_name, url, params, json_filename, start, end, day_function, overwite):
+        # Downloads the days start through end with one request and saves each day to its own file as if it had been
+        # downloaded on its own.
+        days = [start + datetime.timedelta(day) for day in xrange((end - start).days + 1)]
+        json_full_filenames = {day : json_filename + day.strftime('%Y-%m-%d') + '.json' for day in days}
+        missing_days = [day for day in days if not FileProcessor.file_exists(json_full_filenames[day]) or overwite]
+        if len(missing_days) > 0:
+            response = self.get(url, params=params)
+            if response.status_code != 200:
+                logger.error("%s: %s failed (%d): %s", job_name, response.url, response.status_code, response.text)
+                return False
+            json_data = response.json()
+            for day in missing_days:
+                self.save_json_file(json_full_filenames[day], day_function(json_data, day))
+        return True
+
+    def day_ranges(self, days):
+        # splits sorted days into runs of consecutive days no longer than range_days
+        ranges = []
+        for day in days:
+            if len(ranges) > 0 and day == ranges[-1][1] + datetime.timedelta(1) and (day - ranges[-1][0]).days < self.range_days:
+                ranges[-1] = (ranges[-1][0], day)
+            else:
+                ranges.append((day, day))
+        return ranges
+
+    def run_stat(self, function, items):
+        # Stops at the first item that fails. When running concurrently the items already in flight still complete.
+        # Returns False if an item failed.
+        failed_items = []
+        def run_item(item):
+            if len(failed_items) == 0 and not function(item):
+                failed_items.append(item)
+        if self.concurrency > 1:
+            self.run_concurrently(run_item, items)
+        else:
+            for item in progressbar.progressbar(items):
+                run_item(item)
+                if len(failed_items) > 0:
+                    break
+            self.flush()
+        if len(failed_items) > 0:
+            logger.error("Download stopped after failing for %s", ', '.join([str(item) for item in failed_items]))
+        return len(failed_items) == 0
+
+    def get_stat_days(self, stat_function, directory, days, overwite):
+        return self.run_stat(lambda current_date: stat_function(directory, current_date, overwite), days)
 
     def get_stat(self, stat_function, directory, date, days, overwite):
-        for day in progressbar.progressbar(xrange(0, days + 1)):
-            current_date = date + datetime.timedelta(days=day)
-            if not stat_function(directory, current_date, overwite):
-                break
-            # pause for a second between every page access
-            time.sleep(1)
+        return self.get_stat_days(stat_function, directory, date_range(date, days), overwite)
+
+    def get_stat_ranges_days(self, range_function, directory, days, overwite):
+        return self.run_stat(lambda (start, end): range_function(directory, start, end, overwite), self.day_ranges(days))
+
+    def get_stat_ranges(self, range_function, directory, date, days, overwite):
+        return self.get_stat_ranges_days(range_function, directory, date_range(date, days), overwite)
 
     def get_summary_day(self, directory, date, overwite=False):
         root_logger.info("get_summary_day: %s", str(date))
@@ -258,15 +497,16 @@ class Download():
         root_logger.info("get_monitoring_day: %s", str(date))
         response = self.get(self.garmin_connect_download_daily_url + '/' + date.strftime("%Y-%m-%d"))
         if response and response.status_code == 200:
-            self.save_binary_file(self.temp_dir + '/' + str(date) + '.zip', response)
+            zip_filename = self.temp_dir + '/' + str(date) + '.zip'
+            self.save_binary_file(zip_filename, response)
+            return zip_filename
+
+    def get_monitoring_days(self, days):
+        self.run_concurrently(self.get_monitoring_day, days)
 
     def get_monitoring(self, date, days):
         logger.info("Geting monitoring: %s (%d)", str(date), days)
-        for day in progressbar.progressbar(xrange(0, days + 1)):
-            day_date = date + datetime.timedelta(day)
-            self.get_monitoring_day(day_date)
-            # pause for a second between every page access
-            time.sleep(1)
+        self.get_monitoring_days(date_range(date, days))
 
     def get_weight_day(self, directory, day, overwite=False):
         date_str = day.strftime('%Y-%m-%d')
@@ -277,9 +517,31 @@ class Download():
         }
         return self.download_json_file('get_weight_day', self.garmin_connect_weight_url, params, directory + '/weight_' + date_str, overwite)
 
+    def weight_day(self, weight):
+        if 'calendarDate' in weight:
+            return dateutil.parser.parse(weight['calendarDate']).date()
+        return datetime.datetime.utcfromtimestamp(weight['date'] / 1000).date()
+
+    def weight_for_day(self, json_data, day):
+        date_str = day.strftime('%Y-%m-%d')
+        return {
+            'startDate'         : date_str,
+            'endDate'           : date_str,
+            'dateWeightList'    : [weight for weight in json_data['dateWeightList'] if self.weight_day(weight) == day]
+        }
+
+    def get_weight_range(self, directory, start, end, overwite=False):
+        params = {
+            'startDate' : start.strftime('%Y-%m-%d'),
+            'endDate'   : end.strftime('%Y-%m-%d'),
+            '_'         : str(Conversions.dt_to_epoch_ms(Conversions.date_to_dt(start)))
+        }
+        return self.download_json_range('get_weight_range', self.garmin_connect_weight_url, params, directory + '/weight_', start, end, self.weight_for_day,
+                                        overwite)
+
     def get_weight(self, directory, date, days, overwite):
         logger.info("Geting weight: %s (%d)", str(date), days)
-        self.get_stat(self.get_weight_day, directory, date, days, overwite)
+        self.get_stat_ranges(self.get_weight_range, directory, date, days, overwite)
 
     def get_activity_summaries(self, start, count):
         root_logger.info("get_activity_summaries")
@@ -304,22 +566,22 @@ class Download():
         else:
             logger.error("save_activity_file: %s failed (%d): %s", response.url, response.status_code, response.text)
 
+    def get_activity(self, directory, activity, overwite=False):
+        activity_id_str = str(activity['activityId'])
+        activity_name_str = Conversions.printable(activity['activityName'])
+        root_logger.info("get_activities: %s (%s)" % (activity_name_str, activity_id_str))
+        json_filename = directory + '/activity_' + activity_id_str + '.json'
+        if not FileProcessor.file_exists(json_filename) or overwite:
+            root_logger.debug("get_activities: %s <- %s" % (json_filename, repr(activity)))
+            self.save_activity_details(directory, activity_id_str, overwite)
+            self.save_json_file(json_filename, activity)
+            if not os.path.isfile(directory + '/' + activity_id_str + '.fit') or overwite:
+                self.save_activity_file(activity_id_str)
+
     def get_activities(self, directory, count, overwite=False):
         logger.info("Geting activities: '%s' (%d)", directory, count)
         activities = self.get_activity_summaries(0, count)
-        for activity in progressbar.progressbar(activities):
-            activity_id_str = str(activity['activityId'])
-            activity_name_str = Conversions.printable(activity['activityName'])
-            root_logger.info("get_activities: %s (%s)" % (activity_name_str, activity_id_str))
-            json_filename = directory + '/activity_' + activity_id_str + '.json'
-            if not os.path.isfile(json_filename) or overwite:
-                root_logger.debug("get_activities: %s <- %s" % (json_filename, repr(activity)))
-                self.save_activity_details(directory, activity_id_str, overwite)
-                self.save_json_file(json_filename, activity)
-                if not os.path.isfile(directory + '/' + activity_id_str + '.fit') or overwite:
-                    self.save_activity_file(activity_id_str)
-                # pause for a second between every page access
-                time.sleep(1)
+        self.run_concurrently(lambda activity: self.get_activity(directory, activity, overwite), activities)
 
     def get_activity_types(self, directory, overwite):
         root_logger.info("get_activity_types: '%s'", directory)
@@ -346,9 +608,129 @@ class Download():
         }
         return self.download_json_file('get_rhr_day', self.garmin_connect_rhr_url + '/' + self.display_name, params, json_filename, overwite)
 
+    def rhr_for_day(self, json_data, day):
+        date_str = day.strftime('%Y-%m-%d')
+        rhr_list = json_data['allMetrics']['metricsMap']['WELLNESS_RESTING_HEART_RATE']
+        return {
+            'statisticsStartDate'   : date_str,
+            'statisticsEndDate'     : date_str,
+            'allMetrics'            : {
+                'metricsMap' : {
+                    'WELLNESS_RESTING_HEART_RATE' : [rhr for rhr in rhr_list if rhr.get('calendarDate') == date_str]
+                }
+            }
+        }
+
+    def get_rhr_range(self, directory, start, end, overwite=False):
+        params = {
+            'fromDate'  : start.strftime('%Y-%m-%d'),
+            'untilDate' : end.strftime('%Y-%m-%d'),
+            'metricId'  : 60
+        }
+        return self.download_json_range('get_rhr_range', self.garmin_connect_rhr_url + '/' + self.display_name, params, directory + '/rhr_', start, end,
+                                        self.rhr_for_day, overwite)
+
     def get_rhr(self, directory, date, days, overwite):
         logger.info("Geting rhr: %s (%d)", str(date), days)
-        self.get_stat(self.get_rhr_day, directory, date, days, overwite)
+        self.get_stat_ranges(self.get_rhr_range, directory, date, days, overwite)
+
+#
+# Plans downloads down to the day. A day is downloaded if it's not in the DB and its file hasn't already been downloaded,
+# so gaps anywhere in the history are filled. Directory listings are cached in the DB directory and only reread when a
+# directory changes.
+#
+class DownloadPlanner():
+    listing_cache_filename = 'download_listing.json'
+
+    # stat name: (DB class, table, directory function, downloaded file regex)
+    stats = {
+        'monitoring'    : (GarminDB.MonitoringDB, GarminDB.Monitoring, GarminDBConfigManager.get_monitoring_base_dir, r'daily_summary_(\d{4}-\d{2}-\d{2})\.json(\.gz)?$'),
+        'sleep'         : (GarminDB.GarminDB, GarminDB.Sleep, GarminDBConfigManager.get_sleep_dir, r'sleep_(\d{4}-\d{2}-\d{2})\.json(\.gz)?$'),
+        'weight'        : (GarminDB.GarminDB, GarminDB.Weight, GarminDBConfigManager.get_weight_dir, r'weight_(\d{4}-\d{2}-\d{2})\.json(\.gz)?$'),
+        'rhr'           : (GarminDB.GarminDB, GarminDB.RestingHeartRate, GarminDBConfigManager.get_rhr_dir, r'rhr_(\d{4}-\d{2}-\d{2})\.json(\.gz)?$'),
+    }
+
+    def __init__(self, db_params_dict, overwite):
+        self.db_params_dict = db_params_dict
+        self.overwite = overwite
+        self.listing_cache_file = GarminDBConfigManager.get_db_dir() + os.sep + self.listing_cache_filename
+        try:
+            with open(self.listing_cache_file) as file:
+                self.listing_cache = json.load(file)
+        except (IOError, ValueError):
+            self.listing_cache = {}
+
+    def save_listing_cache(self):
+        with open(self.listing_cache_file, 'w') as file:
+            file.write(json.dumps(self.listing_cache))
+
+    def dir_listing(self, directory):
+        # returns the names of the files in directory and its subdirectories
+        if not os.path.isdir(directory):
+            return []
+        mtime = os.path.getmtime(directory)
+        listing = self.listing_cache.get(directory)
+        if listing is None or listing['mtime'] != mtime:
+            filenames = os.listdir(directory)
+            listing = {
+                'mtime' : mtime,
+                'files' : [filename for filename in filenames if not os.path.isdir(directory + os.sep + filename)],
+                'dirs'  : [filename for filename in filenames if os.path.isdir(directory + os.sep + filename)]
+            }
+            self.listing_cache[directory] = listing
+        files = list(listing['files'])
+        for subdir in listing['dirs']:
+            files += self.dir_listing(directory + os.sep + subdir)
+        return files
+
+    def file_days(self, stat_name):
+        (db_class, table, dir_function, file_regex) = self.stats[stat_name]
+        days = set()
+        for filename in self.dir_listing(dir_function()):
+            match = re.search(file_regex, filename)
+            if match:
+                days.add(datetime.datetime.strptime(match.group(1), '%Y-%m-%d').date())
+        return days
+
+    def db_days(self, stat_name, start, end):
+        (db_class, table, dir_function, file_regex) = self.stats[stat_name]
+        start_ts = datetime.datetime.combine(start, datetime.time.min)
+        end_ts = datetime.datetime.combine(end + datetime.timedelta(1), datetime.time.min)
+        return set(table.get_row_count_per_day(db_class(self.db_params_dict), start_ts, end_ts).keys())
+
+    def missing_days(self, stat_name, start, end):
+        days = date_range(start, (end - start).days)
+        if not self.overwite:
+            present_days = self.db_days(stat_name, start, end) | self.file_days(stat_name)
+            days = [day for day in days if day not in present_days]
+            self.save_listing_cache()
+        logger.info("Planned %d of %d days for %s", len(days), (end - start).days + 1, stat_name)
+        return days
+
+    def latest_day(self, stat_name):
+        (db_class, table, dir_function, file_regex) = self.stats[stat_name]
+        latest_ts = table.latest_time(db_class(self.db_params_dict))
+        if isinstance(latest_ts, datetime.datetime):
+            return latest_ts.date()
+        return latest_ts
+
+    def plan(self, stat_name, start, end, latest=False, gaps=False):
+        # Returns a list of (days, overwite) to download. With latest, the latest day in the DB through today is downloaded
+        # again since it may have only been partly synced, and the days before it are only checked when gaps is set.
+        latest_day = self.latest_day(stat_name) if latest else None
+        if latest_day is None:
+            return [(self.missing_days(stat_name, start, end), self.overwite)]
+        today = datetime.date.today()
+        latest_day = min(latest_day, today)
+        logger.info("Planned %s through %s for %s", str(latest_day), str(today), stat_name)
+        plan = [(date_range(latest_day, (today - latest_day).days), True)]
+        if gaps and start < latest_day:
+            plan.insert(0, (self.missing_days(stat_name, start, latest_day - datetime.timedelta(1)), self.overwite))
+        return plan
+
+
+def date_range(date, days):
+    return [date + datetime.timedelta(day) for day in xrange(0, days + 1)]
 
 def get_secure_password():
     system = platform.system()
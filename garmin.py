@@ -4,15 +4,10 @@
 # copyright Tom Goetz
 #
 
-import logging, sys, getopt, datetime, dateutil.parser
+import logging, sys, getopt, datetime, itertools, dateutil.parser
 
-from download_garmin import Download
-from import_garmin import GarminProfile, GarminWeightData, GarminSummaryData, GarminMonitoringExtraData, GarminMonitoringFitData, GarminSleepData, GarminRhrData
-from import_garmin_activities import GarminJsonSummaryData, GarminJsonDetailsData, GarminActivitiesExtraData, GarminTcxData, GarminActivitiesFitData
-from analyze_garmin import Analyze
-
-import HealthDB
-import GarminDB
+# The download, import, and analyze stacks are imported by the stage that uses them so that running one stage doesn't
+# pay for loading the others.
 import GarminDBConfigManager
 
 try:
@@ -34,29 +29,20 @@ def config_start_date(type):
     days = GarminConnectConfig.data['download_days']
     return (date, days)
 
-def get_date_and_days(latest, db, table, stat_name):
-    if latest:
-        last_ts = table.latest_time(db)
-        if last_ts is None:
-            date, days = config_start_date(stat_name)
-            logger.info("Automatic date not found, using: %s : %s for %s", str(date), str(days), stat_name)
-        else:
-            # start from the day after the last day in the DB
-            logger.info("Automatically downloading %s data from: %s", stat_name, str(last_ts))
-            if stat_name == 'monitoring':
-                date = last_ts.date()
-                days = (datetime.datetime.now() - last_ts).days
-            else:
-                date = last_ts
-                days = (datetime.date.today() - last_ts).days
-    else:
-        date, days = config_start_date(stat_name)
+def download_plan(planner, latest, gaps, stat_name):
+    date, days = config_start_date(stat_name)
     if date is None or days is None:
         print "Missing config: need %s_start_date and download_days. Edit GarminConnectConfig.py." % stat_name
         sys.exit()
-    return (date, days)
+    if gaps:
+        # check for missing days all the way back to the start date
+        days = (datetime.date.today() - date).days
+    plan = planner.plan(stat_name, date, date + datetime.timedelta(days), latest, gaps)
+    return [(plan_days, plan_overwite) for (plan_days, plan_overwite) in plan if len(plan_days) > 0]
+
+def download_data(overwite, latest, gaps, weight, monitoring, sleep, rhr, activities):
+    from download_garmin import Download, DownloadPlanner
 
-def download_data(overwite, latest, weight, monitoring, sleep, rhr, activities):
     db_params_dict = GarminDBConfigManager.get_db_params()
 
     download = Download()
@@ -64,53 +50,63 @@ def download_data(overwite, latest, weight, monitoring, sleep, rhr, activities):
         logger.error("Failed to login!")
         sys.exit()
 
-    if activities:
-        if latest:
-            activity_count = GarminConnectConfig.data['download_latest_activities']
-        else:
-            activity_count = GarminConnectConfig.data['download_all_activities']
-        activities_dir = GarminDBConfigManager.get_or_create_activities_dir()
-        root_logger.info("Fetching %d activities to %s", activity_count, activities_dir)
-        download.get_activity_types(activities_dir, overwite)
-        download.get_activities(activities_dir, activity_count, overwite)
-        download.unzip_files(activities_dir)
-
-    if monitoring:
-        date, days = get_date_and_days(latest, GarminDB.MonitoringDB(db_params_dict), GarminDB.Monitoring, 'monitoring')
-        if days > 0:
-            monitoring_dir = GarminDBConfigManager.get_or_create_monitoring_dir(date.year)
-            root_logger.info("Date range to update: %s (%d) to %s", str(date), days, monitoring_dir)
-            download.get_daily_summaries(monitoring_dir, date, days, overwite)
-            download.get_monitoring(date, days)
-            download.unzip_files(monitoring_dir)
-            root_logger.info("Saved monitoring files for %s (%d) to %s for processing", str(date), days, monitoring_dir)
-
-    if sleep:
-        date, days = get_date_and_days(latest, GarminDB.GarminDB(db_params_dict), GarminDB.Sleep, 'sleep')
-        if days > 0:
-            sleep_dir = GarminDBConfigManager.get_or_create_sleep_dir()
-            root_logger.info("Date range to update: %s (%d) to %s", str(date), days, sleep_dir)
-            download.get_sleep(sleep_dir, date, days, overwite)
-            root_logger.info("Saved sleep files for %s (%d) to %s for processing", str(date), days, sleep_dir)
-
-    if weight:
-        date, days = get_date_and_days(latest, GarminDB.GarminDB(db_params_dict), GarminDB.Weight, 'weight')
-        if days > 0:
-            weight_dir = GarminDBConfigManager.get_or_create_weight_dir()
-            root_logger.info("Date range to update: %s (%d) to %s", str(date), days, weight_dir)
-            download.get_weight(weight_dir, date, days, overwite)
-            root_logger.info("Saved weight files for %s (%d) to %s for processing", str(date), days, weight_dir)
-
-    if rhr:
-        date, days = get_date_and_days(latest, GarminDB.GarminDB(db_params_dict), GarminDB.RestingHeartRate, 'rhr')
-        if days > 0:
-            rhr_dir = GarminDBConfigManager.get_or_create_rhr_dir()
-            root_logger.info("Date range to update: %s (%d) to %s", str(date), days, rhr_dir)
-            download.get_rhr(rhr_dir, date, days, overwite)
-            root_logger.info("Saved rhr files for %s (%d) to %s for processing", str(date), days, rhr_dir)
+    try:
+        if activities:
+            if latest:
+                activity_count = GarminConnectConfig.data['download_latest_activities']
+            else:
+                activity_count = GarminConnectConfig.data['download_all_activities']
+            activities_dir = GarminDBConfigManager.get_or_create_activities_dir()
+            root_logger.info("Fetching %d activities to %s", activity_count, activities_dir)
+            download.get_activity_types(activities_dir, overwite)
+            download.get_activities(activities_dir, activity_count, overwite)
+            download.unzip_files(activities_dir)
+
+        planner = DownloadPlanner(db_params_dict, overwite)
+
+        if monitoring:
+            for (days, days_overwite) in download_plan(planner, latest, gaps, 'monitoring'):
+                for year, year_days in itertools.groupby(days, lambda day: day.year):
+                    year_days = list(year_days)
+                    monitoring_dir = GarminDBConfigManager.get_or_create_monitoring_dir(year)
+                    root_logger.info("Days to update: %s - %s (%d) to %s", str(year_days[0]), str(year_days[-1]), len(year_days), monitoring_dir)
+                    download.get_stat_days(download.get_summary_day, monitoring_dir, year_days, days_overwite)
+                    download.get_monitoring_days(year_days)
+                    if GarminDBConfigManager.get_monitoring_archives():
+                        download.archive_monitoring_files(monitoring_dir)
+                    else:
+                        download.unzip_files(monitoring_dir)
+                    root_logger.info("Saved monitoring files for %d days to %s for processing", len(year_days), monitoring_dir)
+
+        if sleep:
+            for (days, days_overwite) in download_plan(planner, latest, gaps, 'sleep'):
+                sleep_dir = GarminDBConfigManager.get_or_create_sleep_dir()
+                root_logger.info("Days to update: %s - %s (%d) to %s", str(days[0]), str(days[-1]), len(days), sleep_dir)
+                download.get_stat_days(download.get_sleep_day, sleep_dir, days, days_overwite)
+                root_logger.info("Saved sleep files for %d days to %s for processing", len(days), sleep_dir)
+
+        if weight:
+            for (days, days_overwite) in download_plan(planner, latest, gaps, 'weight'):
+                weight_dir = GarminDBConfigManager.get_or_create_weight_dir()
+                root_logger.info("Days to update: %s - %s (%d) to %s", str(days[0]), str(days[-1]), len(days), weight_dir)
+                download.get_stat_ranges_days(download.get_weight_range, weight_dir, days, days_overwite)
+                root_logger.info("Saved weight files for %d days to %s for processing", len(days), weight_dir)
+
+        if rhr:
+            for (days, days_overwite) in download_plan(planner, latest, gaps, 'rhr'):
+                rhr_dir = GarminDBConfigManager.get_or_create_rhr_dir()
+                root_logger.info("Days to update: %s - %s (%d) to %s", str(days[0]), str(days[-1]), len(days), rhr_dir)
+                download.get_stat_ranges_days(download.get_rhr_range, rhr_dir, days, days_overwite)
+                root_logger.info("Saved rhr files for %d days to %s for processing", len(days), rhr_dir)
+    finally:
+        # the file writer thread is a daemon, files it still has queued are lost if the process exits first
+        download.flush()
 
 
 def import_data(debug, test, latest, weight, monitoring, sleep, rhr, activities):
+    from import_garmin import GarminProfile, GarminWeightData, GarminSummaryData, GarminMonitoringExtraData, GarminMonitoringFitData, GarminSleepData, GarminRhrData
+    import GarminDB
+
     db_params_dict = GarminDBConfigManager.get_db_params(test_db=test)
 
     gp = GarminProfile(db_params_dict, GarminDBConfigManager.get_fit_files_dir(), debug)
@@ -134,9 +130,11 @@ def import_data(debug, test, latest, weight, monitoring, sleep, rhr, activities)
         ged = GarminMonitoringExtraData(db_params_dict, None, monitoring_dir, latest, debug)
         if ged.file_count() > 0:
             ged.process()
-        gfd = GarminMonitoringFitData(None, monitoring_dir, latest, english_units, debug)
+        gfd = GarminMonitoringFitData(db_params_dict, None, monitoring_dir, latest, english_units, debug)
         if gfd.file_count() > 0:
             gfd.process_files(db_params_dict)
+        GarminDB.MonitoringHeartRate.refresh_rollup(GarminDB.MonitoringDB(db_params_dict, debug - 1))
+        GarminDB.Stress.refresh_rollup(garmindb)
 
     if sleep:
         sleep_dir = GarminDBConfigManager.get_sleep_dir()
@@ -151,6 +149,8 @@ def import_data(debug, test, latest, weight, monitoring, sleep, rhr, activities)
             grhrd.process()
 
     if activities:
+        from import_garmin_activities import GarminJsonSummaryData, GarminJsonDetailsData, GarminActivitiesExtraData, GarminTcxData, GarminActivitiesFitData
+
         activities_dir = GarminDBConfigManager.get_activities_dir()
         gjsd = GarminJsonSummaryData(db_params_dict, None, activities_dir, latest, english_units, debug)
         if gjsd.file_count() > 0:
@@ -172,14 +172,51 @@ def import_data(debug, test, latest, weight, monitoring, sleep, rhr, activities)
         if gfd.file_count() > 0:
             gfd.process_files(db_params_dict)
 
+        GarminDB.ActivitiesDB(db_params_dict, debug - 1).refresh_views()
+
 def analyze_data(debug):
+    from analyze_garmin import Analyze
+    from analyze_activities import TrainingLoad, HeartRateZones, BestEfforts
+
     db_params_dict = GarminDBConfigManager.get_db_params()
     analyze = Analyze(db_params_dict, debug - 1)
     analyze.get_stats()
     analyze.summary()
+    TrainingLoad(db_params_dict, debug - 1).calculate()
+    HeartRateZones(db_params_dict, debug - 1).calculate()
+    BestEfforts(db_params_dict, debug - 1).calculate()
+
+
+def pipeline_data(debug, overwite, latest, gaps, weight, monitoring, sleep, rhr, activities):
+    from pipeline_garmin import Pipeline
+    from download_garmin import DownloadPlanner
+
+    db_params_dict = GarminDBConfigManager.get_db_params()
+    planner = DownloadPlanner(db_params_dict, overwite)
+    stats = [(monitoring, 'monitoring'), (sleep, 'sleep'), (weight, 'weight'), (rhr, 'rhr')]
+    stat_days = {}
+    for (enabled, stat_name) in stats:
+        if enabled:
+            days = {}
+            for (plan_days, plan_overwite) in download_plan(planner, latest, gaps, stat_name):
+                root_logger.info("Days to update %s: %s - %s (%d)", stat_name, str(plan_days[0]), str(plan_days[-1]), len(plan_days))
+                days.update({day : plan_overwite for day in plan_days})
+            if len(days) > 0:
+                stat_days[stat_name] = days
+    activity_count = 0
+    if activities:
+        if latest:
+            activity_count = GarminConnectConfig.data['download_latest_activities']
+        else:
+            activity_count = GarminConnectConfig.data['download_all_activities']
+    if not Pipeline(db_params_dict, stat_days, activity_count, overwite, debug).run():
+        sys.exit()
 
 
 def delete_db(debug):
+    import HealthDB
+    import GarminDB
+
     db_params_dict = GarminDBConfigManager.get_db_params()
     GarminDB.GarminDB(db_params_dict, debug - 1).delete_db()
     GarminDB.MonitoringDB(db_params_dict, debug - 1).delete_db()
@@ -195,6 +232,9 @@ def usage(program):
     print '    --sleep      : import sleep data'
     print '    --weight     : import weight data'
     print '    --trace      : turn on debug tracing'
+    print '    --latest     : download from the latest day in the DB through today'
+    print '    --gaps       : download days missing from the DB back to the configured start date'
+    print '    --pipeline   : download, import, and analyze with the stages overlapped'
     print '    '
     sys.exit()
 
@@ -203,6 +243,7 @@ def main(argv):
     _import_data = False
     _analyze_data = False
     _delete_db = False
+    _pipeline = False
     activities = False
     debug = 0
     test = False
@@ -213,10 +254,11 @@ def main(argv):
     rhr = False
     sleep = False
     latest = False
+    gaps = False
 
     try:
-        opts, args = getopt.getopt(argv,"aAdimlrstT:w",
-            ["all", "activities", "analyze", "delete_db", "download", "import", "trace=", "test", "monitoring", "latest", "rhr", "sleep", "weight"])
+        opts, args = getopt.getopt(argv,"aAdgimlprstT:w",
+            ["all", "activities", "analyze", "delete_db", "download", "import", "pipeline", "trace=", "test", "monitoring", "latest", "gaps", "rhr", "sleep", "weight"])
     except getopt.GetoptError:
         usage(sys.argv[0])
 
@@ -245,6 +287,9 @@ def main(argv):
         elif opt in ("--analyze"):
             logging.debug("analyze: True")
             _analyze_data = True
+        elif opt in ("-p", "--pipeline"):
+            logging.debug("Pipeline")
+            _pipeline = True
         elif opt in ("-t", "--trace"):
             debug = int(arg)
         elif opt in ("-T", "--test"):
@@ -256,6 +301,8 @@ def main(argv):
             overwite = True
         elif opt in ("-l", "--latest"):
             latest = True
+        elif opt in ("-g", "--gaps"):
+            gaps = True
         elif opt in ("-r", "--rhr"):
             logging.debug("RHR")
             rhr = True
@@ -275,8 +322,12 @@ def main(argv):
         delete_db(debug)
         sys.exit()
 
+    if _pipeline:
+        pipeline_data(debug, overwite, latest, gaps, weight, monitoring, sleep, rhr, activities)
+        sys.exit()
+
     if _download_data:
-        download_data(overwite, latest, weight, monitoring, sleep, rhr, activities)
+        download_data(overwite, latest, gaps, weight, monitoring, sleep, rhr, activities)
 
     if _import_data:
         import_data(debug, test, latest, weight, monitoring, sleep, rhr, activities)
@@ -17,6 +17,8 @@ logger.addHandler(logging.StreamHandler(stream=sys.stdout))
 
 
 class FitBitData():
+    # rows written between commits
+    commit_rows = 5000
 
     cols_map = {
         'sleep-minutesAwake': ('awake_mins', CsvImporter.map_integer),
@@ -57,13 +59,19 @@ class FitBitData():
     def file_count(self):
         return len(self.file_names)
 
-    def write_entry(self, db_entry):
-        FitBitDB.DaysSummary.find_or_create(self.fitbitdb, FitBitDB.DaysSummary.intersection(db_entry))
+    def write_entries(self, db_entries):
+        FitBitDB.DaysSummary._upsert(self.fitbitdb_session, [FitBitDB.DaysSummary.intersection(db_entry) for db_entry in db_entries])
+        self.uncommitted_rows += len(db_entries)
+        if self.uncommitted_rows >= self.commit_rows:
+            self.fitbitdb_session.commit()
+            self.uncommitted_rows = 0
 
     def process_files(self):
-        for file_name in progressbar.progressbar(self.file_names):
-            logger.info("Processing file: " + file_name)
-            self.csvimporter = CsvImporter(file_name, self.cols_map, self.write_entry)
-            self.csvimporter.process_file(not self.metric)
+        self.uncommitted_rows = 0
+        with self.fitbitdb.managed_session() as self.fitbitdb_session:
+            for file_name in progressbar.progressbar(self.file_names):
+                logger.info("Processing file: " + file_name)
+                self.csvimporter = CsvImporter(file_name, self.cols_map, self.write_entries)
+                self.csvimporter.process_file(not self.metric)
 
 
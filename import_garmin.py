@@ -4,8 +4,7 @@
 # copyright Tom Goetz
 #
 
-import os, sys, string, logging, datetime, traceback, enum
-import dateutil.parser
+import os, sys, string, logging, datetime, traceback, tempfile, shutil, enum
 import progressbar
 
 import Fit
@@ -29,7 +28,7 @@ class GarminWeightData(JsonFileProcessor):
         super(GarminWeightData, self).__init__(input_file, input_dir, 'weight_\d{4}-\d{2}-\d{2}\.json', latest, debug)
         self.english_units = english_units
         self.garmin_db = GarminDB.GarminDB(db_params_dict)
-        self.conversions = {'startDate' : dateutil.parser.parse}
+        self.conversions = {'startDate' : parse_datetime}
 
     def process_json(self, json_data):
         weight_list = json_data['dateWeightList']
@@ -39,31 +38,87 @@ class GarminWeightData(JsonFileProcessor):
                 'day'       : json_data['startDate'].date(),
                 'weight'    : weight.kgs_or_lbs(not self.english_units)
             }
-            GarminDB.Weight.find_or_create(self.garmin_db, point)
+            GarminDB.Weight._find_or_create(self.garmin_db_session, point)
             return 1
 
+    def commit(self):
+        self.garmin_db_session.commit()
+
+    def rollback(self):
+        self.garmin_db_session.rollback()
+
+    def process(self):
+        with self.garmin_db.managed_session() as self.garmin_db_session:
+            self.process_files()
+
 
 class GarminMonitoringFitData():
 
-    def __init__(self, input_file, input_dir, latest, english_units, debug):
+    def __init__(self, db_params_dict, input_file, input_dir, latest, english_units, debug):
         logger.info("Processing daily FIT data")
         self.english_units = english_units
         self.debug = debug
+        self.garmin_db = GarminDB.GarminDB(db_params_dict)
+        self.file_names = []
+        self.temp_dir = None
+        self.archived_time = None
         if input_file:
             self.file_names = FileProcessor.match_file(input_file, '.*\.fit')
         if input_dir:
             self.file_names = FileProcessor.dir_to_files(input_dir, '.*\.fit', latest, True)
+            # monthly archives keep being added to, so only the files archived after the last imported one are new
+            newer_than = GarminDB.Attributes.get_datetime(self.garmin_db, 'monitoring_archived_time') if latest else None
+            for archive_name in FileProcessor.dir_to_files(input_dir, 'monitoring_\d{4}-\d{2}\.zip', False, True):
+                self.file_names += FileProcessor.archive_to_files(archive_name, '.*\.fit', newer_than)
 
     def file_count(self):
         return len(self.file_names)
 
+    def process_archived_file(self, fp, file_name):
+        # Fit.File reads from a path, so archived files are extracted one at a time to a scratch directory
+        if self.temp_dir is None:
+            self.temp_dir = tempfile.mkdtemp()
+        local_file_name = FileProcessor.extract_archived_file(file_name, self.temp_dir)
+        try:
+            fp.write_file(Fit.File(local_file_name, self.english_units))
+        finally:
+            os.remove(local_file_name)
+        archived_time = FileProcessor.archived_time(file_name)
+        if self.archived_time is None or archived_time > self.archived_time:
+            self.archived_time = archived_time
+
+    def process_file(self, fp, file_name):
+        # returns False if the file couldn't be parsed
+        try:
+            if FileProcessor.split_archive_path(file_name) is not None:
+                self.process_archived_file(fp, file_name)
+            else:
+                fp.write_file(Fit.File(file_name, self.english_units))
+            return True
+        except Fit.FitFileError as e:
+            logger.error("Failed to parse %s: %s", file_name, str(e))
+            return False
+
+    def save_archived_time(self):
+        # records when the newest imported archived file was archived so --latest can skip the files archived before it
+        if self.archived_time is not None:
+            last_archived_time = GarminDB.Attributes.get_datetime(self.garmin_db, 'monitoring_archived_time')
+            if last_archived_time is None or self.archived_time > last_archived_time:
+                GarminDB.Attributes.set(self.garmin_db, 'monitoring_archived_time', self.archived_time)
+
+    def cleanup(self):
+        if self.temp_dir is not None:
+            shutil.rmtree(self.temp_dir)
+            self.temp_dir = None
+
     def process_files(self, db_params_dict):
         fp = FitFileProcessor(db_params_dict, self.debug)
-        for file_name in progressbar.progressbar(self.file_names):
-            try:
-                fp.write_file(Fit.File(file_name, self.english_units))
-            except Fit.FitFileError as e:
-                logger.error("Failed to parse %s: %s", file_name, str(e))
+        try:
+            for file_name in progressbar.progressbar(self.file_names):
+                self.process_file(fp, file_name)
+        finally:
+            self.cleanup()
+        self.save_archived_time()
 
 
 class SleepActivityLevels(enum.Enum):
@@ -88,16 +143,16 @@ class GarminSleepData(JsonFileProcessor):
         super(GarminSleepData, self).__init__(input_file, input_dir, 'sleep_\d{4}-\d{2}-\d{2}\.json', latest, debug)
         self.garmin_db = GarminDB.GarminDB(db_params_dict)
         self.conversions = {
-            'calendarDate'              : dateutil.parser.parse,
-            'sleepTimeSeconds'          : Fit.Conversions.secs_to_dt_time,
-            'sleepStartTimestampGMT'    : Fit.Conversions.epoch_ms_to_dt,
-            'sleepEndTimestampGMT'      : Fit.Conversions.epoch_ms_to_dt,
-            'deepSleepSeconds'          : Fit.Conversions.secs_to_dt_time,
-            'lightSleepSeconds'         : Fit.Conversions.secs_to_dt_time,
-            'remSleepSeconds'           : Fit.Conversions.secs_to_dt_time,
-            'awakeSleepSeconds'         : Fit.Conversions.secs_to_dt_time,
-            'startGMT'                  : dateutil.parser.parse,
-            'endGMT'                    : dateutil.parser.parse
+            'dailySleepDTO.calendarDate'            : parse_datetime,
+            'dailySleepDTO.sleepTimeSeconds'        : Fit.Conversions.secs_to_dt_time,
+            'dailySleepDTO.sleepStartTimestampGMT'  : Fit.Conversions.epoch_ms_to_dt,
+            'dailySleepDTO.sleepEndTimestampGMT'    : Fit.Conversions.epoch_ms_to_dt,
+            'dailySleepDTO.deepSleepSeconds'        : Fit.Conversions.secs_to_dt_time,
+            'dailySleepDTO.lightSleepSeconds'       : Fit.Conversions.secs_to_dt_time,
+            'dailySleepDTO.remSleepSeconds'         : Fit.Conversions.secs_to_dt_time,
+            'dailySleepDTO.awakeSleepSeconds'       : Fit.Conversions.secs_to_dt_time,
+            'sleepLevels[].startGMT'                : parse_datetime,
+            'sleepLevels[].endGMT'                  : parse_datetime
         }
 
     def process_json(self, json_data):
@@ -124,22 +179,39 @@ class GarminSleepData(JsonFileProcessor):
                 'rem_sleep' : daily_sleep.get('remSleepSeconds', None),
                 'awake' : daily_sleep.get('awakeSleepSeconds', None)
             }
-            GarminDB.Sleep.create_or_update_not_none(self.garmin_db, day_data)
+            GarminDB.Sleep._create_or_update_not_none(self.garmin_db_session, day_data)
             sleep_levels = json_data.get('sleepLevels', None)
             if sleep_levels is None:
                 return 0
+            if len(sleep_levels) == 0:
+                return 0
+            # event timestamps are unique, a later level with the same start replaces an earlier one
+            events = {}
             for sleep_level in sleep_levels:
                 start = sleep_level['startGMT']
                 end = sleep_level['endGMT']
                 event = sleep_activity_levels(sleep_level['activityLevel'])
                 duration = (datetime.datetime.min + (end - start)).time()
-                level_data = {
+                events[start] = {
                     'timestamp' : start,
                     'event' : event.name,
                     'duration' : duration
                 }
-                GarminDB.SleepEvents.create_or_update_not_none(self.garmin_db, level_data)
-            return len(sleep_levels)
+            # replace the night's events as a batch
+            window_start = min([sleep_level['startGMT'] for sleep_level in sleep_levels])
+            window_end = max([sleep_level['endGMT'] for sleep_level in sleep_levels])
+            GarminDB.SleepEvents._replace_for_period(self.garmin_db_session, window_start, window_end, events.values())
+            return len(events)
+
+    def commit(self):
+        self.garmin_db_session.commit()
+
+    def rollback(self):
+        self.garmin_db_session.rollback()
+
+    def process(self):
+        with self.garmin_db.managed_session() as self.garmin_db_session:
+            self.process_files()
 
 
 class GarminRhrData(JsonFileProcessor):
@@ -148,7 +220,7 @@ class GarminRhrData(JsonFileProcessor):
         logger.info("Processing rhr data")
         super(GarminRhrData, self).__init__(input_file, input_dir, 'rhr_\d{4}-\d{2}-\d{2}\.json', latest, debug)
         self.garmin_db = GarminDB.GarminDB(db_params_dict)
-        self.conversions = {'statisticsStartDate' : dateutil.parser.parse}
+        self.conversions = {'statisticsStartDate' : parse_datetime}
 
     def process_json(self, json_data):
         rhr_list = json_data['allMetrics']['metricsMap']['WELLNESS_RESTING_HEART_RATE']
@@ -159,9 +231,19 @@ class GarminRhrData(JsonFileProcessor):
                     'day'                   : json_data['statisticsStartDate'].date(),
                     'resting_heart_rate'    : rhr
                 }
-                GarminDB.RestingHeartRate.create_or_update_not_none(self.garmin_db, point)
+                GarminDB.RestingHeartRate._create_or_update_not_none(self.garmin_db_session, point)
                 return 1
 
+    def commit(self):
+        self.garmin_db_session.commit()
+
+    def rollback(self):
+        self.garmin_db_session.rollback()
+
+    def process(self):
+        with self.garmin_db.managed_session() as self.garmin_db_session:
+            self.process_files()
+
 
 class GarminProfile(JsonFileProcessor):
 
@@ -169,7 +251,7 @@ class GarminProfile(JsonFileProcessor):
         logger.info("Processing profile data")
         super(GarminProfile, self).__init__(None, input_dir, 'profile\.json', False, debug)
         self.garmin_db = GarminDB.GarminDB(db_params_dict)
-        self.conversions = {'calendarDate' : dateutil.parser.parse}
+        self.conversions = {'calendarDate' : parse_datetime}
 
     def process_json(self, json_data):
         measurement_system = Fit.FieldEnums.DisplayMeasure.from_string(json_data['measurementSystem'])
@@ -192,7 +274,7 @@ class GarminSummaryData(JsonFileProcessor):
         self.input_dir = input_dir
         self.english_units = english_units
         self.garmin_db = GarminDB.GarminDB(db_params_dict)
-        self.conversions = {'calendarDate' : dateutil.parser.parse}
+        self.conversions = {'calendarDate' : parse_datetime}
 
     def process_json(self, json_data):
         day = json_data['calendarDate'].date()
@@ -214,7 +296,7 @@ class GarminSummaryData(JsonFileProcessor):
             'calories_consumed'     : json_data['consumedKilocalories'],
             'description'           : description,
         }
-        GarminDB.DailySummary.create_or_update_not_none(self.garmin_db, summary)
+        GarminDB.DailySummary._create_or_update_not_none(self.garmin_db_session, summary)
         if extra_data:
             extra_data['day'] = day
             logger.info("Extra data: %s", repr(extra_data))
@@ -223,6 +305,16 @@ class GarminSummaryData(JsonFileProcessor):
                 self.save_json_file(json_filename, extra_data)
         return 1
 
+    def commit(self):
+        self.garmin_db_session.commit()
+
+    def rollback(self):
+        self.garmin_db_session.rollback()
+
+    def process(self):
+        with self.garmin_db.managed_session() as self.garmin_db_session:
+            self.process_files()
+
 
 class GarminMonitoringExtraData(JsonFileProcessor):
 
@@ -230,7 +322,7 @@ class GarminMonitoringExtraData(JsonFileProcessor):
         logger.info("Processing daily extra data")
         super(GarminMonitoringExtraData, self).__init__(input_file, input_dir, 'extra_data_\d{4}-\d{2}-\d{2}\.json', latest, debug, recursive=True)
         self.garmin_db = GarminDB.GarminDB(db_params_dict)
-        self.conversions = {'day' : dateutil.parser.parse}
+        self.conversions = {'day' : parse_datetime}
 
     def process_json(self, json_data):
         root_logger.info("Extra data: %s", repr(json_data))
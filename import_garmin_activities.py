@@ -4,12 +4,13 @@
 # copyright Tom Goetz
 #
 
-import os, sys, re, string, logging, datetime, traceback, json, tcxparser, dateutil.parser, traceback
+import os, sys, re, string, logging, datetime, traceback, json, dateutil.parser, traceback
 import progressbar
 
 import Fit
 import FileProcessor
 from FitFileProcessor import FitFileProcessor
+from TcxFile import TcxFile
 from JsonFileProcessor import *
 import GarminDB
 import GarminConnectEnums
@@ -65,11 +66,74 @@ class GarminTcxData():
     def file_count(self):
         return len(self.file_names)
 
+    def distance(self, meters):
+        if meters is not None:
+            return Fit.Conversions.Distance.from_meters(meters).kms_or_miles(not self.english_units)
+
+    def altitude(self, meters):
+        if meters is not None:
+            return Fit.Conversions.Distance.from_meters(meters).meters_or_feet(not self.english_units)
+
+    def speed(self, mps):
+        if mps is not None:
+            return Fit.Conversions.Speed.from_mps(mps).kph_or_mph(not self.english_units)
+
+    def time(self, secs):
+        if secs is not None:
+            return Fit.Conversions.secs_to_dt_time(int(round(secs)))
+
+    def write_lap(self, activity_id, lap_index, tcx_lap):
+        lap = {
+            'activity_id'               : activity_id,
+            'lap'                       : lap_index,
+            'start_time'                : tcx_lap.get('start_time'),
+            'stop_time'                 : tcx_lap.get('stop_time'),
+            'elapsed_time'              : self.time(tcx_lap.get('elapsed_time')),
+            'moving_time'               : self.time(tcx_lap.get('moving_time')),
+            'start_lat'                 : tcx_lap.get('start_lat'),
+            'start_long'                : tcx_lap.get('start_long'),
+            'stop_lat'                  : tcx_lap.get('stop_lat'),
+            'stop_long'                 : tcx_lap.get('stop_long'),
+            'distance'                  : self.distance(tcx_lap.get('distance')),
+            'avg_hr'                    : tcx_lap.get('avg_hr'),
+            'max_hr'                    : tcx_lap.get('max_hr'),
+            'calories'                  : tcx_lap.get('calories'),
+            'avg_cadence'               : tcx_lap.get('avg_cadence'),
+            'max_cadence'               : tcx_lap.get('max_cadence'),
+            'avg_speed'                 : self.speed(tcx_lap.get('avg_speed')),
+            'max_speed'                 : self.speed(tcx_lap.get('max_speed')),
+        }
+        GarminDB.ActivityLaps._create_or_update_not_none(self.garmin_act_db_session, lap)
+
+    def record(self, tcx_record):
+        return {
+            'timestamp'                 : tcx_record.get('timestamp'),
+            'position_lat'              : tcx_record.get('position_lat'),
+            'position_long'             : tcx_record.get('position_long'),
+            'distance'                  : self.distance(tcx_record.get('distance')),
+            'cadence'                   : tcx_record.get('cadence'),
+            'hr'                        : tcx_record.get('hr'),
+            'alititude'                 : self.altitude(tcx_record.get('altitude')),
+            'speed'                     : self.speed(tcx_record.get('speed')),
+            'temperature'               : None,
+        }
+
     def process_file(self, file_name):
         root_logger.info("Processing file: " + file_name)
-        tcx = tcxparser.TCXParser(file_name)
-        end_time = dateutil.parser.parse(tcx.completed_at, ignoretz=True)
-        start_time = dateutil.parser.parse(tcx.started_at, ignoretz=True)
+        (file_id, file_base_name) = GarminDB.File.name_and_id_from_path(file_name)
+        tcx = TcxFile(file_name)
+        # laps and records are written as the file is streamed, the activity's values once all of the file has been read
+        GarminDB.Activities._find_or_create(self.garmin_act_db_session, {'activity_id' : file_id})
+        records_writer = GarminDB.ActivityRecordsWriter(self.garmin_act_db_session, file_id, self.garmin_act_db.compact_records)
+        lap_index = 1
+        for (message_type, message) in tcx.messages():
+            if message_type == 'record':
+                records_writer.write(self.record(message))
+            else:
+                self.write_lap(file_id, lap_index, message)
+                lap_index += 1
+        records_writer.flush()
+        GarminDB.ActivityBounds._update(self.garmin_act_db_session, file_id)
         manufacturer = GarminDB.Device.Manufacturer.Unknown
         product = tcx.creator
         if product is not None:
@@ -81,50 +145,44 @@ class GarminTcxData():
             serial_number = GarminDB.Device.unknown_device_serial_number
         device = {
             'serial_number'     : serial_number,
-            'timestamp'         : start_time,
+            'timestamp'         : tcx.started_at,
             'manufacturer'      : manufacturer,
             'product'           : product,
             'hardware_version'  : None,
         }
         GarminDB.Device._create_or_update_not_none(self.garmin_db_session, device)
-        (file_id, file_name) = GarminDB.File.name_and_id_from_path(file_name)
         file = {
             'id'            : file_id,
-            'name'          : file_name,
+            'name'          : file_base_name,
             'type'          : GarminDB.File.FileType.tcx,
             'serial_number' : serial_number,
         }
         GarminDB.File._find_or_create(self.garmin_db_session, file)
-        distance = Fit.Conversions.Distance.from_meters(tcx.distance)
-        ascent = Fit.Conversions.Distance.from_meters(tcx.ascent)
-        descent = Fit.Conversions.Distance.from_meters(tcx.descent)
         activity = {
             'activity_id'               : file_id,
-            'start_time'                : start_time,
-            'stop_time'                 : end_time,
-            'laps'                      : len(tcx.activity.Lap),
-            # 'sport'                     : tcx.activity_type,
+            'start_time'                : tcx.started_at,
+            'stop_time'                 : tcx.completed_at,
+            'laps'                      : tcx.laps,
+            # 'sport'                     : tcx.sport,
             'calories'                  : tcx.calories,
             'start_lat'                 : tcx.start_latitude,
             'start_long'                : tcx.start_longitude,
             'stop_lat'                  : tcx.end_latitude,
             'stop_long'                 : tcx.end_longitude,
-            'distance'                  : distance.kms_or_miles(not self.english_units),
+            'distance'                  : self.distance(tcx.distance),
             'avg_hr'                    : tcx.hr_avg,
             'max_hr'                    : tcx.hr_max,
             'max_cadence'               : tcx.cadence_max,
             'avg_cadence'               : tcx.cadence_avg,
-            #'ascent'                    : ascent.meters_or_feet(not self.english_units),
-            #'descent'                   : descent.meters_or_feet(not self.english_units)
         }
         activity_not_zero = {key : value for (key,value) in activity.iteritems() if value}
         GarminDB.Activities._create_or_update_not_none(self.garmin_act_db_session, activity_not_zero)
 
     def process_files(self, db_params_dict):
         garmin_db = GarminDB.GarminDB(db_params_dict, self.debug - 1)
-        garmin_act_db = GarminDB.ActivitiesDB(db_params_dict, self.debug)
+        self.garmin_act_db = GarminDB.ActivitiesDB(db_params_dict, self.debug)
         with garmin_db.managed_session() as self.garmin_db_session:
-            with garmin_act_db.managed_session() as self.garmin_act_db_session:
+            with self.garmin_act_db.managed_session() as self.garmin_act_db_session:
                 for file_name in progressbar.progressbar(self.file_names):
                     self.process_file(file_name)
                     self.garmin_db_session.commit()
@@ -143,6 +201,9 @@ class GarminJsonSummaryData(JsonFileProcessor):
     def commit(self):
         self.garmin_act_db_session.commit()
 
+    def rollback(self):
+        self.garmin_act_db_session.rollback()
+
     def process_running(self, activity_id, activity_summary):
         root_logger.debug("process_running for %s", activity_id)
         avg_vertical_oscillation = self.get_field_obj(activity_summary, 'avgVerticalOscillation', Fit.Conversions.Distance.from_meters)
@@ -267,6 +328,8 @@ class GarminJsonSummaryData(JsonFileProcessor):
             'anaerobic_training_effect' : self.get_field(json_data, 'anaerobicTrainingEffect', float),
         }
         GarminDB.Activities._create_or_update_not_none(self.garmin_act_db_session, activity)
+        # activities without records are indexed by their start and stop locations
+        GarminDB.ActivityBounds._update(self.garmin_act_db_session, activity_id)
         if extra_data:
             extra_data['activity_id'] = activity_id
             json_filename = self.input_dir + '/extra_data_' + activity_id + '.json'
@@ -297,6 +360,9 @@ class GarminJsonDetailsData(JsonFileProcessor):
     def commit(self):
         self.garmin_act_db_session.commit()
 
+    def rollback(self):
+        self.garmin_act_db_session.rollback()
+
     def process_running(self, activity_id, json_data):
         summary_dto = json_data['summaryDTO']
         avg_moving_speed_mps = summary_dto.get('averageMovingSpeed', None)
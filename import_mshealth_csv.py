@@ -17,6 +17,8 @@ logger.addHandler(logging.StreamHandler(stream=sys.stdout))
 
 
 class MSHealthData():
+    # rows written between commits
+    commit_rows = 5000
 
     cols_map = {
         'Date': ('day', CsvImporter.map_ymd_date),
@@ -69,17 +71,25 @@ class MSHealthData():
     def file_count(self):
         return len(self.file_names)
 
-    def write_entry(self, db_entry):
-        MSHealthDB.DaysSummary.find_or_create(self.mshealth_db, db_entry)
+    def write_entries(self, db_entries):
+        MSHealthDB.DaysSummary._upsert(self.mshealth_db_session, db_entries)
+        self.uncommitted_rows += len(db_entries)
+        if self.uncommitted_rows >= self.commit_rows:
+            self.mshealth_db_session.commit()
+            self.uncommitted_rows = 0
 
     def process_files(self):
-        for file_name in progressbar.progressbar(self.file_names):
-            logger.info("Processing file: " + file_name)
-            csvimporter = CsvImporter(file_name, self.cols_map, self.write_entry)
-            csvimporter.process_file(not self.metric)
+        self.uncommitted_rows = 0
+        with self.mshealth_db.managed_session() as self.mshealth_db_session:
+            for file_name in progressbar.progressbar(self.file_names):
+                logger.info("Processing file: " + file_name)
+                csvimporter = CsvImporter(file_name, self.cols_map, self.write_entries)
+                csvimporter.process_file(not self.metric)
 
 
 class MSVaultData():
+    # rows written between commits
+    commit_rows = 5000
 
     def __init__(self, input_file, input_dir, db_params_dict, metric, debug):
         self.metric = metric
@@ -96,14 +106,20 @@ class MSVaultData():
     def file_count(self):
         return len(self.file_names)
 
-    def write_entry(self, db_entry):
-        MSHealthDB.MSVaultWeight.find_or_create(self.mshealth_db, MSHealthDB.MSVaultWeight.intersection(db_entry))
+    def write_entries(self, db_entries):
+        MSHealthDB.MSVaultWeight._upsert(self.mshealth_db_session, [MSHealthDB.MSVaultWeight.intersection(db_entry) for db_entry in db_entries])
+        self.uncommitted_rows += len(db_entries)
+        if self.uncommitted_rows >= self.commit_rows:
+            self.mshealth_db_session.commit()
+            self.uncommitted_rows = 0
 
     def process_files(self):
-        for file_name in progressbar.progressbar(self.file_names):
-            logger.info("Processing file: " + file_name)
-            csvimporter = CsvImporter(file_name, self.cols_map, self.write_entry)
-            csvimporter.process_file(not self.metric)
+        self.uncommitted_rows = 0
+        with self.mshealth_db.managed_session() as self.mshealth_db_session:
+            for file_name in progressbar.progressbar(self.file_names):
+                logger.info("Processing file: " + file_name)
+                csvimporter = CsvImporter(file_name, self.cols_map, self.write_entries)
+                csvimporter.process_file(not self.metric)
 
     @classmethod
     def map_weight(cls, metric, value):
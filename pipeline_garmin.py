@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+
+#
+# copyright Tom Goetz
+#
+
+import sys, re, logging, datetime, calendar, threading, traceback, Queue
+
+import GarminDB
+import GarminDBConfigManager
+from download_garmin import Download
+from import_garmin import GarminProfile, GarminWeightData, GarminSummaryData, GarminMonitoringFitData, GarminSleepData, GarminRhrData
+from import_garmin_activities import GarminJsonSummaryData, GarminJsonDetailsData, GarminActivitiesExtraData, GarminTcxData, GarminActivitiesFitData
+from FitFileProcessor import FitFileProcessor
+from analyze_garmin import Analyze
+from analyze_activities import TrainingLoad, HeartRateZones, BestEfforts
+
+
+logger = logging.getLogger(__file__)
+logger.addHandler(logging.StreamHandler(stream=sys.stdout))
+root_logger = logging.getLogger()
+
+
+#
+# Runs download, import, and analyze as overlapping stages. Downloaded files are queued to an import thread as they are
+# saved and each day is queued to an analyze thread once all of its files have been imported.
+#
+class Pipeline():
+    # bounds how far the download stage can get ahead of import and import ahead of analysis
+    queue_size = 16
+
+    file_types = [
+        ('summary', r'daily_summary_\d{4}-\d{2}-\d{2}\.json(\.gz)?$'),
+        ('monitoring_fit', r'\.fit$'),
+        ('sleep', r'sleep_\d{4}-\d{2}-\d{2}\.json(\.gz)?$'),
+        ('weight', r'weight_\d{4}-\d{2}-\d{2}\.json(\.gz)?$'),
+        ('rhr', r'rhr_\d{4}-\d{2}-\d{2}\.json(\.gz)?$'),
+    ]
+
+    def __init__(self, db_params_dict, stat_days, activity_count, overwite, debug):
+        # stat_days is a dict of stat name to a dict of the days to download and whether each day's files are overwritten
+        self.db_params_dict = db_params_dict
+        self.stat_days = stat_days
+        self.activity_count = activity_count
+        self.overwite = overwite
+        self.debug = debug
+        self.import_failures = 0
+        self.import_queue = Queue.Queue(self.queue_size)
+        self.analyze_queue = Queue.Queue(self.queue_size)
+
+    def file_type(self, filename):
+        for (file_type, file_regex) in self.file_types:
+            if re.search(file_regex, filename):
+                return file_type
+
+    def queue_file(self, filename):
+        file_type = self.file_type(filename)
+        if file_type is not None:
+            self.import_queue.put((file_type, filename))
+
+    def stats_for_day(self, day):
+        return [(stat, days[day]) for (stat, days) in self.stat_days.iteritems() if day in days]
+
+    def download_day(self, download, day):
+        # Returns False if any of the day's downloads failed.
+        for (stat, overwite) in self.stats_for_day(day):
+            if stat == 'monitoring':
+                monitoring_dir = GarminDBConfigManager.get_or_create_monitoring_dir(day.year)
+                downloaded = download.get_summary_day(monitoring_dir, day, overwite)
+                zip_filename = download.get_monitoring_day(day)
+                if zip_filename is not None:
+                    if GarminDBConfigManager.get_monitoring_archives():
+                        download.archive_file(zip_filename, download.monitoring_archive_filename(monitoring_dir, day))
+                    else:
+                        download.unzip_file(zip_filename, monitoring_dir)
+                downloaded = downloaded and zip_filename is not None
+            elif stat == 'sleep':
+                downloaded = download.get_sleep_day(GarminDBConfigManager.get_or_create_sleep_dir(), day, overwite)
+            elif stat == 'weight':
+                downloaded = download.get_weight_day(GarminDBConfigManager.get_or_create_weight_dir(), day, overwite)
+            elif stat == 'rhr':
+                downloaded = download.get_rhr_day(GarminDBConfigManager.get_or_create_rhr_dir(), day, overwite)
+            if not downloaded:
+                logger.error("Download stopped after failing to download %s for %s", stat, str(day))
+                return False
+        return True
+
+    def download(self, download):
+        # Returns False if downloading stopped at a day that failed.
+        download.file_listener = self.queue_file
+        days = set()
+        for stat_days in self.stat_days.values():
+            days.update(stat_days.keys())
+        for day in sorted(days):
+            downloaded = self.download_day(download, day)
+            # the day's files are queued for import as they are written
+            download.flush()
+            self.import_queue.put(('day', day))
+            if not downloaded:
+                return False
+        if self.activity_count > 0:
+            # activities are imported as a batch once they have all been downloaded
+            download.file_listener = None
+            activities_dir = GarminDBConfigManager.get_or_create_activities_dir()
+            download.get_activity_types(activities_dir, self.overwite)
+            download.get_activities(activities_dir, self.activity_count, self.overwite)
+            download.unzip_files(activities_dir)
+            self.import_queue.put(('activities', activities_dir))
+        return True
+
+    def import_activities(self, activities_dir, english_units):
+        # returns False if any of the activities' JSON files failed to import
+        failed_files = []
+        for activities_data in [GarminJsonSummaryData(self.db_params_dict, None, activities_dir, True, english_units, self.debug),
+                                GarminJsonDetailsData(self.db_params_dict, None, activities_dir, True, english_units, self.debug),
+                                GarminActivitiesExtraData(self.db_params_dict, None, activities_dir, True, self.debug)]:
+            if activities_data.file_count() > 0:
+                activities_data.process()
+                failed_files += activities_data.failed_files
+        for activities_data in [GarminTcxData(None, activities_dir, True, english_units, self.debug),
+                                GarminActivitiesFitData(None, activities_dir, True, english_units, self.debug)]:
+            if activities_data.file_count() > 0:
+                activities_data.process_files(self.db_params_dict)
+        GarminDB.ActivitiesDB(self.db_params_dict, self.debug - 1).refresh_views()
+        return len(failed_files) == 0
+
+    def create_importers(self):
+        gp = GarminProfile(self.db_params_dict, GarminDBConfigManager.get_fit_files_dir(), self.debug)
+        if gp.file_count() > 0:
+            gp.process()
+        self.garmin_db = GarminDB.GarminDB(self.db_params_dict)
+        self.garmin_mon_db = GarminDB.MonitoringDB(self.db_params_dict)
+        self.english_units = GarminDB.Attributes.measurements_type_metric(self.garmin_db) == False
+        self.fit_data = GarminMonitoringFitData(self.db_params_dict, None, None, False, self.english_units, self.debug)
+        self.fp = FitFileProcessor(self.db_params_dict, self.debug)
+        self.json_data = {
+            'summary'   : GarminSummaryData(self.db_params_dict, None, None, False, self.english_units, self.debug),
+            'sleep'     : GarminSleepData(self.db_params_dict, None, None, False, self.debug),
+            'weight'    : GarminWeightData(self.db_params_dict, None, None, False, self.english_units, self.debug),
+            'rhr'       : GarminRhrData(self.db_params_dict, None, None, False, self.debug),
+        }
+
+    def import_item(self, item_type, item):
+        # returns False if the item failed to import
+        if item_type == 'day':
+            GarminDB.MonitoringHeartRate.refresh_rollup(self.garmin_mon_db)
+            GarminDB.Stress.refresh_rollup(self.garmin_db)
+            self.analyze_queue.put(item)
+            return True
+        elif item_type == 'activities':
+            return self.import_activities(item, self.english_units)
+        elif item_type == 'monitoring_fit':
+            return self.fit_data.process_file(self.fp, item)
+        json_data = self.json_data[item_type]
+        json_data.file_names = [item]
+        json_data.process()
+        return len(json_data.failed_files) == 0
+
+    def import_files(self):
+        try:
+            self.create_importers()
+            importing = True
+        except Exception as e:
+            logger.error("Failed to start importing: %s", traceback.format_exc())
+            self.import_failures += 1
+            importing = False
+        # keep draining the queue even if importing failed so the download stage isn't blocked
+        while True:
+            (item_type, item) = self.import_queue.get()
+            if item_type is None:
+                break
+            if importing:
+                try:
+                    if not self.import_item(item_type, item):
+                        self.import_failures += 1
+                except Exception as e:
+                    logger.error("Failed to import %s %s: %s", item_type, str(item), traceback.format_exc())
+                    self.import_failures += 1
+        if importing:
+            self.fit_data.cleanup()
+            self.fit_data.save_archived_time()
+        self.analyze_queue.put(None)
+
+    def analyze_days(self):
+        analyze = Analyze(self.db_params_dict, self.debug - 1)
+        weeks = set()
+        months = set()
+        while True:
+            day = self.analyze_queue.get()
+            if day is None:
+                break
+            try:
+                analyze.calculate_day_stats(day)
+            except Exception as e:
+                logger.error("Failed to analyze %s: %s", str(day), traceback.format_exc())
+            # weeks are counted from the start of the year as in Analyze.summary
+            weeks.add(datetime.date(day.year, 1, 1) + datetime.timedelta((day.timetuple().tm_yday - 1) / 7 * 7))
+            months.add((day.year, day.month))
+        for week_start in sorted(weeks):
+            analyze.calculate_week_stats(week_start)
+        for (year, month) in sorted(months):
+            analyze.calculate_month_stats(datetime.date(year, month, 1), datetime.date(year, month, calendar.monthrange(year, month)[1]))
+        analyze.get_stats()
+        TrainingLoad(self.db_params_dict, self.debug - 1).calculate()
+        HeartRateZones(self.db_params_dict, self.debug - 1).calculate()
+        BestEfforts(self.db_params_dict, self.debug - 1).calculate()
+
+    def run(self):
+        # Returns False if the download or import stage failed.
+        download = Download()
+        if not download.login():
+            logger.error("Failed to login!")
+            return False
+        import_thread = threading.Thread(target=self.import_files, name='import')
+        analyze_thread = threading.Thread(target=self.analyze_days, name='analyze')
+        import_thread.start()
+        analyze_thread.start()
+        downloaded = False
+        try:
+            downloaded = self.download(download)
+        except Exception as e:
+            logger.error("Download failed: %s", traceback.format_exc())
+        except KeyboardInterrupt:
+            download.cancel()
+            logger.error("Download cancelled")
+        finally:
+            download.flush()
+            # let the import and analyze stages drain what was downloaded
+            self.import_queue.put((None, None))
+        import_thread.join()
+        analyze_thread.join()
+        if self.import_failures > 0:
+            logger.error("%d items failed to import", self.import_failures)
+        return downloaded and self.import_failures == 0
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+#
+# copyright Tom Goetz
+#
+
+import sys, getopt, logging, datetime, time, tempfile, shutil
+
+sys.path.append('../.')
+
+import GarminDBConfig
+from GarminConnectStub import GarminConnectStub
+
+
+root_logger = logging.getLogger()
+handler = logging.FileHandler('benchmark_download.log', 'w')
+root_logger.addHandler(handler)
+root_logger.setLevel(logging.INFO)
+
+
+# download concurrency and whether weight and rhr are downloaded in date ranges for each strategy
+strategies = {
+    'sequential'        : (1, False),
+    'concurrent'        : (8, False),
+    'ranged'            : (1, True),
+    'concurrent_ranged' : (8, True),
+}
+
+
+def download_days(download, base_dir, date, days, ranged):
+    # get_stat downloads days + 1 days
+    download.get_daily_summaries(base_dir, date, days - 1, True)
+    download.get_monitoring(date, days - 1)
+    download.get_sleep(base_dir, date, days - 1, True)
+    if ranged:
+        download.get_weight(base_dir, date, days - 1, True)
+        download.get_rhr(base_dir, date, days - 1, True)
+    else:
+        download.get_stat(download.get_weight_day, base_dir, date, days - 1, True)
+        download.get_stat(download.get_rhr_day, base_dir, date, days - 1, True)
+
+def benchmark(strategy, days, latency, rate_limit_every):
+    temp_dir = tempfile.mkdtemp()
+    GarminDBConfig.directories.update({'relative_to_home' : False, 'base_dir' : temp_dir})
+    # let the stub's latency and throttling, not the client's rate limit, bound throughput
+    (concurrency, ranged) = strategies[strategy]
+    GarminDBConfig.download.update({'concurrency' : concurrency, 'rate' : 10000.0})
+    stub = GarminConnectStub(latency, rate_limit_every).start()
+    try:
+        download = stub.download_class()()
+        download.login()
+        start = time.time()
+        download_days(download, temp_dir, datetime.date(2019, 1, 1), days, ranged)
+        elapsed = time.time() - start
+        shutil.rmtree(download.temp_dir)
+    finally:
+        stub.stop()
+        shutil.rmtree(temp_dir)
+    return (days / elapsed, stub.requests, stub.throttled)
+
+def usage(program):
+    print '%s [-d <days>] [-l <latency secs>] [-r <rate limit every n requests>] [-s <strategy>]' % program
+    print '    strategies: ' + ', '.join(sorted(strategies.keys()))
+    sys.exit()
+
+def main(argv):
+    days = 31
+    latency = 0.05
+    rate_limit_every = 0
+    selected_strategies = sorted(strategies.keys())
+
+    try:
+        opts, args = getopt.getopt(argv, "d:hl:r:s:", ["days=", "latency=", "rate_limit_every=", "strategy="])
+    except getopt.GetoptError:
+        usage(sys.argv[0])
+
+    for opt, arg in opts:
+        if opt == '-h':
+            usage(sys.argv[0])
+        elif opt in ("-d", "--days"):
+            days = int(arg)
+        elif opt in ("-l", "--latency"):
+            latency = float(arg)
+        elif opt in ("-r", "--rate_limit_every"):
+            rate_limit_every = int(arg)
+        elif opt in ("-s", "--strategy"):
+            selected_strategies = [arg]
+
+    for strategy in selected_strategies:
+        (days_per_sec, requests, throttled) = benchmark(strategy, days, latency, rate_limit_every)
+        print '%-18s %8.2f days/sec %6d requests %6d throttled' % (strategy, days_per_sec, requests, throttled)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+
+#
+# copyright Tom Goetz
+#
+
+import sys, re, logging, datetime, time, json, zipfile, threading, urlparse, StringIO
+import BaseHTTPServer, SocketServer
+
+sys.path.append('../.')
+
+from download_garmin import Download
+
+
+logger = logging.getLogger(__name__)
+
+
+class ThreadingHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+#
+# Answers the Garmin Connect URLs that Download uses with synthetic payloads.
+#
+class GarminConnectStubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    # keep connections alive so connection reuse shows up in benchmarks
+    protocol_version = 'HTTP/1.1'
+
+    get_routes = [
+        (r'^/sso/signin$', 'get_signin'),
+        (r'^/modern$', 'get_modern'),
+        (r'^/modern/proxy/usersummary-service/usersummary/daily/\w+$', 'get_daily_summary'),
+        (r'^/modern/proxy/weight-service/weight/dateRange$', 'get_weight'),
+        (r'^/modern/proxy/wellness-service/wellness/dailySleepData/\w+$', 'get_sleep'),
+        (r'^/modern/proxy/userstats-service/wellness/daily/\w+$', 'get_rhr'),
+        (r'^/modern/proxy/activitylist-service/activities/search/activities$', 'get_activity_search'),
+        (r'^/modern/proxy/activity-service/activity/activityTypes$', 'get_activity_types'),
+        (r'^/modern/proxy/activity-service/activity/(\d+)$', 'get_activity_details'),
+        (r'^/modern/proxy/download-service/files/wellness/([\d-]+)$', 'get_monitoring_zip'),
+        (r'^/modern/proxy/download-service/files/activity/(\d+)$', 'get_activity_zip'),
+    ]
+    post_routes = [
+        (r'^/sso/signin$', 'post_signin'),
+    ]
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+    def send(self, status, body, content_type='application/json'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, json_data):
+        self.send(200, json.dumps(json_data))
+
+    def route(self, routes):
+        url = urlparse.urlparse(self.path)
+        params = dict(urlparse.parse_qsl(url.query))
+        if self.command == 'POST':
+            self.rfile.read(int(self.headers.getheader('Content-Length', 0)))
+        if not self.server.stub.count_request():
+            self.send(429, '')
+            return
+        for (path_regex, handler_name) in routes:
+            match = re.search(path_regex, url.path)
+            if match:
+                time.sleep(self.server.stub.latency)
+                getattr(self, handler_name)(params, *match.groups())
+                return
+        self.send(404, '')
+
+    def do_GET(self):
+        self.route(self.get_routes)
+
+    def do_POST(self):
+        self.route(self.post_routes)
+
+    def get_signin(self, params):
+        self.send(200, '<form><input type="hidden" name="_csrf" value="0123456789ABCDEF"/></form>', 'text/html')
+
+    def post_signin(self, params):
+        self.send(200, '<script>var response_url = "https://connect.garmin.com/modern?ticket=ST-0123456-stub";</script>', 'text/html')
+
+    def embedded_json(self, key, json_data):
+        return key + ' = JSON.parse("' + json.dumps(json_data).replace('"', '\\"') + '");\n'
+
+    def get_modern(self, params):
+        stub = self.server.stub
+        user_prefs = {
+            'displayName'       : stub.display_name,
+            'measurementSystem' : 'metric',
+            'timeZone'          : 'America/Denver',
+            'dateFormat'        : {'formatKey' : 'mm/dd/yyyy'}
+        }
+        social_profile = {'fullName' : 'Stub User', 'displayName' : stub.display_name}
+        page = self.embedded_json('VIEWER_USERPREFERENCES', user_prefs) + self.embedded_json('VIEWER_SOCIAL_PROFILE', social_profile)
+        self.send(200, '<script>' + page + '</script>', 'text/html')
+
+    def get_daily_summary(self, params):
+        day = parse_date(params['calendarDate'])
+        seed = day.toordinal()
+        self.send_json({
+            'calendarDate'          : str(day),
+            'wellnessDescription'   : '',
+            'totalSteps'            : 5000 + seed % 5000,
+            'dailyStepGoal'         : 10000,
+            'totalDistanceMeters'   : 4000 + seed % 4000,
+            'intensityMinutesGoal'  : 150,
+            'floorsAscended'        : seed % 20,
+            'floorsDescended'       : seed % 17,
+            'netCalorieGoal'        : 2000,
+            'totalKilocalories'     : 2200 + seed % 500,
+            'bmrKilocalories'       : 1800,
+            'activeKilocalories'    : 400 + seed % 500,
+            'consumedKilocalories'  : 0
+        })
+
+    def get_weight(self, params):
+        start = parse_date(params['startDate'])
+        end = parse_date(params['endDate'])
+        self.send_json({
+            'startDate'         : str(start),
+            'endDate'           : str(end),
+            'dateWeightList'    : [
+                {'calendarDate' : str(day), 'date' : epoch_ms(day), 'weight' : 80000.0 + day.toordinal() % 1000} for day in date_range(start, end)
+            ]
+        })
+
+    def get_sleep(self, params):
+        day = parse_date(params['date'])
+        start = datetime.datetime.combine(day, datetime.time()) - datetime.timedelta(hours=2)
+        end = start + datetime.timedelta(hours=8)
+        self.send_json({
+            'dailySleepDTO' : {
+                'calendarDate'              : str(day),
+                'sleepStartTimestampGMT'    : epoch_ms(start),
+                'sleepEndTimestampGMT'      : epoch_ms(end),
+                'sleepTimeSeconds'          : 28800,
+                'deepSleepSeconds'          : 7200,
+                'lightSleepSeconds'         : 18000,
+                'remSleepSeconds'           : 0,
+                'awakeSleepSeconds'         : 3600
+            },
+            'sleepLevels' : [
+                {
+                    'startGMT'      : (start + datetime.timedelta(hours=hour)).strftime('%Y-%m-%dT%H:%M:%S.0'),
+                    'endGMT'        : (start + datetime.timedelta(hours=hour + 1)).strftime('%Y-%m-%dT%H:%M:%S.0'),
+                    'activityLevel' : float(hour % 3)
+                } for hour in xrange(8)
+            ]
+        })
+
+    def get_rhr(self, params):
+        start = parse_date(params['fromDate'])
+        end = parse_date(params['untilDate'])
+        self.send_json({
+            'statisticsStartDate'   : str(start),
+            'statisticsEndDate'     : str(end),
+            'allMetrics'            : {
+                'metricsMap' : {
+                    'WELLNESS_RESTING_HEART_RATE' : [
+                        {'calendarDate' : str(day), 'value' : 50.0 + day.toordinal() % 10} for day in date_range(start, end)
+                    ]
+                }
+            }
+        })
+
+    def activity(self, activity_id):
+        return {
+            'activityId'    : activity_id,
+            'activityName'  : 'Stub Run %d' % activity_id,
+            'activityType'  : {'typeKey' : 'running'},
+            'startTimeGMT'  : '2019-01-01 12:00:00',
+            'distance'      : 5000.0 + activity_id % 1000,
+            'duration'      : 1500.0 + activity_id % 300
+        }
+
+    def get_activity_search(self, params):
+        start = int(params.get('start', 0))
+        count = min(int(params.get('limit', 20)), max(self.server.stub.activities - start, 0))
+        self.send_json([self.activity(self.server.stub.first_activity_id + start + index) for index in xrange(count)])
+
+    def get_activity_types(self, params):
+        self.send_json([{'typeId' : 1, 'typeKey' : 'running'}, {'typeId' : 2, 'typeKey' : 'cycling'}])
+
+    def get_activity_details(self, params, activity_id):
+        self.send_json(self.activity(int(activity_id)))
+
+    def send_zip(self, member_name):
+        zip_buffer = StringIO.StringIO()
+        files_zip = zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED)
+        # synthetic content, the downloader doesn't parse FIT files
+        files_zip.writestr(member_name, member_name * 1000)
+        files_zip.close()
+        self.send(200, zip_buffer.getvalue(), 'application/zip')
+
+    def get_monitoring_zip(self, params, date_str):
+        self.send_zip(date_str + '_%d.fit' % parse_date(date_str).toordinal())
+
+    def get_activity_zip(self, params, activity_id):
+        self.send_zip(activity_id + '.fit')
+
+
+def parse_date(date_str):
+    return datetime.datetime.strptime(date_str, '%Y-%m-%d').date()
+
+def date_range(start, end):
+    return [start + datetime.timedelta(day) for day in xrange((end - start).days + 1)]
+
+def epoch_ms(date):
+    if not isinstance(date, datetime.datetime):
+        date = datetime.datetime.combine(date, datetime.time())
+    return int((date - datetime.datetime(1970, 1, 1)).total_seconds() * 1000)
+
+
+#
+# A local stand in for Garmin Connect. Every request is delayed by latency seconds and, if rate_limit_every is set, every
+# rate_limit_every'th request is answered with a 429.
+#
+class GarminConnectStub():
+    garmin_urls = [Download.garmin_connect_base_url, 'https://sso.garmin.com']
+
+    def __init__(self, latency=0.0, rate_limit_every=0, activities=10, display_name='stub_user'):
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.activities = activities
+        self.first_activity_id = 1000000
+        self.display_name = display_name
+        self.requests = 0
+        self.throttled = 0
+        self.lock = threading.Lock()
+
+    def count_request(self):
+        # returns False if the request should be throttled
+        with self.lock:
+            self.requests += 1
+            if self.rate_limit_every and self.requests % self.rate_limit_every == 0:
+                self.throttled += 1
+                return False
+        return True
+
+    def start(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), GarminConnectStubHandler)
+        self.server.stub = self
+        self.thread = threading.Thread(target=self.server.serve_forever, name='garmin_connect_stub')
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def base_url(self):
+        return 'http://127.0.0.1:%d' % self.server.server_address[1]
+
+    def local_url(self, url):
+        for garmin_url in self.garmin_urls:
+            if url.startswith(garmin_url):
+                return self.base_url() + url[len(garmin_url):]
+        return url
+
+    def download_class(self):
+        # a Download with its URLs pointed at this server
+        class StubDownload(Download):
+            endpoint_concurrency = {self.local_url(url) : limit for url, limit in Download.endpoint_concurrency.iteritems()}
+        for name in dir(Download):
+            value = getattr(Download, name)
+            if isinstance(value, str) and value.startswith('https://'):
+                setattr(StubDownload, name, self.local_url(value))
+        return StubDownload
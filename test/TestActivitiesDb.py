@@ -42,7 +42,9 @@ class TestActivitiesDb(TestDBBase, unittest.TestCase):
                 'walk_activities_table' : GarminDB.WalkActivities,
                 'paddle_activities_table' : GarminDB.PaddleActivities,
                 'cycle_activities_table' : GarminDB.CycleActivities,
-                'elliptical_activities_table' : GarminDB.EllipticalActivities
+                'elliptical_activities_table' : GarminDB.EllipticalActivities,
+                'activity_hr_zones_table' : GarminDB.ActivityHrZones,
+                'activity_best_efforts_table' : GarminDB.ActivityBestEfforts
             }
         )
 
@@ -56,6 +58,13 @@ class TestActivitiesDb(TestDBBase, unittest.TestCase):
         self.assertGreater(GarminDB.CycleActivities.row_count(self.garmin_act_db), 0)
         self.assertGreater(GarminDB.EllipticalActivities.row_count(self.garmin_act_db), 0)
 
+    def test_garmin_act_db_views(self):
+        self.garmin_act_db.refresh_views()
+        for sport_activities in GarminDB.ActivitiesDB.sport_activities_tables():
+            with self.garmin_act_db.managed_session() as session:
+                view_rows = session.execute('SELECT COUNT(*) FROM ' + sport_activities.get_default_view_name()).scalar()
+            self.assertEqual(view_rows, sport_activities.row_count(self.garmin_act_db))
+
 if __name__ == '__main__':
     unittest.main(verbosity=2)
 
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+#
+# copyright Tom Goetz
+#
+
+import unittest, logging, sys, datetime
+import numpy as np
+
+sys.path.append('../.')
+
+from analyze_activities import TrainingLoad, HeartRateZones, BestEfforts, ActivityRecordsArrays
+
+
+root_logger = logging.getLogger()
+handler = logging.FileHandler('analyze_activities.log', 'w')
+root_logger.addHandler(handler)
+root_logger.setLevel(logging.INFO)
+
+logger = logging.getLogger(__name__)
+
+
+class TestAnalyzeActivities(unittest.TestCase):
+
+    def test_training_load_ewma(self):
+        loads = np.random.uniform(0, 200, 100)
+        seed = 50.0
+        decay = np.exp(-1.0 / TrainingLoad.acute_days)
+        expected = []
+        value = seed
+        for load in loads:
+            value = value * decay + load * (1 - decay)
+            expected.append(value)
+        self.assertTrue(np.allclose(TrainingLoad.ewma(loads, TrainingLoad.acute_days, seed), expected))
+
+    def test_training_load_monotony(self):
+        loads = np.random.uniform(0, 200, 30)
+        previous_loads = np.random.uniform(0, 200, TrainingLoad.monotony_days - 1)
+        (monotony, strain) = TrainingLoad.monotony_and_strain(loads, previous_loads)
+        all_loads = np.concatenate((previous_loads, loads))
+        for index in xrange(len(loads)):
+            week = all_loads[index:index + TrainingLoad.monotony_days]
+            self.assertAlmostEqual(monotony[index], week.mean() / week.std())
+            self.assertAlmostEqual(strain[index], week.sum() * week.mean() / week.std())
+
+    def test_hr_zones_time_in_zones(self):
+        zone_hrs = [100, 120, 140, 160, 180]
+        start = datetime.datetime(2018, 1, 1)
+        rows = []
+        # activity 1: 10 secs per record, one record per zone plus one below zone 1, a missing hr and a long pause
+        for index, hr in enumerate([90, 110, 130, 150, 170, 190, None, 150]):
+            rows.append((1, start + datetime.timedelta(0, index * 10), hr))
+        rows[-1] = (1, start + datetime.timedelta(0, 1000), 150)
+        # activity 2 interleaved out of order
+        rows += [(2, start + datetime.timedelta(0, 5), 185), (2, start, 100)]
+        records = ActivityRecordsArrays(rows, 1)
+        time_in_zones = HeartRateZones.time_in_zones(records, zone_hrs)
+        self.assertEqual(list(time_in_zones[1]), [10, 10, 10 + ActivityRecordsArrays.max_record_gap_secs, 10, 10])
+        self.assertEqual(list(time_in_zones[2]), [0, 0, 0, 0, 5])
+
+    def test_best_efforts(self):
+        start = datetime.datetime(2018, 1, 1)
+        rows = []
+        for activity_id in [1, 2, 3]:
+            distance = 0.0
+            for index in xrange(300):
+                distance += np.random.uniform(0, 8)
+                rows.append((activity_id, start + datetime.timedelta(activity_id, index * 3), distance))
+        records = ActivityRecordsArrays(rows, 1)
+        effort_meters = 400.0
+        efforts = BestEfforts.efforts(records, effort_meters)
+        for activity_id in [1, 2, 3]:
+            points = [(row[1], row[2]) for row in rows if row[0] == activity_id]
+            fastest = min([(points[end][0] - points[begin][0]).total_seconds() for end in xrange(len(points)) for begin in xrange(end)
+                if points[end][1] - points[begin][1] >= effort_meters])
+            self.assertEqual(efforts[activity_id][1], fastest)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+#
+# copyright Tom Goetz
+#
+
+import unittest, logging, sys, datetime, tempfile, shutil
+
+sys.path.append('../.')
+
+from HealthDB import CsvImporter
+
+
+root_logger = logging.getLogger()
+handler = logging.FileHandler('csv_importer.log', 'w')
+root_logger.addHandler(handler)
+root_logger.setLevel(logging.INFO)
+
+logger = logging.getLogger(__name__)
+
+
+class TestCsvImporter(unittest.TestCase):
+
+    cols_map = {
+        'Date'      : ('timestamp', CsvImporter.map_mdy_date),
+        'Steps'     : ('steps', CsvImporter.map_integer),
+        'Elevation' : ('elevation', CsvImporter.map_meters),
+    }
+
+    @classmethod
+    def setUpClass(cls):
+        cls.temp_dir = tempfile.mkdtemp()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.temp_dir)
+
+    def test_process_file(self):
+        filename = self.temp_dir + '/test.csv'
+        with open(filename, 'w') as file:
+            file.write('Date,Steps,Elevation,Notes\n')
+            for index in xrange(25):
+                date = '01/%02d/19' % (index / 2 + 1)
+                if index % 2:
+                    date += ' 10:30'
+                file.write('%s,%s,100,note %d\n' % (date, index if index != 3 else 'n/a', index))
+            file.write('\n')
+        batches = []
+        csv_importer = CsvImporter(filename, self.cols_map, batches.append)
+        csv_importer.batch_size = 10
+        csv_importer.process_file(True)
+        self.assertEqual([len(batch) for batch in batches], [10, 10, 5])
+        entries = [entry for batch in batches for entry in batch]
+        self.assertEqual(entries[0], {'timestamp' : datetime.datetime(2019, 1, 1), 'steps' : 0, 'elevation' : 328.084, 'Notes' : 'note 0'})
+        self.assertEqual(entries[1]['timestamp'], datetime.datetime(2019, 1, 1, 10, 30))
+        self.assertIsNone(entries[3]['steps'])
+        self.assertEqual(entries[24]['timestamp'], datetime.datetime(2019, 1, 13))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
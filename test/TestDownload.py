@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+
+#
+# copyright Tom Goetz
+#
+
+import unittest, logging, sys, time, os, datetime, json, tempfile, shutil, zipfile
+
+sys.path.append('../.')
+
+import GarminDBConfig, GarminDBConfigManager
+import GarminDB
+from FileProcessor import FileProcessor
+from JsonFileProcessor import JsonFileProcessor, parse_datetime
+from download_garmin import RateLimiter, FileWriter, Download, DownloadCancelled, DownloadPlanner, date_range
+from GarminConnectStub import GarminConnectStub
+
+
+root_logger = logging.getLogger()
+handler = logging.FileHandler('download.log', 'w')
+root_logger.addHandler(handler)
+root_logger.setLevel(logging.INFO)
+
+logger = logging.getLogger(__name__)
+
+
+class TestDownload(unittest.TestCase):
+
+    def test_rate_limiter_rate(self):
+        rate = 20.0
+        requests = 11
+        rate_limiter = RateLimiter(rate)
+        start = time.time()
+        for request in xrange(requests):
+            rate_limiter.acquire()
+        # the first request uses the initial token
+        self.assertGreaterEqual(time.time() - start, (requests - 1) / rate * 0.9)
+
+    def test_rate_limiter_adapts(self):
+        rate_limiter = RateLimiter(8.0)
+        rate_limiter.backoff()
+        self.assertEqual(rate_limiter.rate, 4.0)
+        for backoff in xrange(10):
+            rate_limiter.backoff()
+        self.assertEqual(rate_limiter.rate, 8.0 * RateLimiter.min_rate_fraction)
+        for recover in xrange(20):
+            rate_limiter.recover()
+        self.assertEqual(rate_limiter.rate, 8.0)
+
+    def test_file_writer(self):
+        temp_dir = tempfile.mkdtemp()
+        written = []
+        file_writer = FileWriter(written.append)
+        filenames = [temp_dir + '/file_%d.json' % index for index in xrange(10)]
+        for filename in filenames:
+            file_writer.write(filename, filename)
+        file_writer.flush()
+        self.assertEqual(written, filenames)
+        for filename in filenames:
+            with open(filename) as file:
+                self.assertEqual(file.read(), filename)
+        shutil.rmtree(temp_dir)
+
+    def test_download_cancel(self):
+        download = Download()
+        download.cancel()
+        # cancelled requests fail before anything is sent
+        self.assertRaises(DownloadCancelled, download.get, download.garmin_connect_activity_types_url)
+
+    def cancel_and_get(self, download, url):
+        download.cancel()
+        return download.get(url)
+
+    def test_download_cancel_concurrently(self):
+        download = Download()
+        url = download.garmin_connect_activity_types_url
+        self.assertRaises(DownloadCancelled, download.run_concurrently, lambda url: self.cancel_and_get(download, url), [url])
+        # a cancel only stops the run it happened in
+        self.assertEqual(download.run_concurrently(lambda item: item * 2, [1, 2, 3]), [2, 4, 6])
+
+    def test_run_stat_stops_on_failure(self):
+        download = Download()
+        for concurrency in [1, 4]:
+            download.concurrency = concurrency
+            self.assertTrue(download.run_stat(lambda item: True, range(10)))
+            self.assertFalse(download.run_stat(lambda item: item != 3, range(10)))
+
+    def download_from_stub(self, stub, concurrency):
+        temp_dir = tempfile.mkdtemp()
+        GarminDBConfig.directories.update({'relative_to_home' : False, 'base_dir' : temp_dir})
+        GarminDBConfig.download.update({'concurrency' : concurrency, 'rate' : 1000.0})
+        stub.start()
+        try:
+            download = stub.download_class()()
+            self.assertTrue(download.login())
+            self.assertEqual(download.display_name, stub.display_name)
+            date = datetime.date(2019, 1, 1)
+            days = 4
+            download.get_daily_summaries(temp_dir, date, days, False)
+            download.get_monitoring(date, days)
+            download.get_activities(temp_dir, stub.activities, False)
+            for day in xrange(days + 1):
+                self.assertTrue(os.path.isfile(temp_dir + '/daily_summary_%s.json' % str(date + datetime.timedelta(day))))
+            self.assertEqual(len(os.listdir(download.temp_dir)), days + 1 + stub.activities)
+            shutil.rmtree(download.temp_dir)
+        finally:
+            stub.stop()
+            shutil.rmtree(temp_dir)
+
+    def test_download_stub(self):
+        self.download_from_stub(GarminConnectStub(latency=0.01), 1)
+
+    def test_download_stub_throttled(self):
+        stub = GarminConnectStub(rate_limit_every=3)
+        self.download_from_stub(stub, 4)
+        self.assertGreater(stub.throttled, 0)
+
+    def test_download_ranges(self):
+        temp_dir = tempfile.mkdtemp()
+        GarminDBConfig.directories.update({'relative_to_home' : False, 'base_dir' : temp_dir})
+        GarminDBConfig.download.update({'concurrency' : 1, 'rate' : 1000.0})
+        stub = GarminConnectStub().start()
+        try:
+            download = stub.download_class()()
+            self.assertTrue(download.login())
+            login_requests = stub.requests
+            date = datetime.date(2019, 1, 1)
+            days = 40
+            download.get_weight(temp_dir, date, days, False)
+            download.get_rhr(temp_dir, date, days, False)
+            ranges = (days + download.range_days) / download.range_days
+            self.assertEqual(stub.requests - login_requests, 2 * ranges)
+            for day in [date + datetime.timedelta(day) for day in xrange(days + 1)]:
+                with open(temp_dir + '/weight_%s.json' % str(day)) as file:
+                    weight = json.load(file)
+                self.assertEqual(weight['startDate'], str(day))
+                self.assertEqual([entry['calendarDate'] for entry in weight['dateWeightList']], [str(day)])
+                with open(temp_dir + '/rhr_%s.json' % str(day)) as file:
+                    rhr = json.load(file)
+                self.assertEqual(rhr['statisticsStartDate'], str(day))
+                self.assertEqual(len(rhr['allMetrics']['metricsMap']['WELLNESS_RESTING_HEART_RATE']), 1)
+            # days already downloaded aren't requested again
+            download.get_weight(temp_dir, date, days, False)
+            self.assertEqual(stub.requests - login_requests, 2 * ranges)
+            shutil.rmtree(download.temp_dir)
+        finally:
+            stub.stop()
+            shutil.rmtree(temp_dir)
+
+    def test_download_planner(self):
+        temp_dir = tempfile.mkdtemp()
+        GarminDBConfig.directories.update({'relative_to_home' : False, 'base_dir' : temp_dir})
+        db_params_dict = GarminDBConfigManager.get_db_params()
+        weight_dir = GarminDBConfigManager.get_or_create_weight_dir()
+        start = datetime.date(2019, 1, 1)
+        end = datetime.date(2019, 1, 10)
+        for day in [datetime.date(2019, 1, 2), datetime.date(2019, 1, 3)]:
+            open(weight_dir + '/weight_%s.json' % str(day), 'w').close()
+        GarminDB.Weight.find_or_create(GarminDB.GarminDB(db_params_dict), {'day' : datetime.date(2019, 1, 5), 'weight' : 180.0})
+        days = DownloadPlanner(db_params_dict, False).missing_days('weight', start, end)
+        self.assertEqual(len(days), 7)
+        self.assertNotIn(datetime.date(2019, 1, 5), days)
+        # a new file invalidates the cached listing
+        open(weight_dir + '/weight_2019-01-10.json', 'w').close()
+        days = DownloadPlanner(db_params_dict, False).missing_days('weight', start, end)
+        self.assertEqual(days[-1], datetime.date(2019, 1, 9))
+        self.assertEqual(len(DownloadPlanner(db_params_dict, True).missing_days('weight', start, end)), 10)
+        # with latest, the latest day in the DB through today is downloaded again and earlier days only when checking for gaps
+        latest_day = datetime.date(2019, 1, 5)
+        recent_days = date_range(latest_day, (datetime.date.today() - latest_day).days)
+        self.assertEqual(DownloadPlanner(db_params_dict, False).plan('weight', start, end, latest=True), [(recent_days, True)])
+        self.assertEqual(DownloadPlanner(db_params_dict, False).plan('weight', start, end, latest=True, gaps=True),
+            [([datetime.date(2019, 1, 1), datetime.date(2019, 1, 4)], False), (recent_days, True)])
+        shutil.rmtree(temp_dir)
+
+    def write_zip(self, zip_filename, filenames):
+        files_zip = zipfile.ZipFile(zip_filename, 'w')
+        for filename in filenames:
+            files_zip.writestr(filename, filename)
+        files_zip.close()
+
+    def test_archive_file(self):
+        temp_dir = tempfile.mkdtemp()
+        download = Download()
+        saved = []
+        download.file_listener = saved.append
+        archive_filename = download.monitoring_archive_filename(temp_dir, datetime.date(2019, 1, 2))
+        self.write_zip(temp_dir + '/2019-01-01.zip', ['1_WELLNESS.fit', '2_WELLNESS.fit'])
+        self.write_zip(temp_dir + '/2019-01-02.zip', ['2_WELLNESS.fit', '3_WELLNESS.fit'])
+        download.archive_file(temp_dir + '/2019-01-01.zip', archive_filename)
+        download.archive_file(temp_dir + '/2019-01-02.zip', archive_filename)
+        archived_files = [archive_filename + '/' + filename for filename in ['1_WELLNESS.fit', '2_WELLNESS.fit', '3_WELLNESS.fit']]
+        self.assertEqual(saved, archived_files)
+        self.assertEqual(FileProcessor.archive_to_files(archive_filename, r'.*\.fit'), archived_files)
+        # archived files are dated when they're added to the archive
+        self.assertEqual(FileProcessor.archive_to_files(archive_filename, r'.*\.fit', datetime.datetime.now() - datetime.timedelta(hours=1)), archived_files)
+        self.assertEqual(FileProcessor.archive_to_files(archive_filename, r'.*\.fit', datetime.datetime.now() + datetime.timedelta(hours=1)), [])
+        # files archived after the last imported one are new
+        archived_time = FileProcessor.archived_time(archived_files[0])
+        self.assertEqual(FileProcessor.archive_to_files(archive_filename, r'.*\.fit', archived_time - datetime.timedelta(seconds=1)), archived_files)
+        self.assertEqual(FileProcessor.archive_to_files(archive_filename, r'.*\.fit', max([FileProcessor.archived_time(file_name) for file_name in archived_files])), [])
+        extract_dir = tempfile.mkdtemp()
+        local_file_name = FileProcessor.extract_archived_file(archived_files[2], extract_dir)
+        self.assertEqual(local_file_name, extract_dir + '/3_WELLNESS.fit')
+        with open(local_file_name) as file:
+            self.assertEqual(file.read(), '3_WELLNESS.fit')
+        shutil.rmtree(extract_dir)
+        shutil.rmtree(temp_dir)
+        shutil.rmtree(download.temp_dir)
+
+    def test_compressed_json(self):
+        temp_dir = tempfile.mkdtemp()
+        json_data = {'calendarDate' : '2019-01-01', 'values' : range(100)}
+        file_writer = FileWriter()
+        for filename in ['plain.json', 'compressed.json' + FileProcessor.compressed_extension]:
+            file_writer.write(temp_dir + '/' + filename, json.dumps(json_data))
+        file_writer.flush()
+        self.assertTrue(FileProcessor.file_exists(temp_dir + '/compressed.json'))
+        self.assertEqual(FileProcessor.dir_to_files(temp_dir, r'compressed\.json'), [temp_dir + '/compressed.json' + FileProcessor.compressed_extension])
+        json_processor = JsonFileProcessor(None, temp_dir, r'\.json', False, 0)
+        json_processor.conversions = {}
+        self.assertEqual(json_processor.file_count(), 2)
+        for filename in json_processor.file_names:
+            self.assertEqual(json_processor.parse_file(filename), json_data)
+        shutil.rmtree(temp_dir)
+
+    def test_json_conversions(self):
+        self.assertEqual(parse_datetime('2019-01-02'), datetime.datetime(2019, 1, 2))
+        self.assertEqual(parse_datetime('2019-01-02T03:04:05.0'), datetime.datetime(2019, 1, 2, 3, 4, 5))
+        self.assertEqual(parse_datetime('2019-01-02 03:04:05.25'), datetime.datetime(2019, 1, 2, 3, 4, 5, 250000))
+        # other formats fall back to dateutil
+        self.assertEqual(parse_datetime('Jan 2 2019'), datetime.datetime(2019, 1, 2))
+        temp_dir = tempfile.mkdtemp()
+        json_data = {
+            'calendarDate'  : '2019-01-02',
+            'dailySleepDTO' : {'calendarDate' : '2019-01-03'},
+            'sleepLevels'   : [{'startGMT' : '2019-01-02T03:04:05.0'}, {'startGMT' : None}]
+        }
+        with open(temp_dir + '/sleep.json', 'w') as file:
+            file.write(json.dumps(json_data))
+        json_processor = JsonFileProcessor(temp_dir + '/sleep.json', None, r'\.json', False, 0)
+        json_processor.conversions = {'dailySleepDTO.calendarDate' : parse_datetime, 'sleepLevels[].startGMT' : parse_datetime}
+        parsed_json = json_processor.parse_file(temp_dir + '/sleep.json')
+        # only the declared paths are converted
+        self.assertEqual(parsed_json['calendarDate'], '2019-01-02')
+        self.assertEqual(parsed_json['dailySleepDTO']['calendarDate'], datetime.datetime(2019, 1, 3))
+        self.assertEqual([level['startGMT'] for level in parsed_json['sleepLevels']], [datetime.datetime(2019, 1, 2, 3, 4, 5), None])
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -69,6 +69,131 @@ class TestGarminDbObjects(unittest.TestCase):
         file_types_list = list(GarminDB.File.FileType)
         self.assertIn(GarminDB.File.FileType.convert(Fit.FieldEnums.FileType.goals), file_types_list)
 
+    def sleep_events(self, start, minutes, event):
+        return [
+            {
+                'timestamp' : start + datetime.timedelta(minutes=minute),
+                'event'     : event,
+                'duration'  : datetime.time(0, 1)
+            } for minute in xrange(minutes)
+        ]
+
+    def test_sleep_events_replace(self):
+        garmindb = GarminDB.GarminDB(self.db_params_dict)
+        start = datetime.datetime(2019, 1, 1, 22, 0, 0)
+        end = start + datetime.timedelta(hours=8)
+        GarminDB.SleepEvents.replace_for_period(garmindb, start, end, self.sleep_events(start, 60, 'light_sleep'))
+        self.assertEqual(GarminDB.SleepEvents.row_count_for_period(garmindb, start, end), 60)
+        # reimporting the night replaces its events instead of adding to them
+        GarminDB.SleepEvents.replace_for_period(garmindb, start, end, self.sleep_events(start, 30, 'deep_sleep'))
+        self.assertEqual(GarminDB.SleepEvents.row_count_for_period(garmindb, start, end), 30)
+        self.assertEqual(GarminDB.SleepEvents.row_count(garmindb, GarminDB.SleepEvents.event, 'light_sleep'), 0)
+
+    def test_weight_upsert(self):
+        garmindb = GarminDB.GarminDB(self.db_params_dict)
+        start = datetime.date(2015, 1, 1)
+        end = start + datetime.timedelta(1000)
+        with garmindb.managed_session() as session:
+            GarminDB.Weight._upsert(session, [{'day' : start + datetime.timedelta(day), 'weight' : 180.0} for day in xrange(600)])
+        # overlaps the first upsert, existing days are updated and new days inserted
+        with garmindb.managed_session() as session:
+            GarminDB.Weight._upsert(session, [{'day' : start + datetime.timedelta(day), 'weight' : 175.0} for day in xrange(400, 1000)])
+        self.assertEqual(GarminDB.Weight.row_count_for_period(garmindb, start, end), 1000)
+        self.assertEqual(GarminDB.Weight.find_one(garmindb, {'day' : start}).weight, 180.0)
+        self.assertEqual(GarminDB.Weight.find_one(garmindb, {'day' : start + datetime.timedelta(500)}).weight, 175.0)
+
+    def test_composite_key_upsert(self):
+        garmin_act_db = GarminDB.ActivitiesDB(self.db_params_dict)
+        activity_id = 10000004
+        with garmin_act_db.managed_session() as session:
+            GarminDB.Activities._find_or_create(session, {'activity_id' : activity_id})
+            session.flush()
+            GarminDB.ActivityLaps._upsert(session, [{'activity_id' : activity_id, 'lap' : lap, 'calories' : 100} for lap in xrange(3)])
+        # rows that share the first key column are still distinct rows
+        with garmin_act_db.managed_session() as session:
+            GarminDB.ActivityLaps._upsert(session, [{'activity_id' : activity_id, 'lap' : lap, 'calories' : 200} for lap in xrange(2, 5)])
+        self.assertEqual(GarminDB.ActivityLaps.row_count(garmin_act_db, GarminDB.ActivityLaps.activity_id, activity_id), 5)
+        self.assertEqual(GarminDB.ActivityLaps.find_one(garmin_act_db, {'activity_id' : activity_id, 'lap' : 0}).calories, 100)
+        self.assertEqual(GarminDB.ActivityLaps.find_one(garmin_act_db, {'activity_id' : activity_id, 'lap' : 2}).calories, 200)
+
+    def test_activity_tracks(self):
+        db_params_dict = dict(self.db_params_dict, compact_records=True)
+        garmin_act_db = GarminDB.ActivitiesDB(db_params_dict)
+        activity_id = 10000001
+        start = datetime.datetime(2019, 1, 1, 12, 0, 0)
+        with garmin_act_db.managed_session() as session:
+            records_writer = GarminDB.ActivityRecordsWriter(session, activity_id, garmin_act_db.compact_records)
+            for secs in xrange(3600):
+                records_writer.write({
+                    'timestamp'     : start + datetime.timedelta(seconds=secs),
+                    'position_lat'  : 40.0 + secs * 0.00001,
+                    'position_long' : -105.0,
+                    'distance'      : secs * 0.0025,
+                    'hr'            : 120 + secs % 30 if secs % 100 else None,
+                })
+            records_writer.flush()
+        self.assertEqual(GarminDB.ActivityRecords.row_count(garmin_act_db, GarminDB.ActivityRecords.activity_id, activity_id), 0)
+        arrays = GarminDB.ActivityTracks.get_arrays(garmin_act_db, activity_id)
+        self.assertEqual(len(arrays['hr']), 3600)
+        self.assertEqual(arrays['hr'][101], 131)
+        self.assertTrue(all(arrays['hr'][::100] != arrays['hr'][::100]))
+        self.assertAlmostEqual(arrays['position_lat'][3599], 40.03599, 7)
+        self.assertEqual(arrays['timestamp'][60].astype(datetime.datetime), start + datetime.timedelta(minutes=1))
+        # the view gives row level access to the track
+        with garmin_act_db.managed_session() as session:
+            rows = session.execute('SELECT record, hr, distance FROM activity_track_records WHERE activity_id = %d AND record <= 3' % activity_id).fetchall()
+            self.assertEqual([tuple(row) for row in rows], [(1, None, 0.0), (2, 121.0, 0.0025), (3, 122.0, 0.005)])
+            # a reimported track with the same number of records replaces the one the connection already decoded
+            records_writer = GarminDB.ActivityRecordsWriter(session, activity_id, garmin_act_db.compact_records)
+            for secs in xrange(3600):
+                records_writer.write({'timestamp' : start + datetime.timedelta(seconds=secs), 'hr' : 90})
+            records_writer.flush()
+            rows = session.execute('SELECT record, hr FROM activity_track_records WHERE activity_id = %d AND record <= 2' % activity_id).fetchall()
+        self.assertEqual([tuple(row) for row in rows], [(1, 90.0), (2, 90.0)])
+        self.assertGreaterEqual(GarminDB.ActivityTracks.record_count(garmin_act_db), 3600)
+
+    def test_activity_bounds(self):
+        garmin_act_db = GarminDB.ActivitiesDB(self.db_params_dict)
+        activity_id = 10000002
+        start = datetime.datetime(2019, 1, 1, 12, 0, 0)
+        with garmin_act_db.managed_session() as session:
+            records_writer = GarminDB.ActivityRecordsWriter(session, activity_id)
+            for secs in xrange(3600):
+                records_writer.write({
+                    'timestamp'     : start + datetime.timedelta(seconds=secs),
+                    'position_lat'  : -45.0 + secs * 0.00001,
+                    'position_long' : 170.0 + secs * 0.00001,
+                })
+            records_writer.flush()
+            for lap in xrange(2):
+                GarminDB.ActivityLaps._create_or_update(session, {
+                    'activity_id'   : activity_id,
+                    'lap'           : lap + 1,
+                    'start_time'    : start + datetime.timedelta(minutes=lap * 30),
+                    'stop_time'     : start + datetime.timedelta(minutes=lap * 30 + 29, seconds=59),
+                })
+            GarminDB.ActivityBounds._update(session, activity_id)
+        activities = GarminDB.Activities.get_in_box(garmin_act_db, -45.01, -44.99, 169.99, 170.01)
+        self.assertEqual([activity.activity_id for activity in activities], [activity_id])
+        laps = GarminDB.ActivityLaps.get_in_box(garmin_act_db, -44.975, -44.97, 170.025, 170.03)
+        self.assertEqual([(lap.activity_id, lap.lap) for lap in laps], [(activity_id, 2)])
+        self.assertEqual(GarminDB.Activities.get_in_box(garmin_act_db, -46.0, -45.5, 170.0, 170.1), [])
+        # ~5.5 kms south of the activity's box
+        self.assertEqual(len(GarminDB.Activities.get_near(garmin_act_db, -45.05, 170.0, 6.0)), 1)
+        self.assertEqual(GarminDB.Activities.get_near(garmin_act_db, -45.05, 170.0, 5.0), [])
+        # activities without records are indexed by their start and stop locations, ids from file names are strings
+        with garmin_act_db.managed_session() as session:
+            GarminDB.Activities._create_or_update_not_none(session, {
+                'activity_id'   : 10000003,
+                'start_lat'     : -46.0,
+                'start_long'    : 171.0,
+                'stop_lat'      : -46.01,
+                'stop_long'     : 171.01,
+            })
+            GarminDB.ActivityBounds._update(session, '10000003')
+        activities = GarminDB.Activities.get_in_box(garmin_act_db, -46.1, -45.9, 170.9, 171.1)
+        self.assertEqual([activity.activity_id for activity in activities], [10000003])
+
 
 if __name__ == '__main__':
     unittest.main(verbosity=2)
@@ -34,7 +34,9 @@ class TestGarminSummaryDB(TestSummaryDBBase, unittest.TestCase):
                 'summary_table' : GarminDB.Summary,
                 'months_table' : GarminDB.MonthsSummary,
                 'weeks_table' : GarminDB.WeeksSummary,
-                'days_table' : GarminDB.DaysSummary
+                'days_table' : GarminDB.DaysSummary,
+                'training_load_table' : GarminDB.TrainingLoad,
+                'daily_sketches_table' : GarminDB.DailySketch
             }
         )
 
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+#
+# copyright Tom Goetz
+#
+
+import unittest, logging, sys, json, tempfile, shutil
+
+sys.path.append('../.')
+
+from JsonFileProcessor import JsonFileProcessor
+
+
+root_logger = logging.getLogger()
+handler = logging.FileHandler('json_file_processor.log', 'w')
+root_logger.addHandler(handler)
+root_logger.setLevel(logging.INFO)
+
+logger = logging.getLogger(__name__)
+
+
+#
+# Keeps its "DB" in memory: updates are pending until commit and dropped by rollback.
+#
+class TestJsonData(JsonFileProcessor):
+    commit_files = 3
+
+    def __init__(self, input_dir):
+        super(TestJsonData, self).__init__(None, input_dir, r'\.json', False, 0)
+        self.conversions = {}
+        self.pending = []
+        self.committed = []
+        self.commits = 0
+        self.applied = []
+
+    def process_json(self, json_data):
+        self.pending.append(json_data['value'])
+        if json_data.get('fail') or (json_data.get('fail_reapply') and json_data['value'] in self.applied):
+            raise ValueError('bad file')
+        self.applied.append(json_data['value'])
+        return 1
+
+    def commit(self):
+        self.committed += self.pending
+        self.pending = []
+        self.commits += 1
+
+    def rollback(self):
+        self.pending = []
+
+
+class TestJsonFileProcessor(unittest.TestCase):
+
+    def test_batched_processing(self):
+        temp_dir = tempfile.mkdtemp()
+        for index in xrange(10):
+            with open(temp_dir + '/file_%02d.json' % index, 'w') as file:
+                if index == 4:
+                    file.write('{not json')
+                else:
+                    file.write(json.dumps({'value' : index, 'fail' : index == 7}))
+        json_data = TestJsonData(temp_dir)
+        json_data.process()
+        # the unparsable file and the file that failed to import are skipped without losing the rest of their batches
+        self.assertEqual(sorted(json_data.committed), [0, 1, 2, 3, 5, 6, 8, 9])
+        self.assertLess(json_data.commits, json_data.file_count())
+        shutil.rmtree(temp_dir)
+
+    def test_reapply_failure(self):
+        temp_dir = tempfile.mkdtemp()
+        for index in xrange(6):
+            with open(temp_dir + '/file_%02d.json' % index, 'w') as file:
+                file.write(json.dumps({'value' : index, 'fail' : index == 2, 'fail_reapply' : index == 1}))
+        json_data = TestJsonData(temp_dir)
+        json_data.file_names.sort()
+        json_data.process()
+        # a file that fails when its batch is reapplied is dropped too
+        self.assertEqual(sorted(json_data.committed), [0, 3, 4, 5])
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -6,12 +6,14 @@
 
 import unittest, os, logging, sys, datetime, re
 
+import sqlalchemy
 from sqlalchemy.exc import IntegrityError
 
 from TestDBBase import TestDBBase
 
 sys.path.append('../.')
 
+import HealthDB
 import GarminDB
 import Fit
 from FileProcessor import *
@@ -57,6 +59,55 @@ class TestMonitoringDB(TestDBBase, unittest.TestCase):
         self.assertGreater(max, 0)
         self.assertLess(max, 100000)
 
+    def test_garmin_mon_db_active_calories(self):
+        end_ts = GarminDB.Monitoring.latest_time(self.db)
+        start_ts = end_ts - datetime.timedelta(days=7)
+        per_activity_type = 0
+        for activity_type in GarminDB.Monitoring.active_calories_activity_types:
+            active_calories = GarminDB.Monitoring.get_col_avg_of_max_per_day_for_value(self.db, GarminDB.Monitoring.active_calories,
+                GarminDB.Monitoring.activity_type, activity_type, start_ts, end_ts)
+            if active_calories is not None:
+                per_activity_type += active_calories
+        self.assertAlmostEqual(GarminDB.Monitoring.get_active_calories(self.db, start_ts, end_ts), per_activity_type)
+
+    def test_garmin_mon_db_bucketed(self):
+        end_ts = GarminDB.Monitoring.latest_time(self.db)
+        start_ts = end_ts - datetime.timedelta(days=28)
+        (days, steps) = GarminDB.Monitoring.bucketed(self.db, GarminDB.Monitoring.steps, sqlalchemy.func.max, start_ts, end_ts, 'day', fill=0)
+        self.assertIn(len(days), [28, 29])
+        self.assertEqual(len(steps), len(days))
+        self.assertEqual(sum(steps), GarminDB.Monitoring.get_col_sum_of_max_per_day(self.db, GarminDB.Monitoring.steps, start_ts, end_ts))
+        (weeks, steps) = GarminDB.Monitoring.bucketed(self.db, GarminDB.Monitoring.steps, sqlalchemy.func.sum, start_ts, end_ts, 'week')
+        self.assertEqual(weeks[0].weekday(), 0)
+        (months, steps) = GarminDB.Monitoring.bucketed(self.db, GarminDB.Monitoring.steps, sqlalchemy.func.sum, start_ts, end_ts, 'month')
+        self.assertEqual(months[0].day, 1)
+
+    def test_garmin_mon_db_hr_sketch(self):
+        end_ts = GarminDB.MonitoringHeartRate.latest_time(self.db)
+        start_ts = end_ts - datetime.timedelta(days=7)
+        sketch = GarminDB.MonitoringHeartRate.get_col_sketch(self.db, GarminDB.MonitoringHeartRate.heart_rate, start_ts, end_ts, True)
+        self.assertEqual(sketch.quantile(1.0), GarminDB.MonitoringHeartRate.get_col_max(self.db, GarminDB.MonitoringHeartRate.heart_rate, start_ts, end_ts))
+        self.assertEqual(sketch.quantile(0.0), GarminDB.MonitoringHeartRate.get_col_min(self.db, GarminDB.MonitoringHeartRate.heart_rate, start_ts, end_ts, True))
+        stats = sketch.percentile_stats('hr')
+        self.assertLessEqual(stats['hr_p5'], stats['hr_p50'])
+        self.assertLessEqual(stats['hr_p50'], stats['hr_p95'])
+        merged = HealthDB.QuantileSketch.from_string(sketch.to_string())
+        self.assertEqual(merged.counts, sketch.counts)
+
+    def test_garmin_mon_db_hr_rollup(self):
+        GarminDB.MonitoringHeartRate.refresh_rollup(self.db)
+        end_ts = datetime.datetime.combine(GarminDB.MonitoringHeartRate.latest_time(self.db).date(), datetime.time.min)
+        start_ts = end_ts - datetime.timedelta(days=1)
+        days = GarminDB.MonitoringHeartRate.get_rollup_for_period(self.db, start_ts, end_ts, 1)
+        self.assertEqual(len(days), 1)
+        (bucket, min_value, max_value, avg_value, count) = days[0]
+        self.assertEqual(bucket, start_ts)
+        self.assertEqual(min_value, GarminDB.MonitoringHeartRate.get_col_min(self.db, GarminDB.MonitoringHeartRate.heart_rate, start_ts, end_ts, True))
+        self.assertEqual(max_value, GarminDB.MonitoringHeartRate.get_col_max(self.db, GarminDB.MonitoringHeartRate.heart_rate, start_ts, end_ts))
+        buckets = GarminDB.MonitoringHeartRate.get_rollup_for_period(self.db, start_ts, end_ts, 1000)
+        self.assertLessEqual(len(buckets), 24 * 12)
+        self.assertEqual(sum([bucket[4] for bucket in buckets]), count)
+
     def test_garmin_mon_db_uptodate(self):
         uptodate_tables = {
                 'monitoring_hr_table'           : GarminDB.MonitoringHeartRate,
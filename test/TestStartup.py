@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+
+#
+# copyright Tom Goetz
+#
+
+import unittest, logging, sys, subprocess
+
+
+root_logger = logging.getLogger()
+handler = logging.FileHandler('startup.log', 'w')
+root_logger.addHandler(handler)
+root_logger.setLevel(logging.INFO)
+
+logger = logging.getLogger(__name__)
+
+
+class TestStartup(unittest.TestCase):
+    # seconds
+    startup_budget = 1.0
+    # modules that only the import and analyze stages should load
+    stage_modules = ['import_garmin', 'import_garmin_activities', 'analyze_garmin', 'analyze_activities', 'TcxFile', 'progressbar', 'numpy']
+
+    def test_garmin_startup(self):
+        script = 'import sys, time; start = time.time(); import garmin; print time.time() - start; print " ".join(sys.modules.keys())'
+        output = subprocess.check_output([sys.executable, '-c', script], cwd='..').splitlines()
+        startup_time = float(output[-2])
+        modules = output[-1].split()
+        logger.info("garmin.py startup time: %f", startup_time)
+        self.assertLess(startup_time, self.startup_budget)
+        for module in self.stage_modules:
+            self.assertNotIn(module, modules)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+#
+# copyright Tom Goetz
+#
+
+import unittest, logging, sys, datetime, tempfile, shutil, gzip
+
+sys.path.append('../.')
+
+from TcxFile import TcxFile
+
+
+root_logger = logging.getLogger()
+handler = logging.FileHandler('tcx_file.log', 'w')
+root_logger.addHandler(handler)
+root_logger.setLevel(logging.INFO)
+
+logger = logging.getLogger(__name__)
+
+
+tcx_header = '''<?xml version="1.0" encoding="UTF-8"?>
+<TrainingCenterDatabase xmlns="http://www.garmin.com/xmlschemas/TrainingCenterDatabase/v2" xmlns:ns3="http://www.garmin.com/xmlschemas/ActivityExtension/v2">
+<Activities><Activity Sport="Running"><Id>2019-01-01T12:00:00.000Z</Id>
+'''
+tcx_lap_start = '<Lap StartTime="%s"><TotalTimeSeconds>%d</TotalTimeSeconds><DistanceMeters>%f</DistanceMeters><Calories>%d</Calories>' \
+    '<Extensions><ns3:LX><ns3:AvgSpeed>2.5</ns3:AvgSpeed></ns3:LX></Extensions><Track>\n'
+tcx_trackpoint = '<Trackpoint><Time>%s</Time><Position><LatitudeDegrees>%f</LatitudeDegrees><LongitudeDegrees>%f</LongitudeDegrees></Position>' \
+    '<AltitudeMeters>1500.0</AltitudeMeters><DistanceMeters>%f</DistanceMeters><HeartRateBpm><Value>%d</Value></HeartRateBpm>' \
+    '<Extensions><ns3:TPX><ns3:Speed>2.5</ns3:Speed><ns3:RunCadence>%d</ns3:RunCadence></ns3:TPX></Extensions></Trackpoint>\n'
+tcx_lap_end = '</Track></Lap>\n'
+tcx_footer = '<Creator><Name>Forerunner 935</Name><Version><VersionMajor>9</VersionMajor><VersionMinor>10</VersionMinor></Version></Creator>' \
+    '</Activity></Activities></TrainingCenterDatabase>\n'
+
+
+class TestTcxFile(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.temp_dir = tempfile.mkdtemp()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.temp_dir)
+
+    def write_tcx(self, file, laps, lap_secs):
+        start = datetime.datetime(2019, 1, 1, 12, 0, 0)
+        file.write(tcx_header)
+        for lap in xrange(laps):
+            lap_start = start + datetime.timedelta(seconds=lap * lap_secs)
+            file.write(tcx_lap_start % (lap_start.strftime('%Y-%m-%dT%H:%M:%S.000Z'), lap_secs, lap_secs * 2.5, 100))
+            for sec in xrange(lap_secs):
+                secs = lap * lap_secs + sec
+                timestamp = start + datetime.timedelta(seconds=secs)
+                file.write(tcx_trackpoint % (timestamp.strftime('%Y-%m-%dT%H:%M:%S.000Z'), 40.0 + secs * 0.0001, -105.0, secs * 2.5, 120 + secs % 40, 80 + secs % 10))
+            file.write(tcx_lap_end)
+        file.write(tcx_footer)
+
+    def check_tcx(self, filename, laps, lap_secs):
+        tcx = TcxFile(filename)
+        records = 0
+        lap_messages = []
+        for (message_type, message) in tcx.messages():
+            if message_type == 'record':
+                self.assertEqual(message['timestamp'], datetime.datetime(2019, 1, 1, 12, 0, 0) + datetime.timedelta(seconds=records))
+                self.assertEqual(message['speed'], 2.5)
+                records += 1
+            else:
+                lap_messages.append(message)
+        self.assertEqual(records, laps * lap_secs)
+        self.assertEqual(len(lap_messages), laps)
+        self.assertEqual(lap_messages[0]['moving_time'], lap_secs)
+        self.assertEqual(lap_messages[0]['elapsed_time'], lap_secs - 1)
+        self.assertEqual(lap_messages[0]['max_cadence'], 89)
+        self.assertEqual(lap_messages[-1]['stop_lat'], tcx.end_latitude)
+        self.assertEqual(tcx.sport, 'Running')
+        self.assertEqual(tcx.creator, 'Forerunner 935')
+        self.assertEqual(tcx.creator_version, 9)
+        self.assertEqual(tcx.laps, laps)
+        self.assertEqual(tcx.calories, laps * 100)
+        self.assertEqual(tcx.started_at, datetime.datetime(2019, 1, 1, 12, 0, 0))
+        self.assertEqual(tcx.completed_at, datetime.datetime(2019, 1, 1, 12, 0, 0) + datetime.timedelta(seconds=laps * lap_secs - 1))
+        self.assertEqual(tcx.hr_max, 159)
+        self.assertEqual(tcx.start_latitude, 40.0)
+
+    def test_tcx_file(self):
+        filename = self.temp_dir + '/1000.tcx'
+        with open(filename, 'w') as file:
+            self.write_tcx(file, 3, 600)
+        self.check_tcx(filename, 3, 600)
+
+    def test_compressed_tcx_file(self):
+        filename = self.temp_dir + '/1001.tcx.gz'
+        with gzip.open(filename, 'w') as file:
+            self.write_tcx(file, 2, 300)
+        self.check_tcx(filename, 2, 300)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)